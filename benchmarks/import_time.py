@@ -0,0 +1,98 @@
+"""
+Import time of the entry points of the connector, from ``python -X importtime``.
+
+Each module is imported in a new interpreter ``--repeat`` times and the fastest run is kept. ``pytun`` is what every
+spawned connector imports again, ``tunnel_infra.TunnelProcess`` is the connector itself. The slowest imports under
+each module are listed to find what to defer. With ``--baseline`` the totals are compared with a file saved by
+``--save`` and the exit code is 1 when a module got slower than ``--tolerance`` percent, so regressions are caught.
+
+Usage::
+
+    python -m benchmarks.import_time --save import_time.json
+    python -m benchmarks.import_time --baseline import_time.json --tolerance 20
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+DEFAULT_MODULES = "pytun,tunnel_infra.TunnelProcess"
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 20
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module):
+    """
+    :return: Cumulative microseconds of ``module`` and of every module imported by it, by module name. The modules
+        imported when the interpreter starts are left out
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import %s" % module], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    # modules are listed once imported, so the ones imported by a top level import come right before it, indented
+    nested = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        if name.startswith("  "):
+            nested[name.strip()] = int(cumulative)
+        elif name.strip() == module:
+            return {**nested, module: int(cumulative)}
+        else:
+            nested = {}
+    raise ValueError("%s was not imported, it may have been imported when the interpreter started" % module)
+
+
+def measure(module, repeat):
+    """
+    :return: Fastest of ``repeat`` runs, as returned by ``import_times``
+    """
+    runs = [import_times(module) for _ in range(repeat)]
+    return min(runs, key=lambda each: each[module])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time benchmark")
+    parser.add_argument("--modules", default=DEFAULT_MODULES, help="comma separated modules to import")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="imports of each module, the fastest is kept")
+    parser.add_argument("--top", type=int, default=8, help="slowest imports listed under each module")
+    parser.add_argument("--save", help="file where the totals are saved as the baseline")
+    parser.add_argument("--baseline", help="file with the totals to compare with")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="percent slower than the baseline that is still accepted")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    totals = {}
+    regressions = []
+    for module in [each.strip() for each in args.modules.split(",")]:
+        times = measure(module, args.repeat)
+        totals[module] = times[module]
+        print("%-56s %10.1f ms" % (module, times[module] / 1000))
+        slowest = sorted((each for each in times.items() if each[0] != module), key=lambda each: -each[1])
+        for name, cumulative in slowest[:args.top]:
+            print("    %-52s %10.1f ms" % (name, cumulative / 1000))
+        if module in baseline:
+            limit = baseline[module] * (1 + args.tolerance / 100)
+            print("    %-52s %10.1f ms" % ("baseline", baseline[module] / 1000))
+            if times[module] > limit:
+                regressions.append(module)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(totals, f, indent=2)
+    if regressions:
+        print("Slower than the baseline: %s" % ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Loopback throughput of the channel relay.
+
+A client streams data through a relay to a sink on loopback and the MB/s are reported for the legacy 1 KB copy loop
+and for the ``ChannelRelay`` with different buffer settings. The SSH channel is replaced by a plain socket, so this
+measures the cost of the relay loop itself and not the encryption done by paramiko.
+
+Usage::
+
+    python -m benchmarks.relay_throughput --size 256
+"""
+import argparse
+import logging
+import select
+import socket
+import threading
+import time
+
+from tunnel_infra.relay import ChannelRelay, ThreadRelayEngine, SelectorRelayEngine, DEFAULT_RELAY_BUFFER_SIZE
+
+CHUNK = b"x" * 65536
+
+
+class SocketChannel:
+    """
+    Stands in for a paramiko ``Channel`` using a socket, with just what the relay uses
+    """
+    origin_addr = ("127.0.0.1", 0)
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+
+    @property
+    def closed(self):
+        return self.sock.fileno() == -1
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+
+    def recv(self, nbytes):
+        return self.sock.recv(nbytes)
+
+    def send(self, data):
+        return self.sock.send(data)
+
+    def shutdown_write(self):
+        self.sock.shutdown(socket.SHUT_WR)
+
+    def close(self):
+        self.sock.close()
+
+
+def legacy_relay(chan, sock):
+    # the relay loop used by Tunnel.handler before the relay engines
+    try:
+        while True:
+            r, w, x = select.select([sock, chan], [], [])
+            if sock in r:
+                data = sock.recv(1024)
+                if len(data) == 0:
+                    break
+                chan.send(data)
+            if chan in r:
+                data = chan.recv(1024)
+                if len(data) == 0:
+                    break
+                sock.send(data)
+    finally:
+        chan.close()
+        sock.close()
+
+
+def run(relay_fn, total_bytes):
+    """
+    Send ``total_bytes`` from the recipient side of the relay to the channel side and return the MB/s
+    """
+    producer, recipient_sock = socket.socketpair()
+    chan_sock, consumer = socket.socketpair()
+    chan = SocketChannel(chan_sock)
+
+    relay_thread = threading.Thread(target=relay_fn, args=(chan, recipient_sock), daemon=True)
+    relay_thread.start()
+
+    def produce():
+        sent = 0
+        while sent < total_bytes:
+            producer.sendall(CHUNK)
+            sent += len(CHUNK)
+        producer.shutdown(socket.SHUT_WR)
+
+    start = time.perf_counter()
+    producer_thread = threading.Thread(target=produce, daemon=True)
+    producer_thread.start()
+    received = 0
+    while True:
+        data = consumer.recv(262144)
+        if not data:
+            break
+        received += len(data)
+    elapsed = time.perf_counter() - start
+    consumer.shutdown(socket.SHUT_WR)
+    producer_thread.join()
+    relay_thread.join()
+    producer.close()
+    consumer.close()
+    return received / elapsed / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relay throughput benchmark")
+    parser.add_argument("--size", type=int, default=256, help="MB to relay on each run")
+    parser.add_argument("--buffer_size", type=int, default=DEFAULT_RELAY_BUFFER_SIZE)
+    args = parser.parse_args()
+    total_bytes = args.size * 1024 * 1024
+    logger = logging.getLogger("benchmark")
+    engine = ThreadRelayEngine(logger)
+    selector_engine = SelectorRelayEngine(logger)
+    selector_engine.start()
+
+    cases = [
+        ("legacy recv(1024)", legacy_relay),
+        ("relay fixed %d" % args.buffer_size,
+         lambda chan, sock: engine.relay(ChannelRelay(chan, sock, logger, buffer_size=args.buffer_size,
+                                                      adaptive_buffer=False))),
+        ("relay adaptive up to %d" % args.buffer_size,
+         lambda chan, sock: engine.relay(ChannelRelay(chan, sock, logger, buffer_size=args.buffer_size,
+                                                      adaptive_buffer=True))),
+        ("selector adaptive up to %d" % args.buffer_size,
+         lambda chan, sock: selector_engine.relay(ChannelRelay(chan, sock, logger, buffer_size=args.buffer_size,
+                                                               adaptive_buffer=True))),
+    ]
+    for name, relay_fn in cases:
+        print("%-30s %8.1f MB/s" % (name, run(relay_fn, total_bytes)))
+    selector_engine.stop()
+
+
+if __name__ == '__main__':
+    main()
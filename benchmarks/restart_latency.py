@@ -0,0 +1,120 @@
+"""
+Time from the restart of a connector to the moment its port is forwarded, for each way of starting its process.
+
+Every restart starts a connector against a local paramiko SSH server, waits until it reports that its port is
+forwarded and stops it. ``fork`` and ``forkserver`` only exist outside Windows, ``spawn`` imports the connector code
+again in each process and ``spawn+warm`` runs the connector in a process of a ``WarmPool``, as the supervisor does.
+
+Usage::
+
+    python -m benchmarks.restart_latency --restarts 10
+    python -m benchmarks.restart_latency --methods spawn,spawn+warm
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.ssh_algorithms import Sink
+from benchmarks.ssh_server import LocalSSHServer, free_port
+from tunnel_infra.TunnelProcess import TunnelProcess
+from tunnel_infra.launcher import create_process, set_start_method, WarmPool
+from tunnel_infra.readiness import ReadySignal
+
+WARM = "+warm"
+DEFAULT_METHODS = "fork,forkserver,spawn,spawn+warm"
+READY_TIMEOUT = 30
+
+
+def write_config(server, sink, directory):
+    path = os.path.join(directory, "connector.ini")
+    with open(path, "w") as f:
+        f.write("[connector]\n"
+                "connector_name=benchmark\n"
+                "server_host=%s\n"
+                "server_port=%d\n"
+                "port=%d\n"
+                "username=benchmark\n"
+                "keyfile=%s\n"
+                "server_key=%s\n"
+                "remote_host=127.0.0.1\n"
+                "remote_port=%d\n"
+                "log_level=WARNING\n"
+                "drain_timeout=0\n" % (server.host, server.port, free_port(), server.client_key_file,
+                                       server.known_hosts_file, sink.port))
+    return path
+
+
+def restart(server, sink, directory, warm_pool=None):
+    """
+    :return: Seconds from the start of the connector until its port is forwarded
+    """
+    files = [write_config(server, sink, directory)]
+    ready_reader, ready_writer = multiprocessing.Pipe(duplex=False)
+    start = time.perf_counter()
+    connector = create_process(files, 0, [])
+    connector.on_ready = ReadySignal(ready_writer)
+    if warm_pool:
+        process = warm_pool.start(connector, files, 0, [])
+    else:
+        connector.start()
+        process = connector
+    ready_writer.close()
+    try:
+        if not ready_reader.poll(READY_TIMEOUT) or not ready_reader.recv():
+            raise TimeoutError("The connector didn't forward its port")
+        return time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.join()
+
+
+def run(server, sink, directory, method, restarts, warm_wait):
+    logger = logging.getLogger("benchmark")
+    set_start_method(method.replace(WARM, ""), logger)
+    warm_pool = WarmPool(1, logger) if method.endswith(WARM) else None
+    latencies = []
+    try:
+        for _ in range(restarts):
+            if warm_pool:
+                warm_pool.fill()
+                # the warm process imports the connector code meanwhile, as it would between restarts
+                time.sleep(warm_wait)
+            latencies.append(restart(server, sink, directory, warm_pool))
+    finally:
+        if warm_pool:
+            warm_pool.stop()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Connector restart latency benchmark")
+    parser.add_argument("--restarts", type=int, default=5, help="restarts measured for each method")
+    parser.add_argument("--methods", default=DEFAULT_METHODS,
+                        help="comma separated start methods, add +warm to use a warm process")
+    parser.add_argument("--warm-wait", type=float, default=3, help="seconds that a warm process has to get ready")
+    args = parser.parse_args()
+
+    available = multiprocessing.get_all_start_methods()
+    with tempfile.TemporaryDirectory() as directory:
+        TunnelProcess.default_log_path = directory
+        server = LocalSSHServer(directory)
+        server.start()
+        sink = Sink()
+        print("%-16s %10s %10s %10s" % ("method", "min ms", "median ms", "max ms"))
+        for method in args.methods.split(","):
+            method = method.strip()
+            if method.replace(WARM, "") not in available:
+                print("%-16s %32s" % (method, "not available"))
+                continue
+            latencies = [each * 1000 for each in run(server, sink, directory, method, args.restarts, args.warm_wait)]
+            print("%-16s %10.0f %10.0f %10.0f" % (method, min(latencies), statistics.median(latencies),
+                                                  max(latencies)))
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Throughput and CPU of a connector for each combination of cipher, MAC and compression.
+
+Every combination starts a real connector process against a local paramiko SSH server, sends data through the
+forwarded port to a local recipient and reports the MB/s and the CPU seconds used by the connector process. Use it
+to pick the ``ciphers``, ``macs`` and ``compression`` options of a connector. The local server runs in this process,
+so its CPU is not included.
+
+Usage::
+
+    python -m benchmarks.ssh_algorithms --size 64 --data text
+    python -m benchmarks.ssh_algorithms --ciphers aes128-ctr,aes256-ctr --macs hmac-sha2-256 --compression no
+"""
+import argparse
+import itertools
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import psutil
+
+from benchmarks.ssh_server import LocalSSHServer, free_port
+from tunnel_infra.TunnelProcess import TunnelProcess
+from tunnel_infra.ssh_algorithms import parse_algorithms
+
+DEFAULT_CIPHERS = "aes128-ctr,aes256-ctr,aes128-cbc"
+DEFAULT_MACS = "hmac-sha2-256,hmac-sha2-256-etm@openssh.com,hmac-sha1"
+
+TEXT_LINE = b"2024-01-01 10:00:00 INFO uid=someone,ou=people,dc=example,dc=com search scope=sub filter=(cn=*)\n"
+
+
+class Sink:
+    """
+    Recipient of the connector, reads every connection until EOF and then closes it
+    """
+
+    def __init__(self):
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(16)
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, addr = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._drain, args=(conn,), daemon=True).start()
+
+    @staticmethod
+    def _drain(conn):
+        with conn:
+            while conn.recv(262144):
+                pass
+
+
+def wait_for_port(port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError("Port %d was not forwarded" % port)
+
+
+def run(server, sink, directory, payload, cipher, mac, compression):
+    port = free_port()
+    tunnel_process = TunnelProcess(
+        "benchmark",
+        server_host=server.host,
+        server_port=server.port,
+        server_port_to_forward=port,
+        server_key=server.known_hosts_file,
+        user_to_login="benchmark",
+        key_file=server.client_key_file,
+        recipient_host="127.0.0.1",
+        recipient_port=sink.port,
+        keep_alive_time=30,
+        log_level=logging.WARNING,
+        log_to_console=False,
+        log_path=directory,
+        ciphers=(cipher,),
+        macs=(mac,),
+        compression=compression,
+    )
+    tunnel_process.start()
+    try:
+        wait_for_port(port)
+        process = psutil.Process(tunnel_process.pid)
+        cpu_before = sum(process.cpu_times()[:2])
+        start = time.perf_counter()
+        with socket.create_connection(("127.0.0.1", port)) as sock:
+            sock.sendall(payload)
+            sock.shutdown(socket.SHUT_WR)
+            # the sink closes once it received everything
+            while sock.recv(65536):
+                pass
+        elapsed = time.perf_counter() - start
+        cpu = sum(process.cpu_times()[:2]) - cpu_before
+    finally:
+        tunnel_process.terminate()
+        tunnel_process.join()
+    return len(payload) / elapsed / 1024 / 1024, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSH algorithms benchmark")
+    parser.add_argument("--size", type=int, default=64, help="MB sent for each combination")
+    parser.add_argument("--data", choices=("text", "random"), default="text",
+                        help="text is compressible like most LDAP/HTTP traffic, random is not")
+    parser.add_argument("--ciphers", default=DEFAULT_CIPHERS)
+    parser.add_argument("--macs", default=DEFAULT_MACS)
+    parser.add_argument("--compression", choices=("both", "yes", "no"), default="both")
+    args = parser.parse_args()
+
+    size = args.size * 1024 * 1024
+    if args.data == "text":
+        payload = (TEXT_LINE * (size // len(TEXT_LINE) + 1))[:size]
+    else:
+        payload = os.urandom(size)
+    compressions = {"both": (False, True), "yes": (True,), "no": (False,)}[args.compression]
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = LocalSSHServer(directory)
+        server.start()
+        sink = Sink()
+        print("%-16s %-32s %-12s %10s %10s" % ("cipher", "mac", "compression", "MB/s", "CPU s"))
+        combinations = itertools.product(parse_algorithms('ciphers', args.ciphers), parse_algorithms('macs', args.macs),
+                                         compressions)
+        for cipher, mac, compression in combinations:
+            throughput, cpu = run(server, sink, directory, payload, cipher, mac, compression)
+            print("%-16s %-32s %-12s %10.1f %10.2f" % (cipher, mac, "yes" if compression else "no", throughput, cpu))
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Local paramiko SSH server with remote port forwarding support, used by the benchmarks to run connectors without a
+cloud endpoint. It accepts any public key and offers compression to the clients that ask for it.
+"""
+import contextlib
+import os
+import select
+import socket
+import threading
+
+import paramiko
+
+
+def _close_listener(listener: socket.socket):
+    # closing a socket doesn't wake up a thread blocked accepting on it
+    with contextlib.suppress(OSError):
+        listener.shutdown(socket.SHUT_RDWR)
+    listener.close()
+
+
+def _pipe(conn: socket.socket, chan: paramiko.Channel):
+    try:
+        while True:
+            r, w, x = select.select([conn, chan], [], [])
+            if conn in r:
+                data = conn.recv(65536)
+                if not data:
+                    chan.shutdown_write()
+                    source, send = chan, conn.sendall
+                    break
+                chan.sendall(data)
+            if chan in r:
+                data = chan.recv(65536)
+                if not data:
+                    conn.shutdown(socket.SHUT_WR)
+                    source, send = conn, chan.sendall
+                    break
+                conn.sendall(data)
+        # one side finished, keep relaying the other one until it finishes too
+        while True:
+            data = source.recv(65536)
+            if not data:
+                break
+            send(data)
+    except OSError:
+        pass
+    finally:
+        chan.close()
+        conn.close()
+
+
+class _ServerInterface(paramiko.ServerInterface):
+    def __init__(self, transport: paramiko.Transport):
+        self.transport = transport
+        self.listeners: dict[int, socket.socket] = {}
+
+    def get_allowed_auths(self, username):
+        return "publickey"
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_global_request(self, kind, msg):
+        return True
+
+    def check_port_forward_request(self, address, port):
+        listener = socket.socket()
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            listener.bind(("127.0.0.1", port))
+        except OSError:
+            listener.close()
+            return False
+        listener.listen(128)
+        port = listener.getsockname()[1]
+        self.listeners[port] = listener
+        threading.Thread(target=self._accept, args=(listener, port), daemon=True).start()
+        return port
+
+    def cancel_port_forward_request(self, address, port):
+        listener = self.listeners.pop(port, None)
+        if listener:
+            _close_listener(listener)
+
+    def close(self):
+        for listener in self.listeners.values():
+            _close_listener(listener)
+        self.listeners = {}
+
+    def _accept(self, listener: socket.socket, port: int):
+        while True:
+            try:
+                conn, addr = listener.accept()
+            except OSError:
+                return
+            try:
+                chan = self.transport.open_forwarded_tcpip_channel(addr, ("127.0.0.1", port))
+            except Exception:
+                conn.close()
+                continue
+            threading.Thread(target=_pipe, args=(conn, chan), daemon=True).start()
+
+
+class LocalSSHServer:
+    def __init__(self, directory: str, host: str = "127.0.0.1"):
+        """
+        SSH server listening on a random port of ``host``.
+
+        :param directory: Directory where the client key and the known hosts file for the server are written
+        """
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.client_key_file = os.path.join(directory, "client_key")
+        paramiko.RSAKey.generate(2048).write_private_key_file(self.client_key_file)
+        self.listener = socket.socket()
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, 0))
+        self.listener.listen(100)
+        self.host, self.port = self.listener.getsockname()
+        self.known_hosts_file = os.path.join(directory, "known_hosts")
+        with open(self.known_hosts_file, "w") as f:
+            f.write("[%s]:%d %s %s\n" % (self.host, self.port, self.host_key.get_name(), self.host_key.get_base64()))
+        self.transports: list[tuple[paramiko.Transport, _ServerInterface]] = []
+
+    def start(self):
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, addr = self.listener.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(self.host_key)
+            transport.use_compression(True)
+            server = _ServerInterface(transport)
+            self.transports.append((transport, server))
+            transport.start_server(server=server)
+
+    def close_transports(self):
+        """
+        Drop every connected client, as a restart of the server would
+        """
+        for transport, server in self.transports:
+            server.close()
+            transport.close()
+        self.transports = []
+
+    def stop(self):
+        _close_listener(self.listener)
+        self.close_transports()
+
+
+def free_port(host: str = "127.0.0.1") -> int:
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
@@ -12,12 +12,14 @@ class LogManager:
     path = "./logs"
 
     @staticmethod
-    def configure_logger(filename, level=None, log_to_console=False, name="pytun", path=None):
+    def configure_logger(filename, level=None, log_to_console=False, name="pytun", path=None, paramiko_logs=None):
         path = path if path is not None else LogManager.path
         level = level or logging.INFO
         logger = logging.getLogger(name)
         loggers = [logger]
-        if name != "pytun":
+        if paramiko_logs is None:
+            paramiko_logs = name != "pytun"
+        if paramiko_logs:
             paramiko_log = logging.getLogger("paramiko")
             loggers.append(paramiko_log)
         try:
@@ -1 +1,3 @@
 from .ratelimit import ratelimit_by_args
+from .token_bucket import TokenBucket
+from .resolver import ResolverCache, create_connection
@@ -0,0 +1,167 @@
+import errno
+import os
+import selectors
+import socket
+import threading
+import time
+
+DEFAULT_DNS_TTL = 60
+DEFAULT_DNS_NEGATIVE_TTL = 5
+# RFC 8305 recommends 250ms between connection attempts to different addresses
+CONNECTION_ATTEMPT_DELAY = 0.25
+
+_CONNECT_IN_PROGRESS = (errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, "WSAEWOULDBLOCK", errno.EWOULDBLOCK))
+
+
+class _Entry:
+    def __init__(self):
+        self.addresses: list | None = None
+        self.error: OSError | None = None
+        self.expires_at = 0.0
+        self.resolved = threading.Event()
+        self.refreshing = False
+
+
+class ResolverCache:
+    def __init__(self, ttl: float = DEFAULT_DNS_TTL, negative_ttl: float = DEFAULT_DNS_NEGATIVE_TTL):
+        """
+        Cache of ``getaddrinfo`` results shared by every connection of the process.
+
+        Expired entries are still used while they are refreshed in the background, and kept if the refresh fails, so
+        a slow or broken DNS server only delays the first lookup of each host. Failed lookups are cached for
+        ``negative_ttl`` seconds.
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.entries: dict[tuple[str, int], _Entry] = {}
+        self.lock = threading.Lock()
+
+    def resolve(self, host: str, port: int) -> list:
+        """
+        :return: ``getaddrinfo`` results for TCP connections to host:port
+        :raises socket.gaierror: if the host can't be resolved
+        """
+        key = (host, port)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = _Entry()
+                lookup = True
+            else:
+                lookup = False
+                if entry.resolved.is_set() and entry.expires_at <= time.monotonic() and not entry.refreshing:
+                    entry.refreshing = True
+                    threading.Thread(target=self._lookup, args=(key, entry), daemon=True).start()
+        if lookup:
+            self._lookup(key, entry)
+        entry.resolved.wait()
+        if entry.addresses is None:
+            raise entry.error
+        return entry.addresses
+
+    def _lookup(self, key: tuple[str, int], entry: _Entry):
+        try:
+            addresses = socket.getaddrinfo(key[0], key[1], type=socket.SOCK_STREAM)
+        except OSError as e:
+            with self.lock:
+                # keep the last addresses that worked
+                if entry.addresses is None:
+                    entry.error = e
+                entry.expires_at = time.monotonic() + self.negative_ttl
+                entry.refreshing = False
+        else:
+            with self.lock:
+                entry.addresses = addresses
+                entry.error = None
+                entry.expires_at = time.monotonic() + self.ttl
+                entry.refreshing = False
+        entry.resolved.set()
+
+
+default_resolver = ResolverCache()
+
+
+def _interleave(addresses: list) -> list:
+    """
+    Alternate the address families, starting with the family preferred by ``getaddrinfo`` (RFC 8305 section 4)
+    """
+    families: dict[int, list] = {}
+    for each in addresses:
+        families.setdefault(each[0], []).append(each)
+    result = []
+    queues = list(families.values())
+    while queues:
+        for each in queues:
+            result.append(each.pop(0))
+        queues = [each for each in queues if each]
+    return result
+
+
+def create_connection(address: tuple[str, int], timeout: float, resolver: ResolverCache = None) -> socket.socket:
+    """
+    Connect to a TCP service like ``socket.create_connection``, but resolving the host through ``resolver`` and
+    racing the addresses of the host as in RFC 8305 (happy eyeballs): a new address is tried every
+    ``CONNECTION_ATTEMPT_DELAY`` seconds, or as soon as the previous attempt fails, and the first connection wins.
+
+    :param resolver: Cache used to resolve the host, ``default_resolver`` if None
+    :return: A connected socket with ``timeout`` set
+    :raises TimeoutError: if no address could be connected in ``timeout`` seconds
+    :raises OSError: with the last error if every address failed
+    """
+    host, port = address
+    deadline = time.monotonic() + timeout
+    addresses = _interleave((resolver or default_resolver).resolve(host, port))
+    selector = selectors.DefaultSelector()
+    attempts: list[socket.socket] = []
+    error: OSError | None = None
+    winner: socket.socket | None = None
+    next_address = 0
+    next_attempt_at = 0.0
+    try:
+        while True:
+            now = time.monotonic()
+            if next_address < len(addresses) and (now >= next_attempt_at or not selector.get_map()):
+                family, type_, proto, canonname, sockaddr = addresses[next_address]
+                next_address += 1
+                next_attempt_at = now + CONNECTION_ATTEMPT_DELAY
+                sock = socket.socket(family, type_, proto)
+                attempts.append(sock)
+                sock.setblocking(False)
+                result = sock.connect_ex(sockaddr)
+                if result == 0:
+                    winner = sock
+                    break
+                if result in _CONNECT_IN_PROGRESS:
+                    selector.register(sock, selectors.EVENT_WRITE, sockaddr)
+                else:
+                    error = OSError(result, "Connection to %r failed: %s" % (sockaddr, os.strerror(result)))
+                    sock.close()
+                    # try the next address right away
+                    next_attempt_at = now
+                continue
+            if not selector.get_map():
+                raise error or OSError("No addresses found for %s" % host)
+            if now >= deadline:
+                raise TimeoutError("Connection to %s:%d timed out" % (host, port))
+            wait = deadline - now
+            if next_address < len(addresses):
+                wait = min(wait, next_attempt_at - now)
+            for key, events in selector.select(max(0.0, wait)):
+                sock = key.fileobj
+                selector.unregister(sock)
+                result = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if result == 0:
+                    winner = sock
+                    break
+                error = OSError(result, "Connection to %r failed: %s" % (key.data, os.strerror(result)))
+                sock.close()
+                next_attempt_at = now
+            if winner:
+                break
+    finally:
+        selector.close()
+        for each in attempts:
+            if each is not winner:
+                each.close()
+    winner.settimeout(timeout)
+    return winner
@@ -0,0 +1,53 @@
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float | None = None):
+        """
+        Token bucket refilled with ``rate`` tokens per second up to ``capacity`` tokens. It starts full.
+
+        :param capacity: Largest burst allowed, ``rate`` tokens (at least 1) if None
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def consume(self, tokens: float = 1) -> bool:
+        """
+        Take ``tokens`` from the bucket if there are enough of them
+        """
+        with self.lock:
+            self._refill()
+            if self.tokens < tokens:
+                return False
+            self.tokens -= tokens
+            return True
+
+    def delay(self, tokens: float = 1) -> float:
+        """
+        Seconds until the bucket has ``tokens``
+        """
+        with self.lock:
+            self._refill()
+            return max(0.0, (tokens - self.tokens) / self.rate)
+
+    def take(self, tokens: float):
+        """
+        Take ``tokens`` even if there aren't enough of them, the missing ones are paid back by the next refills
+        """
+        with self.lock:
+            self._refill()
+            self.tokens -= tokens
+
+    def available(self) -> float:
+        with self.lock:
+            self._refill()
+            return self.tokens
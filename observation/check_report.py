@@ -0,0 +1,94 @@
+import contextlib
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from logging import Logger
+from typing import Callable, Iterable
+
+DEFAULT_CHECK_PARALLELISM = 16
+
+
+def run_parallel(function: Callable, items: Iterable, parallelism: int = DEFAULT_CHECK_PARALLELISM):
+    """
+    Call ``function`` with each item from up to ``parallelism`` threads
+
+    :return: Generator of ``(item, result, error)`` in the order the calls finish, ``error`` is the exception raised by
+        the call or None
+    """
+    pool = ThreadPoolExecutor(max(1, parallelism))
+    try:
+        futures = {pool.submit(function, each): each for each in items}
+        for future in as_completed(futures):
+            error = future.exception()
+            yield futures[future], None if error else future.result(), error
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+class CheckTimer:
+    def __init__(self):
+        """
+        Seconds taken by each step of a check
+        """
+        self.timings: dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def step(self, name: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.monotonic() - start, 3)
+
+
+class CheckReport:
+    def __init__(self, logger: Logger):
+        """
+        Results of the checks of ``--test_connections``, ``--test_connectors`` and ``--test_all``, logged as they finish
+        and summarized as JSON at the end
+        """
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.results = []
+        self.started_at = time.monotonic()
+
+    def record(self, check: str, name: str, ok: bool, timer: CheckTimer, error: str = None):
+        """
+        :param check: What was checked, ``connection`` or ``connector``
+        :param name: What it was checked on, a configuration file or a service
+        """
+        elapsed = sum(timer.timings.values())
+        with self.lock:
+            self.results.append({'check': check, 'name': name, 'ok': ok, 'seconds': round(elapsed, 3),
+                                 'steps': dict(timer.timings), 'error': error})
+        if ok:
+            self.logger.info("Check of %s %s passed in %.2f seconds", check, name, elapsed)
+        else:
+            self.logger.error("Check of %s %s failed in %.2f seconds: %s", check, name, elapsed, error)
+
+    def failed(self, check: str = None) -> bool:
+        with self.lock:
+            return any(not each['ok'] for each in self.results if check is None or each['check'] == check)
+
+    def summary(self) -> dict:
+        with self.lock:
+            results = sorted(self.results, key=lambda each: (each['check'], each['name']))
+        return {
+            'passed': sum(1 for each in results if each['ok']),
+            'failed': sum(1 for each in results if not each['ok']),
+            'seconds': round(time.monotonic() - self.started_at, 3),
+            'results': results,
+        }
+
+    def write(self, path: str = None):
+        """
+        Write the summary to ``path``, to the standard output if None
+        """
+        summary = json.dumps(self.summary(), indent=2)
+        if path is None:
+            print(summary, file=sys.stdout, flush=True)
+            return
+        with open(path, 'w') as f:
+            f.write(summary)
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from logging import Logger
+
+from observation.stats import StatsReporter
+
+HEARTBEAT_INTERVAL = 5
+DEFAULT_WATCHDOG_TIMEOUT = 120
+# seconds that a stalled process has to exit once it's asked to before it's killed
+WATCHDOG_KILL_TIMEOUT = 5
+
+
+class ConnectorProgress:
+    def __init__(self):
+        """
+        Progress of the loops of a connector in its process, sent to the supervisor as heartbeats. The accept loop
+        of the tunnels and the reconnect loop mark it, and the keep alive checks of its transports are watched.
+        """
+        self.lock = threading.Lock()
+        self.loop_mark = time.monotonic()
+        self.keep_alives = set()
+
+    def mark(self, expected_wait: float = 0):
+        """
+        The accept or reconnect loop made progress
+
+        :param expected_wait: Seconds that the loop is going to wait on purpose before making progress again
+        """
+        self.loop_mark = time.monotonic() + expected_wait
+
+    def watch_keep_alive(self, keep_alive):
+        """
+        :param keep_alive: Handle returned by ``KeepAliveScheduler.register``
+        """
+        with self.lock:
+            self.keep_alives.add(keep_alive)
+
+    def forget_keep_alive(self, keep_alive):
+        with self.lock:
+            self.keep_alives.discard(keep_alive)
+
+    def heartbeat(self) -> dict:
+        now = time.monotonic()
+        with self.lock:
+            keep_alives = list(self.keep_alives)
+        accept_loop_age = max(0.0, now - self.loop_mark)
+        keep_alive_age = max((now - each.last_success for each in keep_alives), default=None)
+        keep_alive_overdue = max((each.overdue(now) for each in keep_alives), default=0.0)
+        return {
+            'pid': os.getpid(),
+            'accept_loop_age': accept_loop_age,
+            'keep_alive_age': keep_alive_age,
+            # seconds without progress of the slowest loop, see ``Watchdog``
+            'stall': max(accept_loop_age, keep_alive_overdue),
+        }
+
+
+_reporter: StatsReporter | None = None
+_reporter_pid: int | None = None
+_reporter_lock = threading.Lock()
+
+
+def heartbeat_reporter(heartbeat_queue) -> StatsReporter:
+    """
+    Reporter of the heartbeats of every connector of the current process
+    """
+    global _reporter, _reporter_pid
+    with _reporter_lock:
+        if _reporter is None or _reporter_pid != os.getpid():
+            _reporter = StatsReporter(heartbeat_queue, interval=HEARTBEAT_INTERVAL)
+            _reporter_pid = os.getpid()
+        return _reporter
+
+
+class _Beat:
+    def __init__(self, heartbeat: dict):
+        self.pid = heartbeat['pid']
+        self.stall = heartbeat['stall']
+        self.received_at = time.monotonic()
+
+
+class Watchdog:
+    def __init__(self, timeout: float = DEFAULT_WATCHDOG_TIMEOUT):
+        """
+        Heartbeats of the connector processes, read by the supervisor to restart the processes that are alive but
+        stuck: a wedged transport, an accept loop that doesn't come back or a process that stopped sending heartbeats.
+
+        :param timeout: Seconds without progress after which a connector is stalled
+        """
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.beats: dict[str, _Beat] = {}
+        # when each process was first checked, a process is stalled if it never sends a heartbeat
+        self.first_checked: dict[int, float] = {}
+
+    def beat(self, name: str, heartbeat: dict):
+        with self.lock:
+            self.beats[name] = _Beat(heartbeat)
+
+    def stall(self, pid: int, names: list[str]) -> float:
+        """
+        Seconds without progress of the process ``pid``, which runs the connectors ``names``
+        """
+        now = time.monotonic()
+        with self.lock:
+            first_checked = self.first_checked.setdefault(pid, now)
+            stalls = []
+            for name in names:
+                beat = self.beats.get(name)
+                if beat is None or beat.pid != pid:
+                    stalls.append(now - first_checked)
+                else:
+                    stalls.append(now - beat.received_at + beat.stall)
+            return max(stalls, default=0.0)
+
+    def forget(self, pids: set[int]):
+        """
+        Keep only the processes ``pids``
+        """
+        with self.lock:
+            self.first_checked = {pid: each for pid, each in self.first_checked.items() if pid in pids}
+
+
+def collect_heartbeats(heartbeat_queue, watchdog: Watchdog, status, logger: Logger):
+    """
+    Give the heartbeats sent by the connector processes to ``watchdog`` and show them in ``status``, runs in a thread of
+    the supervisor
+    """
+    while True:
+        try:
+            name, heartbeat = heartbeat_queue.get()
+            watchdog.beat(name, heartbeat)
+            status.update_stats(name, {'heartbeat': heartbeat})
+        except Exception as e:
+            logger.exception("Failed to collect the heartbeats of the connectors: %r", e)
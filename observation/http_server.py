@@ -7,6 +7,7 @@ from http import HTTPStatus
 from os.path import realpath
 
 from observation.connection_check import ConnectionCheck
+from tunnel_infra.balancer import parse_recipients
 
 try:
     from http.server import ThreadingHTTPServer as HttpServer
@@ -118,16 +119,24 @@ class RequestHandlerClassFactory:
                                 config = configparser.ConfigParser()
                                 config.read(os.path.join(path, file))
                                 defaults = config['tunnel']
-                                remote_host = defaults['remote_host']
-                                remote_port = int(defaults.get('remote_port'))
+                                if 'recipients' in defaults:
+                                    recipients = parse_recipients(defaults['recipients'],
+                                                                  int(defaults.get('remote_port', 22)))
+                                else:
+                                    recipients = [(defaults['remote_host'], int(defaults.get('remote_port')))]
+                                remote_host, remote_port = recipients[0]
                                 tunnel_name = defaults.get('tunnel_name', realpath(file))
                                 res[tunnel_name] = {'remote_host':remote_host, 'remote_port':remote_port}
-                                jobs[tunnel_name] = pool.submit(connection_checker.test_connection, tunnel_name, remote_host, remote_port)
+                                if len(recipients) > 1:
+                                    res[tunnel_name]['recipients'] = ["%s:%d" % each for each in recipients]
+                                jobs[tunnel_name] = [pool.submit(connection_checker.test_connection, tunnel_name, host, port)
+                                                     for host, port in recipients]
                             except Exception as e:
                                 logger.exception("Error getting status for %s" % (file,))
                                 continue
-                    for name, job_future in jobs.items():
-                        res[name]['status'] = job_future.result()
+                    for name, job_futures in jobs.items():
+                        # a connector works while any of its recipients does
+                        res[name]['status'] = any([each.result() for each in job_futures])
                 pool.shutdown()
                 return res
 
@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+from logging import Logger
+from typing import Callable
+
+STATS_INTERVAL = 5
+
+
+class StatsReporter:
+    def __init__(self, stats_queue, interval: float = STATS_INTERVAL):
+        """
+        Send the stats of the connectors of a process to the supervisor every ``interval`` seconds
+
+        :param stats_queue: ``multiprocessing.Queue`` read by the supervisor, see ``collect_stats``
+        """
+        self.stats_queue = stats_queue
+        self.interval = interval
+        self.sources: dict[str, Callable[[], dict]] = {}
+        self.lock = threading.Lock()
+        self.thread: threading.Thread | None = None
+
+    def register(self, name: str, source: Callable[[], dict]):
+        """
+        :param name: Name of the connector in the ``Status`` of the supervisor
+        :param source: Returns the stats of the connector
+        """
+        with self.lock:
+            self.sources[name] = source
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="stats", daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                sources = list(self.sources.items())
+            for name, source in sources:
+                try:
+                    self.stats_queue.put((name, source()))
+                except Exception:
+                    # the supervisor is gone or the stats couldn't be read, try again on the next round
+                    pass
+
+
+_reporter: StatsReporter | None = None
+_reporter_pid: int | None = None
+_reporter_lock = threading.Lock()
+
+
+def stats_reporter(stats_queue) -> StatsReporter:
+    """
+    Reporter shared by every connector of the current process
+    """
+    global _reporter, _reporter_pid
+    with _reporter_lock:
+        if _reporter is None or _reporter_pid != os.getpid():
+            _reporter = StatsReporter(stats_queue)
+            _reporter_pid = os.getpid()
+        return _reporter
+
+
+def collect_stats(stats_queue, status, logger: Logger):
+    """
+    Store the stats sent by the connector processes in ``status``, runs in a thread of the supervisor
+    """
+    while True:
+        try:
+            name, stats = stats_queue.get()
+            status.update_stats(name, stats)
+        except Exception as e:
+            logger.exception("Failed to collect the stats of the connectors: %r", e)
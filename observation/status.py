@@ -9,6 +9,8 @@ class Status:
         self.status_data = {}
         self.created_at = datetime.datetime.now()
         self.mac_address = mac_address
+        self.restart_latency = {'count': 0, 'last': None, 'max': None, 'total': 0.0}
+        self.watchdog_restarts = 0
 
     def start_tunnel(self, tunnel_name):
         with self.rlock:
@@ -18,10 +20,47 @@ class Status:
                 self.status_data[tunnel_name] = {'started_times': 1}
             self.status_data[tunnel_name]['last_start'] = datetime.datetime.now().timestamp()
 
+    def update_stats(self, tunnel_name, stats):
+        """
+        Latest stats reported by the process of the connector, see ``StatsReporter``
+        """
+        with self.rlock:
+            self.status_data.setdefault(tunnel_name, {'started_times': 0}).update(stats)
+
+    def record_restart(self, tunnel_name, latency):
+        """
+        Seconds since the supervisor noticed that the connector process was down until it was started again
+        """
+        with self.rlock:
+            if tunnel_name in self.status_data:
+                self.status_data[tunnel_name]['last_restart_latency'] = latency
+            self.restart_latency['count'] += 1
+            self.restart_latency['last'] = latency
+            self.restart_latency['max'] = max(latency, self.restart_latency['max'] or 0.0)
+            self.restart_latency['total'] += latency
+
+    def record_watchdog_restart(self, tunnel_name):
+        """
+        The process of the connector was alive but stalled, so the supervisor restarted it
+        """
+        with self.rlock:
+            if tunnel_name in self.status_data:
+                self.status_data[tunnel_name]['watchdog_restarts'] = \
+                    self.status_data[tunnel_name].get('watchdog_restarts', 0) + 1
+            self.watchdog_restarts += 1
+
     def to_dict(self):
         with self.rlock:
             return {
                 'created_at': self.created_at.timestamp(),
                 'mac_address': self.mac_address,
-                'status_data': self.status_data
+                'status_data': self.status_data,
+                'restart_latency': {
+                    'count': self.restart_latency['count'],
+                    'last': self.restart_latency['last'],
+                    'max': self.restart_latency['max'],
+                    'mean': (self.restart_latency['total'] / self.restart_latency['count']
+                             if self.restart_latency['count'] else None)
+                },
+                'watchdog_restarts': self.watchdog_restarts,
             }
@@ -4,6 +4,7 @@ if is_app_running_as_pyinstaller_bundle():
     warnings.filterwarnings("ignore")
 import argparse
 import configparser
+import multiprocessing.connection
 import os
 import signal
 import socket
@@ -15,29 +16,44 @@ from multiprocessing import freeze_support
 from os import listdir
 from os.path import isabs
 from os.path import isfile, join
-import coloredlogs
 from paramiko import BadHostKeyException, PasswordRequiredException, AuthenticationException, SSHException
-import psutil
 
-from alerts.email_alert import EmailAlertSender
-from alerts.http_post_alert import HTTPPostAlertSender
 from alerts.pooled_alerter import DifferentThreadAlert
 from configure_logger import LogManager
 from device import Device
-from observation.http_server import inspection_http_server
+from lib import create_connection
+from observation.heartbeat import Watchdog, collect_heartbeats, DEFAULT_WATCHDOG_TIMEOUT, HEARTBEAT_INTERVAL, \
+    WATCHDOG_KILL_TIMEOUT
+from observation.check_report import CheckReport, CheckTimer, run_parallel, DEFAULT_CHECK_PARALLELISM
+from observation.stats import collect_stats
 from observation.status import Status
+from tunnel_infra.TunnelGroupProcess import TunnelGroupProcess
 from tunnel_infra.TunnelProcess import TunnelProcess
+from tunnel_infra.TunnelWorkerProcess import TunnelWorkerProcess
+from tunnel_infra.launcher import create_process, set_start_method, WarmPool, DEFAULT_WARM_PROCESSES, \
+    START_METHOD_SPAWN
+from tunnel_infra.handshake import HandshakeScheduler, DEFAULT_HANDSHAKE_CONCURRENCY, DEFAULT_HANDSHAKE_STAGGER
 from tunnel_infra.pathtype import PathType
+from tunnel_infra.readiness import ReadySignal
 from utils import get_application_path, clean_runtime_tempdir
 from version import __version__
 
 freeze_support()
 
 INI_FILENAME = 'connector.ini'
+# the supervisor wakes up as soon as a connector exits, this is only for the periodic tasks
+SUPERVISOR_MAINTENANCE_INTERVAL = 30
+CONTROL_STOP = "stop"
+CONTROL_ROTATE = "rotate"
+# seconds that a rotated connector keeps running while its replacement connects, see ``rotate_tunnels``
+ROTATION_READY_TIMEOUT = 30
 _MAC_ADDRESS_CFG_KEY = "signature"
 
 
 def main():
+    # imported here, spawned connectors import this module but don't serve the inspection pages
+    from observation.http_server import inspection_http_server
+
     application_path = get_application_path()
     parser = argparse.ArgumentParser(description='Tunnel')
     parser.add_argument("--config_ini", dest="config_ini", help="Configuration file to use", default=INI_FILENAME,
@@ -56,6 +72,9 @@ def main():
                         help="Test to establish each one of the connectors", action='store_true',
                         default=False)
     parser.add_argument("--test_all", dest="test_all", help="Test connections", action="store_true", default=False)
+    parser.add_argument("--test_report", dest="test_report",
+                        help="File where the tests write their JSON summary, the standard output by default",
+                        default=None)
     parser.add_argument('-v', '--version', action='version', version='%(prog)s ' + __version__)
     args = parser.parse_args()
     config = configparser.ConfigParser()
@@ -92,7 +111,7 @@ def main():
     clean_runtime_tempdir(logger=logger)
 
     if (test_something or args.test_all) and not device.is_authorized():
-        coloredlogs.install(level='DEBUG', logger=logger)
+        install_colored_logs(logger)
         logger.critical("Can't start connector, this device is not authorized to run it.")
         logger.info("Press Enter to continue...")
         input()
@@ -120,15 +139,17 @@ def main():
             tunnel_path = tunnel_path.replace("\\\\?\\", "")
     files = [join(tunnel_path, f) for f in listdir(tunnel_path) if isfile(join(tunnel_path, f)) and f[-4:] == '.ini']
     processes = {}
+    # connectors or services checked at the same time by the tests
+    test_parallelism = int(params.get('test_parallelism', DEFAULT_CHECK_PARALLELISM))
 
     if args.test_connections:
-        test_connections_and_exit(files, logger, processes)
+        test_connections_and_exit(files, logger, processes, test_parallelism, args.test_report)
 
     if args.test_connectors:
-        test_tunnels_and_exit(files, logger, processes)
+        test_tunnels_and_exit(files, logger, processes, test_parallelism, args.test_report)
 
     if args.test_all:
-        coloredlogs.install(level='DEBUG', logger=logger)
+        install_colored_logs(logger)
         http_inspection_thread = None
 
         if params == {}:
@@ -148,7 +169,8 @@ def main():
                 logger.exception(
                     f"Couldn't start inspection HTTP server. Address {address[0]}:{address[1]} already in use. "
                     f"Exception: {e}")
-        test_everything(files, logger, processes, introspection_thread=http_inspection_thread)
+        test_everything(files, logger, processes, introspection_thread=http_inspection_thread,
+                        parallelism=test_parallelism, report_path=args.test_report)
         logger.info("Press Enter to continue...")
         input()
         sys.exit(0)
@@ -164,15 +186,47 @@ def main():
         main_sender.send_alert(tunnel_name=None, message=msg)
         sys.exit(1)
 
-    status = Status(mac_address=device.mac_address)
+    # how connector processes are started, the default of the platform when missing
+    if params.get('start_method'):
+        set_start_method(params['start_method'], logger)
 
-    start_tunnels(files, logger, processes, senders, status)
+    status = Status(mac_address=device.mac_address)
+    TunnelProcess.default_stats_queue = multiprocessing.Queue()
+    threading.Thread(target=collect_stats, args=(TunnelProcess.default_stats_queue, status, logger),
+                     daemon=True).start()
+    # restarts the connectors that are alive but stuck, 0 to only restart the ones that exit
+    watchdog_timeout = float(params.get('watchdog_timeout', DEFAULT_WATCHDOG_TIMEOUT))
+    watchdog = Watchdog(watchdog_timeout) if watchdog_timeout else None
+    if watchdog:
+        TunnelProcess.default_heartbeat_queue = multiprocessing.Queue()
+        threading.Thread(target=collect_heartbeats,
+                         args=(TunnelProcess.default_heartbeat_queue, watchdog, status, logger), daemon=True).start()
+
+    # SSH handshakes made at the same time by every connector, 0 for no limit
+    handshake_concurrency = int(params.get('handshake_concurrency', DEFAULT_HANDSHAKE_CONCURRENCY))
+    if handshake_concurrency:
+        TunnelProcess.default_handshake_scheduler = HandshakeScheduler(
+            handshake_concurrency, float(params.get('handshake_stagger', DEFAULT_HANDSHAKE_STAGGER)))
+    # processes with the connector code already imported, for the restarts and rotations of spawned connectors
+    warm_pool = get_warm_pool(params, logger)
+
+    # connectors to the same server with the same credentials can share one SSH transport
+    groups = {} if params.getboolean('share_transport', False) else None
+    # several connectors per process, one process per CPU with workers=auto
+    worker_count = get_worker_count(params)
+    workers = {} if worker_count else None
+
+    mtimes = {key: config_mtime(files[key]) for key in range(len(files))}
+    start_tunnels(files, logger, processes, senders, status, groups, workers, worker_count)
+    if warm_pool:
+        warm_pool.fill()
 
     if len(processes) == 0:
         logger.exception("No config files found")
         sys.exit(1)
 
-    register_signal_handlers(processes, pool)
+    control_reader, control_writer = multiprocessing.Pipe(duplex=False)
+    register_signal_handlers(control_writer)
 
     http_inspection = inspection_http_server(tunnel_path, tunnel_manager_id, LogManager.path, status, __version__,
                                              get_inspection_address(params), logger)
@@ -180,17 +234,82 @@ def main():
     http_inspection_thread.daemon = True
     http_inspection_thread.start()
 
+    # (ready pipe, old process, deadline) of each rotation in progress and old processes draining their connections
+    rotations = []
+    retiring = []
     while True:
+        timeout = rotation_timeout(rotations, HEARTBEAT_INTERVAL if watchdog else SUPERVISOR_MAINTENANCE_INTERVAL)
+        ready = wait_for_events(processes, control_reader, timeout, rotations, retiring)
+        detected_at = time.monotonic()
+        to_rotate = []
+        if control_reader in ready:
+            message = control_reader.recv()
+            if message == CONTROL_STOP:
+                stop_tunnels(processes, pool, [each[1] for each in rotations] + retiring, warm_pool)
+                sys.exit(0)
+            if message == CONTROL_ROTATE:
+                logger.info("Going to rotate every connector")
+                to_rotate = list(processes)
         items = list(processes.items())
         to_restart = []
         check_tunnels(files, items, logger, processes, to_restart, pool, main_sender)
-        restart_tunnels(files, logger, processes, to_restart, senders, status)
+        if watchdog:
+            check_heartbeats(files, logger, processes, to_restart, watchdog, status, main_sender, groups, workers)
+        # restarted connectors already read their config again
+        to_rotate += [each for each in changed_configs(files, processes, mtimes, groups, workers)
+                      if each not in to_restart and each not in to_rotate]
+        restart_tunnels(files, logger, processes, to_restart, senders, status, groups, detected_at, workers,
+                        warm_pool)
+        rotate_tunnels(files, logger, processes, to_rotate, senders, status, rotations, groups, workers, warm_pool)
+        finish_rotations(ready, rotations, retiring, logger)
+        if warm_pool:
+            warm_pool.refill()
         if not http_inspection_thread.is_alive():
             http_inspection_thread.join()
             http_inspection_thread = threading.Thread(target=lambda: http_inspection.serve_forever())
             http_inspection_thread.daemon = True
             http_inspection_thread.start()
-        time.sleep(30)
+
+
+def wait_for_events(processes, control_reader, timeout, rotations=(), retiring=()):
+    """
+    Block until a connector process exits, a message arrives through the control pipe, a rotated connector is ready
+    or ``timeout`` seconds pass
+
+    :param retiring: Processes replaced by a rotation, waited for so they are reaped as soon as they exit
+    :return: The sentinels and connections that are ready
+    """
+    readers = [reader for reader, old_process, deadline in rotations if reader is not None]
+    sentinels = [each.sentinel for each in list(processes.values()) + list(retiring)]
+    return multiprocessing.connection.wait(sentinels + [control_reader] + readers, timeout=timeout)
+
+
+def rotation_timeout(rotations, interval):
+    """
+    Seconds until the supervisor has to wake up, for its periodic tasks every ``interval`` seconds or to stop a
+    rotated connector
+    """
+    timeout = interval
+    for reader, old_process, deadline in rotations:
+        timeout = min(timeout, max(0.0, deadline - time.monotonic()))
+    return timeout
+
+
+def get_warm_pool(params, logger):
+    warm_processes = params.get('warm_processes', 'auto')
+    if warm_processes == 'auto':
+        # forked connectors already start with everything imported
+        size = DEFAULT_WARM_PROCESSES if multiprocessing.get_start_method() == START_METHOD_SPAWN else 0
+    else:
+        size = int(warm_processes)
+    return WarmPool(size, logger) if size else None
+
+
+def get_worker_count(params):
+    workers = params.get('workers', '0')
+    if workers == 'auto':
+        return os.cpu_count() or 1
+    return int(workers)
 
 
 def get_inspection_address(params):
@@ -198,7 +317,9 @@ def get_inspection_address(params):
     return "127.0.0.1" if only_local else "0.0.0.0", params.getint('inspection_port', 9999)
 
 
-def test_everything(files, logger, processes, introspection_thread=None):
+def test_everything(files, logger, processes, introspection_thread=None, parallelism=DEFAULT_CHECK_PARALLELISM,
+                    report_path=None):
+    report = CheckReport(logger)
     logger.info("We will check your installation and configuration")
     service_up = test_service_is_running(logger)
     if not service_up:
@@ -207,7 +328,7 @@ def test_everything(files, logger, processes, introspection_thread=None):
         logger.info("The service is not running! You won't be able to access your services from the cloud")
         if introspection_thread:
             introspection_thread.start()
-    failed_connection = test_connections(files, logger, processes)
+    failed_connection = test_connections(files, logger, processes, report, parallelism)
     if not failed_connection:
         logger.info("All the services are reachable!")
     else:
@@ -215,16 +336,25 @@ def test_everything(files, logger, processes, introspection_thread=None):
     if service_up:
         logger.info(
             "We will partially test the tunnels because the service is up. If you need further testing, please stop the service and repeat the test")
-    failed_tunnels = test_tunnels(files, logger, test_reverse_forward=not service_up)
+    failed_tunnels = test_tunnels(files, logger, test_reverse_forward=not service_up, report=report,
+                                  parallelism=parallelism)
     if not failed_tunnels:
         logger.info("All the connectors seem to work!")
     else:
         logger.info("Not all the connectors are working, check the output!")
+    report.write(report_path)
+
+
+def install_colored_logs(logger):
+    # only the tests log in color, the connectors don't import coloredlogs
+    import coloredlogs
+    coloredlogs.install(level='DEBUG', logger=logger)
 
 
 def test_service_is_running(logger, service_name='InvGateTunnel'):
     logger.info("Going to check the status of the service")
     if os.name == 'nt':
+        import psutil
         try:
             service = psutil.win_service_get(service_name)
             service = service.as_dict()
@@ -237,8 +367,10 @@ def test_service_is_running(logger, service_name='InvGateTunnel'):
     return False
 
 
-def test_tunnels_and_exit(files, logger, processes):
-    failed = test_tunnels(files, logger)
+def test_tunnels_and_exit(files, logger, processes, parallelism=DEFAULT_CHECK_PARALLELISM, report_path=None):
+    report = CheckReport(logger)
+    failed = test_tunnels(files, logger, report=report, parallelism=parallelism)
+    report.write(report_path)
     if failed:
         logger.error("Some connectors failed!")
         sys.exit(4)
@@ -247,71 +379,83 @@ def test_tunnels_and_exit(files, logger, processes):
         sys.exit(0)
 
 
-def test_tunnels(files, logger, test_reverse_forward=True):
-    failed = False
-    for each in range(len(files)):
+def test_tunnels(files, logger, test_reverse_forward=True, report=None, parallelism=DEFAULT_CHECK_PARALLELISM):
+    """
+    Connect each connector to its server and forward its port, up to ``parallelism`` connectors at the same time
+    """
+    report = report or CheckReport(logger)
+    for _ in run_parallel(lambda config_file: test_tunnel(config_file, logger, report, test_reverse_forward), files,
+                          parallelism):
+        pass
+    return report.failed('connector')
+
+
+def test_tunnel(config_file, logger, report, test_reverse_forward=True):
+    timer = CheckTimer()
+    try:
+        logger.info("Going to start connector from file %s", config_file)
         try:
-            config_file = files[each]
-            logger.info("Going to start connector from file %s", config_file)
-            try:
+            with timer.step('load'):
                 tunnel_process = TunnelProcess.from_config_file(config_file, [])
-            except Exception as e:
-                logger.exception(
-                    "Failed to create connector from file %s. Configuration file may be incorrect. Error detail %s",
-                    config_file, e)
-                failed = True
-                continue
-            tunnel_process.logger = logger
-            try:
+        except Exception as e:
+            logger.exception(
+                "Failed to create connector from file %s. Configuration file may be incorrect. Error detail %s",
+                config_file, e)
+            report.record('connector', config_file, False, timer, repr(e))
+            return
+        tunnel_process.logger = logger
+        try:
+            with timer.step('connect'):
                 client = tunnel_process.ssh_connect(exit_on_failure=False)
-                transport = client.get_transport()
-            except socket.timeout as e:
-                message = """Failed to connect with  %s:%s. We received a connection timeout. Please check that you have internet access, that you can access to %s using telnet. Error %r"""
-                logger.exception(message % (tunnel_process.server_host, tunnel_process.server_port,
-                                            (tunnel_process.server_host, tunnel_process.server_port), e))
-                failed = True
-                continue
-            if test_reverse_forward:
-                try:
+            transport = client.get_transport()
+        except socket.timeout as e:
+            message = """Failed to connect with  %s:%s. We received a connection timeout. Please check that you have internet access, that you can access to %s using telnet. Error %r"""
+            logger.exception(message % (tunnel_process.server_host, tunnel_process.server_port,
+                                        (tunnel_process.server_host, tunnel_process.server_port), e))
+            report.record('connector', config_file, False, timer, repr(e))
+            return
+        if test_reverse_forward:
+            try:
+                with timer.step('forward'):
                     transport.request_port_forward("", tunnel_process.server_port_to_forward)
-                    transport.close()
-                except SSHException as e:
-                    message = """Failed to connect with service %s:%s. We received a Port binding rejected error. That means that we could not open our connector completely.
-                                            Please check server_host, server_port and port in your config.
-                                            Error %r"""
-                    logger.exception(message % (tunnel_process.recipient_host, tunnel_process.recipient_port, e))
-                    failed = True
-                    continue
-            client.close()
-        except BadHostKeyException as e:
-            message = """Failed to connect with service %s:%s. The host key given by the SSH server did not match what 
-            we were expecting.
-            The hostname was %s, 
-            the expected key was %s, 
-            the key that we got was %s
-            Please check server_key in your config.
-            Detailed Error %r"""
-            logger.exception(message % (tunnel_process.recipient_host, tunnel_process.recipient_port, e.hostname,
-                                        e.expected_key.get_base64(), e.key.get_base64(), e))
-            failed = True
-        except AuthenticationException as e:
-            message = """Failed to connect with service %s:%s. The private key file was rejected. 
-                                    Please check keyfile in your config
-                                    Error %r"""
-            logger.exception(message % (tunnel_process.recipient_host, tunnel_process.recipient_port, e))
-            failed = True
-        except PasswordRequiredException as e:
-            message = """Failed to connect with service %s:%s. The private key file is encrypted. 
-                        Please check keyfile and username in your config
-                        Error %r"""
-            logger.exception(message % (tunnel_process.recipient_host, tunnel_process.recipient_port, e))
-            failed = True
+                transport.close()
+            except SSHException as e:
+                message = """Failed to connect with service %s:%s. We received a Port binding rejected error. That means that we could not open our connector completely.
+                                        Please check server_host, server_port and port in your config.
+                                        Error %r"""
+                logger.exception(message % (tunnel_process.recipient_host, tunnel_process.recipient_port, e))
+                report.record('connector', config_file, False, timer, repr(e))
+                return
+        client.close()
+        report.record('connector', config_file, True, timer)
+    except BadHostKeyException as e:
+        message = """Failed to connect with service %s:%s. The host key given by the SSH server did not match what 
+        we were expecting.
+        The hostname was %s, 
+        the expected key was %s, 
+        the key that we got was %s
+        Please check server_key in your config.
+        Detailed Error %r"""
+        logger.exception(message % (tunnel_process.recipient_host, tunnel_process.recipient_port, e.hostname,
+                                    e.expected_key.get_base64(), e.key.get_base64(), e))
+        report.record('connector', config_file, False, timer, repr(e))
+    except AuthenticationException as e:
+        message = """Failed to connect with service %s:%s. The private key file was rejected. 
+                                Please check keyfile in your config
+                                Error %r"""
+        logger.exception(message % (tunnel_process.recipient_host, tunnel_process.recipient_port, e))
+        report.record('connector', config_file, False, timer, repr(e))
+    except PasswordRequiredException as e:
+        message = """Failed to connect with service %s:%s. The private key file is encrypted. 
+                    Please check keyfile and username in your config
+                    Error %r"""
+        logger.exception(message % (tunnel_process.recipient_host, tunnel_process.recipient_port, e))
+        report.record('connector', config_file, False, timer, repr(e))
 
-        except Exception as e:
-            failed = True
-            logger.exception("Failed to establish connector %s with error %r" %
-                             (tunnel_process.tunnel_name, e))
-    return failed
+    except Exception as e:
+        logger.exception("Failed to establish connector %s with error %r" %
+                         (tunnel_process.tunnel_name, e))
+        report.record('connector', config_file, False, timer, repr(e))
 
 
 def test_internet_access(logger):
@@ -327,8 +471,10 @@ def test_internet_access(logger):
         return False
 
 
-def test_connections_and_exit(files, logger, processes):
-    failed = test_connections(files, logger, processes)
+def test_connections_and_exit(files, logger, processes, parallelism=DEFAULT_CHECK_PARALLELISM, report_path=None):
+    report = CheckReport(logger)
+    failed = test_connections(files, logger, processes, report, parallelism)
+    report.write(report_path)
     if failed:
         logger.error("Some connections failed!")
         sys.exit(3)
@@ -337,22 +483,34 @@ def test_connections_and_exit(files, logger, processes):
         sys.exit(0)
 
 
-def test_connections(files, logger, processes):
+def test_connections(files, logger, processes, report=None, parallelism=DEFAULT_CHECK_PARALLELISM):
+    """
+    Connect to the services of every connector, up to ``parallelism`` services at the same time
+    """
     create_tunnels_from_config([], files, logger, processes)
-    failed = False
+    report = report or CheckReport(logger)
     test_internet_access(logger)
-    for key, tunnel_proc in processes.items():
-        with socket.socket() as sock:
-            try:
-                sock.settimeout(2)
-                sock.connect((tunnel_proc.recipient_host, tunnel_proc.recipient_port))
-                logger.info("Connection to %s:%s was successful", tunnel_proc.recipient_host, tunnel_proc.recipient_port)
-            except Exception as e:
-                logger.exception(
-                    "Failed to connect with service %s:%s. Please check that you have internet access, that there is not a firewall blocking the connection or that remote_host and remote_port in your config are correct. Error %r" %
-                    (tunnel_proc.recipient_host, tunnel_proc.recipient_port, e))
-                failed = True
-    return failed
+    # services shared by several connectors are checked once
+    services = list(dict.fromkeys(each for tunnel_proc in processes.values() for each in tunnel_proc.recipients))
+    for _ in run_parallel(lambda service: test_connection(service, logger, report), services, parallelism):
+        pass
+    return report.failed('connection')
+
+
+def test_connection(service, logger, report):
+    host, port = service
+    timer = CheckTimer()
+    try:
+        with timer.step('connect'):
+            with create_connection((host, port), 2):
+                pass
+    except Exception as e:
+        logger.exception(
+            "Failed to connect with service %s:%s. Please check that you have internet access, that there is not a firewall blocking the connection or that remote_host and remote_port in your config are correct. Error %r" %
+            (host, port, e))
+        report.record('connection', "%s:%s" % (host, port), False, timer, repr(e))
+        return
+    report.record('connection', "%s:%s" % (host, port), True, timer)
 
 
 def test_mail_and_exit(logger, smtp_sender):
@@ -398,39 +556,249 @@ def check_tunnels(files, items, logger, processes, to_restart, pool, pooled_send
             logger.debug("Connector %s is up", files[key])
 
 
-def restart_tunnels(files, logger, processes, to_restart, alert_senders, status):
+def check_heartbeats(files, logger, processes, to_restart, watchdog, status, pooled_sender, groups=None, workers=None):
+    """
+    Stop the connector processes that are alive but made no progress in ``watchdog.timeout`` seconds, so they are
+    restarted as the ones that exited
+    """
+    for key, proc in list(processes.items()):
+        names = [files[each] for each in member_keys(key, groups, workers)]
+        stall = watchdog.stall(proc.pid, names)
+        if stall < watchdog.timeout:
+            continue
+        logger.warning("Connector %s made no progress in %d seconds, going to restart it", proc.tunnel_name, stall)
+        stop_stalled(proc)
+        del processes[key]
+        to_restart.append(key)
+        for name in names:
+            status.record_watchdog_restart(name)
+        pooled_sender.send_alert(proc.tunnel_name)
+    watchdog.forget({each.pid for each in processes.values()})
+
+
+def stop_stalled(proc):
+    """
+    Ask a stalled process to exit and kill it if it doesn't in ``WATCHDOG_KILL_TIMEOUT`` seconds
+    """
+    proc.terminate()
+    proc.join(WATCHDOG_KILL_TIMEOUT)
+    if proc.is_alive():
+        proc.kill()
+        proc.join()
+
+
+def restart_tunnels(files, logger, processes, to_restart, alert_senders, status, groups=None, detected_at=None,
+                    workers=None, warm_pool=None):
+    """
+    :param detected_at: ``time.monotonic()`` when the connectors were found down, to record the restart latency
+    """
     for each in to_restart:
         logger.info("Going to restart connector from file %s", files[each])
-        tunnel_process = TunnelProcess.from_config_file(files[each], alert_senders)
+        processes[each] = create_process(files, each, alert_senders, groups, workers)
+    for each in by_handshake_priority(processes, to_restart):
+        tunnel_process = launch(processes[each], files, each, alert_senders, groups, workers, warm_pool)
         processes[each] = tunnel_process
-        tunnel_process.start()
-        status.start_tunnel(files[each])
+        start_status(files, each, status, groups, workers)
         logger.info("Connector %s has pid %s", tunnel_process.tunnel_name, tunnel_process.pid)
+        if detected_at is not None:
+            latency = time.monotonic() - detected_at
+            for key in member_keys(each, groups, workers):
+                status.record_restart(files[key], latency)
+            logger.info("Connector %s restarted %.3f seconds after it was found down", tunnel_process.tunnel_name,
+                        latency)
+
+
+def config_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def changed_configs(files, processes, mtimes, groups=None, workers=None):
+    """
+    Keys in ``processes`` of the processes that run a connector whose file changed since it was read. ``mtimes`` is
+    updated with the modification time of the files
+    """
+    changed = []
+    for key in processes:
+        for each in member_keys(key, groups, workers):
+            mtime = config_mtime(files[each])
+            if mtime is not None and mtime != mtimes.get(each):
+                mtimes[each] = mtime
+                if key not in changed:
+                    changed.append(key)
+    return changed
+
+
+def rotate_tunnels(files, logger, processes, to_rotate, alert_senders, status, rotations, groups=None, workers=None,
+                   warm_pool=None):
+    """
+    Replace the processes of ``to_rotate`` without dropping connections. The new process is started first, the old
+    one keeps relaying until the new one forwards its ports or ``ROTATION_READY_TIMEOUT`` seconds pass, then it's
+    stopped and drains its connections. ``rotations`` is filled with the old processes, see ``finish_rotations``
+    """
+    for key in to_rotate:
+        logger.info("Going to rotate connector from file %s", files[key])
+        try:
+            new_process = create_process(files, key, alert_senders, groups, workers)
+        except Exception as e:
+            logger.exception("Failed to create connector from file %s, keeping the running one: %s", files[key], e)
+            continue
+        ready_reader, ready_writer = multiprocessing.Pipe(duplex=False)
+        new_process.on_ready = ReadySignal(ready_writer)
+        old_process = processes[key]
+        new_process = launch(new_process, files, key, alert_senders, groups, workers, warm_pool)
+        processes[key] = new_process
+        ready_writer.close()
+        start_status(files, key, status, groups, workers)
+        rotations.append((ready_reader, old_process, time.monotonic() + ROTATION_READY_TIMEOUT))
+        logger.info("Connector %s has pid %s, replacing pid %s", new_process.tunnel_name, new_process.pid,
+                    old_process.pid)
+
+
+def finish_rotations(ready, rotations, retiring, logger):
+    """
+    Stop the old processes of ``rotations`` whose replacement forwards its ports or that waited too long. They drain
+    their connections in ``retiring`` until they exit
+    """
+    now = time.monotonic()
+    pending = []
+    for reader, old_process, deadline in rotations:
+        if reader is not None and reader in ready:
+            try:
+                if not reader.recv():
+                    # the new process couldn't connect, or the server doesn't let both processes forward the same
+                    # port, as OpenSSH. The new one reconnects once the old one releases it
+                    logger.info("Connector %s couldn't forward its ports while pid %s does", old_process.tunnel_name,
+                                old_process.pid)
+                deadline = now
+            except EOFError:
+                # the new process died before forwarding, it's restarted as any other connector
+                pass
+            reader.close()
+            reader = None
+        if now >= deadline:
+            logger.info("Stopping rotated connector %s with pid %s", old_process.tunnel_name, old_process.pid)
+            old_process.terminate()
+            retiring.append(old_process)
+        else:
+            pending.append((reader, old_process, deadline))
+    rotations[:] = pending
+    # is_alive also reaps the processes that exited
+    retiring[:] = [each for each in retiring if each.is_alive()]
+
+
+def launch(process, files, key, alert_senders, groups=None, workers=None, warm_pool=None):
+    """
+    Start ``process``, created by ``create_process`` for ``key``. It runs in a warm process when ``warm_pool`` has one
 
+    :return: Process that runs the connector
+    """
+    if warm_pool is None:
+        process.start()
+        return process
+    return warm_pool.start(process, files, key, alert_senders, groups, workers)
 
-def register_signal_handlers(processes, pool):
+
+def member_keys(key, groups=None, workers=None):
+    """
+    Keys of the files of every connector run by the process of ``key``
+    """
+    units = workers.get(key, [key]) if workers else [key]
+    return [each for unit in units for each in (groups.get(unit, [unit]) if groups else [unit])]
+
+
+def start_status(files, key, status, groups=None, workers=None):
+    for each in member_keys(key, groups, workers):
+        status.start_tunnel(files[each])
+
+
+def register_signal_handlers(control_writer):
+    """
+    Ask the supervisor loop to stop the connectors and exit, or to rotate them where there is SIGHUP, through the
+    control pipe
+    """
     def exit_gracefully(*args, **kwargs):
-        if pool:
-            pool.shutdown()
-        for each in processes.values():
-            each.terminate()
-        for each in processes.values():
-            each.join()
+        control_writer.send(CONTROL_STOP)
 
-        sys.exit(0)
+    def rotate(*args, **kwargs):
+        control_writer.send(CONTROL_ROTATE)
 
     signal.signal(signal.SIGINT, exit_gracefully)
     signal.signal(signal.SIGTERM, exit_gracefully)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, rotate)
 
 
-def start_tunnels(files, logger, processes, alert_senders, status):
+def stop_tunnels(processes, pool, retiring=(), warm_pool=None):
+    """
+    Stop every connector, they drain their connections at the same time
+
+    :param retiring: Processes already replaced by a rotation that may still be running
+    """
+    if pool:
+        pool.shutdown()
+    if warm_pool:
+        warm_pool.stop()
+    stopping = list(processes.values()) + list(retiring)
+    for each in stopping:
+        each.terminate()
+    for each in stopping:
+        each.join()
+
+
+def start_tunnels(files, logger, processes, alert_senders, status, groups=None, workers=None, worker_count=0):
     create_tunnels_from_config(alert_senders, files, logger, processes)
-    for key, tunnel_process in processes.items():
+    if groups is not None:
+        group_shared_transports(files, logger, processes, groups)
+    if workers is not None:
+        shard_workers(files, logger, processes, workers, worker_count, alert_senders)
+    for key in by_handshake_priority(processes, processes):
+        tunnel_process = processes[key]
         tunnel_process.start()
-        status.start_tunnel(files[key])
+        start_status(files, key, status, groups, workers)
         logger.info("Connector %s has pid %s", tunnel_process.tunnel_name, tunnel_process.pid)
 
 
+def by_handshake_priority(processes, keys):
+    """
+    Keys of the processes to start in the order they should connect, see ``HandshakeScheduler``
+    """
+    return sorted(keys, key=lambda each: -processes[each].handshake_priority)
+
+
+def shard_workers(files, logger, processes, workers, worker_count, alert_senders):
+    """
+    Replace the connector processes with ``worker_count`` processes that run several connectors each. ``workers`` is
+    filled with the keys in ``processes`` of the connectors of each worker, by the key of its first connector
+    """
+    keys = list(processes)
+    for index in range(min(worker_count, len(keys))):
+        shard = keys[index::worker_count]
+        workers[shard[0]] = shard
+        processes[shard[0]] = TunnelWorkerProcess([processes.pop(each) for each in shard], index, alert_senders)
+        logger.info("Connectors from files %s are going to run in worker %d", ", ".join(files[each] for each in shard),
+                    index)
+
+
+def group_shared_transports(files, logger, processes, groups):
+    """
+    Replace the connectors that can share an SSH transport with a single process for all of them. ``groups`` is
+    filled with the files of each group, by the key of its first file in ``processes``
+    """
+    by_transport = {}
+    for key, tunnel_process in processes.items():
+        by_transport.setdefault(tunnel_process.transport_key, []).append(key)
+    for keys in by_transport.values():
+        if len(keys) < 2:
+            continue
+        leader = keys[0]
+        groups[leader] = keys
+        processes[leader] = TunnelGroupProcess([processes.pop(each) for each in keys])
+        logger.info("Connectors from files %s are going to share a transport", ", ".join(files[each] for each in keys))
+
+
 def create_tunnels_from_config(alert_senders, files, logger, processes):
     for each in range(len(files)):
         config_file = files[each]
@@ -447,6 +815,8 @@ def create_tunnels_from_config(alert_senders, files, logger, processes):
 
 def get_post_alert_sender(logger, tunnel_manager_id, params):
     if params.get("http_url"):
+        # requests is only imported when alerts are posted
+        from alerts.http_post_alert import HTTPPostAlertSender
         try:
             post_sender = HTTPPostAlertSender(tunnel_manager_id, params['http_url'], params['http_user'],
                                               params['http_password'], logger)
@@ -460,6 +830,8 @@ def get_post_alert_sender(logger, tunnel_manager_id, params):
 
 def get_smtp_alert_sender(logger, tunnel_manager_id, params):
     if params.get("smtp_hostname"):
+        # email_validator is only imported when alerts are emailed
+        from alerts.email_alert import EmailAlertSender
         try:
             smtp_sender = EmailAlertSender(tunnel_manager_id, params['smtp_hostname'], params.get('smtp_login', None),
                                            params.get('smtp_password', None),
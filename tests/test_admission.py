@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+import unittest
+
+from tunnel_infra.admission import AdmissionControl
+
+logger = logging.getLogger("test")
+
+
+class FakeChannel:
+    origin_addr = ("127.0.0.1", 0)
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+
+class Starts:
+    """
+    ``start`` callable that records the channels it's given
+    """
+
+    def __init__(self):
+        self.started = []
+        self.event = threading.Event()
+
+    def __call__(self, chan):
+        self.started.append(chan)
+        self.event.set()
+
+
+def failing_start(chan):
+    raise RuntimeError("the tunnel is stopped")
+
+
+class AdmissionControlTest(unittest.TestCase):
+    def test_no_limits(self):
+        admission = AdmissionControl(logger)
+        starts = Starts()
+        channels = [FakeChannel() for _ in range(10)]
+        for each in channels:
+            admission.admit(each, starts)
+        self.assertEqual(starts.started, channels)
+        self.assertEqual(admission.active, 10)
+
+    def test_release_starts_waiting_channel(self):
+        admission = AdmissionControl(logger, max_channels=1)
+        first, second = Starts(), Starts()
+        admission.admit(FakeChannel(), first)
+        chan = FakeChannel()
+        admission.admit(chan, second)
+        self.assertEqual(second.started, [])
+        self.assertEqual(admission.stats()['queue_depth'], 1)
+        admission.release()
+        self.assertTrue(second.event.wait(5))
+        self.assertEqual(second.started, [chan])
+        self.assertEqual(admission.active, 1)
+
+    def test_queue_timeout(self):
+        admission = AdmissionControl(logger, max_channels=1, queue_timeout=0.2)
+        admission.admit(FakeChannel(), Starts())
+        chan = FakeChannel()
+        starts = Starts()
+        admission.admit(chan, starts)
+        self.assertTrue(chan.closed.wait(5))
+        self.assertEqual(starts.started, [])
+        self.assertEqual(admission.rejected_queue_timeout, 1)
+
+    def test_queue_full(self):
+        admission = AdmissionControl(logger, max_channels=1, queue_size=1)
+        admission.admit(FakeChannel(), Starts())
+        admission.admit(FakeChannel(), Starts())
+        chan = FakeChannel()
+        admission.admit(chan, Starts())
+        self.assertTrue(chan.closed.is_set())
+        self.assertEqual(admission.rejected_queue_full, 1)
+
+    def test_accept_rate(self):
+        admission = AdmissionControl(logger, accept_rate=10, accept_burst=1)
+        starts = Starts()
+        start = time.monotonic()
+        for _ in range(3):
+            admission.admit(FakeChannel(), starts)
+        while len(starts.started) < 3 and time.monotonic() - start < 5:
+            time.sleep(0.01)
+        self.assertEqual(len(starts.started), 3)
+        # one channel right away and one every 0.1 seconds
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+    def test_start_error_gives_slot_back(self):
+        admission = AdmissionControl(logger, max_channels=1)
+        chan = FakeChannel()
+        admission.admit(chan, failing_start)
+        self.assertTrue(chan.closed.is_set())
+        self.assertEqual(admission.active, 0)
+
+    def test_start_error_keeps_queue_running(self):
+        admission = AdmissionControl(logger, max_channels=1, queue_timeout=0.5)
+        admission.admit(FakeChannel(), Starts())
+        failing = FakeChannel()
+        admission.admit(failing, failing_start)
+        starts = Starts()
+        chan = FakeChannel()
+        admission.admit(chan, starts)
+        admission.release()
+        self.assertTrue(failing.closed.wait(5))
+        # the slot given back by the failed start goes to the next channel
+        self.assertTrue(starts.event.wait(5))
+        self.assertEqual(starts.started, [chan])
+        self.assertTrue(admission.thread.is_alive())
+        # and the queue timeout is still enforced
+        admission.admit(FakeChannel(), Starts())
+        late = FakeChannel()
+        admission.admit(late, Starts())
+        self.assertTrue(late.closed.wait(5))
+
+
+if __name__ == '__main__':
+    unittest.main()
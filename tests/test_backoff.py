@@ -0,0 +1,34 @@
+import unittest
+
+from tunnel_infra.backoff import Backoff
+
+
+class BackoffTest(unittest.TestCase):
+    def test_exponential_without_jitter(self):
+        backoff = Backoff(initial=1, maximum=10, factor=2, jitter=0)
+        self.assertEqual([backoff.next_delay() for _ in range(6)], [1, 2, 4, 8, 10, 10])
+        self.assertEqual(backoff.attempts, 6)
+
+    def test_reset(self):
+        backoff = Backoff(initial=1, maximum=10, jitter=0)
+        backoff.next_delay()
+        backoff.next_delay()
+        backoff.reset()
+        self.assertEqual(backoff.attempts, 0)
+        self.assertEqual(backoff.next_delay(), 1)
+
+    def test_jitter_bounds(self):
+        backoff = Backoff(initial=4, maximum=4, jitter=0.5)
+        for _ in range(200):
+            self.assertTrue(2 <= backoff.next_delay() <= 4)
+
+    def test_full_jitter(self):
+        backoff = Backoff(initial=4, maximum=4, jitter=1)
+        delays = [backoff.next_delay() for _ in range(200)]
+        self.assertTrue(all(0 <= each <= 4 for each in delays))
+        # the delays are spread, so connectors failing together don't retry together
+        self.assertGreater(len(set(delays)), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
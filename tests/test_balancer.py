@@ -0,0 +1,111 @@
+import logging
+import socket
+import unittest
+
+from tunnel_infra.balancer import Recipient, RecipientBalancer, parse_recipients, BALANCING_LEAST_CONNECTIONS, \
+    BALANCING_LATENCY
+from tunnel_infra.circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger("test.balancer")
+
+
+def closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def recipient(port: int) -> Recipient:
+    return Recipient("127.0.0.1", port, CircuitBreaker("127.0.0.1", port, logger, failure_threshold=0),
+                     connect_timeout=1)
+
+
+class RecipientBalancerTest(unittest.TestCase):
+    def setUp(self):
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.addCleanup(self.listener.close)
+        self.up = recipient(self.listener.getsockname()[1])
+        self.down = recipient(closed_port())
+
+    def test_round_robin(self):
+        recipients = [recipient(port) for port in (1, 2, 3)]
+        balancer = RecipientBalancer("test", recipients, logger)
+        firsts = [balancer.candidates()[0].port for _ in range(6)]
+        self.assertEqual(firsts, [1, 2, 3, 1, 2, 3])
+        self.assertEqual(sorted(each.port for each in balancer.candidates()), [1, 2, 3])
+
+    def test_least_connections(self):
+        recipients = [recipient(port) for port in (1, 2, 3)]
+        recipients[0].acquire()
+        recipients[1].acquire()
+        balancer = RecipientBalancer("test", recipients, logger, strategy=BALANCING_LEAST_CONNECTIONS)
+        self.assertEqual(balancer.candidates()[0].port, 3)
+
+    def test_latency(self):
+        recipients = [recipient(port) for port in (1, 2)]
+        recipients[0].record_latency(1)
+        recipients[1].record_latency(0.0001)
+        balancer = RecipientBalancer("test", recipients, logger, strategy=BALANCING_LATENCY)
+        firsts = [balancer.candidates()[0].port for _ in range(100)]
+        self.assertGreater(firsts.count(2), 90)
+
+    def test_unhealthy_last(self):
+        recipients = [recipient(port) for port in (1, 2)]
+        recipients[0].healthy = False
+        balancer = RecipientBalancer("test", recipients, logger)
+        for _ in range(4):
+            self.assertEqual([each.port for each in balancer.candidates()], [2, 1])
+
+    def test_open_circuit_skipped(self):
+        recipients = [Recipient("127.0.0.1", port, CircuitBreaker("127.0.0.1", port, logger, failure_threshold=1))
+                      for port in (1, 2)]
+        recipients[0].circuit_breaker.state = "open"
+        balancer = RecipientBalancer("test", recipients, logger)
+        self.assertEqual([each.port for each in balancer.candidates()], [2])
+
+    def test_failover(self):
+        balancer = RecipientBalancer("test", [self.down, self.up], logger)
+        for _ in range(2):
+            connected = None
+            for each in balancer.candidates():
+                try:
+                    each.connect().close()
+                except OSError:
+                    continue
+                connected = each
+                break
+            self.assertIs(connected, self.up)
+
+    def test_health_check_logs_transitions_only(self):
+        balancer = RecipientBalancer("test", [self.up, self.down], logger)
+        with self.assertLogs(logger, logging.INFO) as logs:
+            balancer.check_health()
+            balancer.check_health()
+            balancer.check_health()
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("unhealthy", logs.output[0])
+        self.assertNotIn("Traceback", "".join(logs.output))
+        self.assertTrue(self.up.healthy)
+        self.assertFalse(self.down.healthy)
+        self.assertIsNotNone(self.up.latency)
+
+        self.down.port = self.up.port
+        with self.assertLogs(logger, logging.INFO) as logs:
+            balancer.check_health()
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("healthy again", logs.output[0])
+
+
+class ParseRecipientsTest(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_recipients("10.0.0.1:80, 10.0.0.2, [::1]:8080", 443),
+                         [("10.0.0.1", 80), ("10.0.0.2", 443), ("::1", 8080)])
+
+    def test_invalid(self):
+        for value in ("", " , ", "host:port", "[::1]:x"):
+            with self.assertRaises(ValueError):
+                parse_recipients(value, 443)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import unittest
+
+from observation.check_report import CheckReport, CheckTimer, run_parallel
+
+logger = logging.getLogger("test")
+
+
+class RunParallelTest(unittest.TestCase):
+    def test_results_and_errors(self):
+        def check(item):
+            if item == 3:
+                raise ValueError("failed")
+            return item * 2
+
+        results = {item: (result, error) for item, result, error in run_parallel(check, range(5), 2)}
+        self.assertEqual({item: result for item, (result, error) in results.items()},
+                         {0: 0, 1: 2, 2: 4, 3: None, 4: 8})
+        self.assertIsInstance(results[3][1], ValueError)
+
+    def test_checks_run_at_the_same_time(self):
+        barrier = threading.Barrier(4, timeout=5)
+        # fails with BrokenBarrierError unless the four checks wait together
+        results = list(run_parallel(lambda item: barrier.wait(), range(4), 4))
+        self.assertEqual([error for item, result, error in results], [None] * 4)
+
+
+class CheckReportTest(unittest.TestCase):
+    def test_summary(self):
+        report = CheckReport(logger)
+        timer = CheckTimer()
+        with timer.step('connect'):
+            pass
+        report.record('connection', "10.0.1.63:636", True, timer)
+        report.record('connector', "tunnel.ini", False, CheckTimer(), "refused")
+        self.assertTrue(report.failed())
+        self.assertTrue(report.failed('connector'))
+        self.assertFalse(report.failed('connection'))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "report.json")
+            report.write(path)
+            with open(path) as f:
+                summary = json.load(f)
+        self.assertEqual((summary['passed'], summary['failed']), (1, 1))
+        self.assertEqual([each['name'] for each in summary['results']], ["10.0.1.63:636", "tunnel.ini"])
+        self.assertEqual(list(summary['results'][0]['steps']), ['connect'])
+        self.assertEqual(summary['results'][1]['error'], "refused")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import logging
+import socket
+import time
+import unittest
+
+from tunnel_infra.circuit_breaker import CircuitBreaker, CIRCUIT_CLOSED, CIRCUIT_OPEN, CIRCUIT_HALF_OPEN
+
+logger = logging.getLogger("test")
+PROBE_TIMEOUT = 5
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.host, self.port = self.listener.getsockname()
+
+    def tearDown(self):
+        self.listener.close()
+
+    def wait_for_state(self, circuit_breaker: CircuitBreaker, state: str):
+        deadline = time.monotonic() + PROBE_TIMEOUT
+        while circuit_breaker.state != state and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(circuit_breaker.state, state)
+
+    def open_circuit(self, recovery_time: float = 0.05) -> CircuitBreaker:
+        circuit_breaker = CircuitBreaker(self.host, self.port, logger, failure_threshold=2,
+                                         recovery_time=recovery_time, max_recovery_time=recovery_time)
+        self.assertFalse(circuit_breaker.record_failure(OSError("refused")))
+        self.assertTrue(circuit_breaker.record_failure(OSError("refused")))
+        return circuit_breaker
+
+    def test_opens_after_consecutive_failures(self):
+        circuit_breaker = CircuitBreaker(self.host, self.port, logger, failure_threshold=2, recovery_time=60)
+        circuit_breaker.record_failure(OSError("refused"))
+        circuit_breaker.record_success()
+        circuit_breaker.record_failure(OSError("refused"))
+        self.assertEqual(circuit_breaker.state, CIRCUIT_CLOSED)
+        circuit_breaker.record_failure(OSError("refused"))
+        self.assertEqual(circuit_breaker.state, CIRCUIT_OPEN)
+        self.assertFalse(circuit_breaker.allow())
+        self.assertEqual(circuit_breaker.stats()['rejected'], 1)
+
+    def test_half_open_allows_a_single_trial(self):
+        circuit_breaker = self.open_circuit()
+        self.wait_for_state(circuit_breaker, CIRCUIT_HALF_OPEN)
+        self.assertTrue(circuit_breaker.allow())
+        self.assertFalse(circuit_breaker.allow())
+        circuit_breaker.record_success()
+        self.assertEqual(circuit_breaker.state, CIRCUIT_CLOSED)
+        self.assertTrue(circuit_breaker.allow())
+
+    def test_failed_trial_opens_again(self):
+        circuit_breaker = self.open_circuit()
+        self.wait_for_state(circuit_breaker, CIRCUIT_HALF_OPEN)
+        self.assertTrue(circuit_breaker.allow())
+        self.assertTrue(circuit_breaker.record_failure(OSError("refused")))
+        self.assertEqual(circuit_breaker.state, CIRCUIT_OPEN)
+        self.assertEqual(circuit_breaker.stats()['opened_times'], 2)
+        # checked again in the background
+        self.wait_for_state(circuit_breaker, CIRCUIT_HALF_OPEN)
+
+    def test_stays_open_while_unreachable(self):
+        self.listener.close()
+        circuit_breaker = self.open_circuit()
+        time.sleep(0.3)
+        self.assertEqual(circuit_breaker.state, CIRCUIT_OPEN)
+        self.assertFalse(circuit_breaker.allow())
+
+    def test_never_opens_without_threshold(self):
+        circuit_breaker = CircuitBreaker(self.host, self.port, logger, failure_threshold=0)
+        for _ in range(10):
+            self.assertTrue(circuit_breaker.record_failure(OSError("refused")))
+        self.assertEqual(circuit_breaker.state, CIRCUIT_CLOSED)
+        self.assertTrue(circuit_breaker.allow())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import threading
+import time
+import unittest
+
+from observation.heartbeat import ConnectorProgress
+from tunnel_infra.handshake import HandshakeScheduler, WAITER_REFRESH, WAITER_EXPIRY, _FIELDS, _PRIORITY, _TICKET, \
+    _REFRESHED_AT
+
+
+class HandshakeSchedulerTest(unittest.TestCase):
+    def test_waiting_connector_makes_progress(self):
+        scheduler = HandshakeScheduler(max_in_flight=1, stagger=0)
+        progress = ConnectorProgress()
+        acquired = threading.Event()
+        lease = scheduler.acquire()
+
+        def wait_for_slot():
+            with scheduler.slot(progress=progress):
+                acquired.set()
+
+        thread = threading.Thread(target=wait_for_slot, daemon=True)
+        thread.start()
+        time.sleep(4 * WAITER_REFRESH)
+        self.assertFalse(acquired.is_set())
+        # the watchdog sees no stall while the connector waits in the queue
+        self.assertLess(progress.heartbeat()['stall'], WAITER_REFRESH)
+        scheduler.release(lease)
+        thread.join(5)
+        self.assertTrue(acquired.is_set())
+
+    def test_priority_order(self):
+        scheduler = HandshakeScheduler(max_in_flight=1, stagger=0)
+        lease = scheduler.acquire()
+        order = []
+
+        def wait_for_slot(priority):
+            with scheduler.slot(priority):
+                order.append(priority)
+
+        threads = []
+        for priority in (0, 2, 1):
+            threads.append(threading.Thread(target=wait_for_slot, args=(priority,), daemon=True))
+            threads[-1].start()
+            # the waiters join the queue in this order
+            time.sleep(WAITER_REFRESH / 5)
+        scheduler.release(lease)
+        for each in threads:
+            each.join(5)
+        self.assertEqual(order, [2, 1, 0])
+
+    def test_expired_lease_is_reused(self):
+        scheduler = HandshakeScheduler(max_in_flight=2, stagger=0)
+        scheduler.acquire()
+        lease = scheduler.acquire()
+        # the process holding it died during its handshake
+        scheduler.leases[lease] = time.time() - 1
+        start = time.monotonic()
+        self.assertEqual(scheduler.acquire(), lease)
+        self.assertLess(time.monotonic() - start, WAITER_REFRESH)
+
+    def test_dead_waiter_is_skipped(self):
+        scheduler = HandshakeScheduler(max_in_flight=1, stagger=0)
+        # place of a process that died waiting with a higher priority
+        scheduler.waiters[_FIELDS + _PRIORITY] = 10
+        scheduler.waiters[_FIELDS + _TICKET] = 1
+        scheduler.waiters[_FIELDS + _REFRESHED_AT] = time.time() - WAITER_EXPIRY - 1
+        start = time.monotonic()
+        lease = scheduler.acquire()
+        self.assertLess(time.monotonic() - start, WAITER_REFRESH)
+        scheduler.release(lease)
+
+    def test_start_offset(self):
+        self.assertEqual(HandshakeScheduler(stagger=0).start_offset(), 0.0)
+        scheduler = HandshakeScheduler(stagger=2)
+        for _ in range(20):
+            self.assertTrue(0 <= scheduler.start_offset() <= 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
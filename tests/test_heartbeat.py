@@ -0,0 +1,63 @@
+import unittest
+from unittest import mock
+
+from observation import heartbeat
+from observation.heartbeat import ConnectorProgress, Watchdog
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class WatchdogTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(heartbeat.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_stall_grows_since_last_heartbeat(self):
+        watchdog = Watchdog(timeout=10)
+        watchdog.beat("tunnel.ini", {'pid': 1, 'stall': 2.0})
+        self.clock.now += 3
+        self.assertEqual(watchdog.stall(1, ["tunnel.ini"]), 5.0)
+
+    def test_process_without_heartbeats(self):
+        watchdog = Watchdog(timeout=10)
+        self.assertEqual(watchdog.stall(1, ["tunnel.ini"]), 0.0)
+        self.clock.now += 20
+        self.assertEqual(watchdog.stall(1, ["tunnel.ini"]), 20.0)
+
+    def test_heartbeat_of_replaced_process_ignored(self):
+        watchdog = Watchdog(timeout=10)
+        watchdog.beat("tunnel.ini", {'pid': 1, 'stall': 0.0})
+        # the connector was restarted in process 2, which hasn't sent any heartbeat yet
+        self.assertEqual(watchdog.stall(2, ["tunnel.ini"]), 0.0)
+        self.clock.now += 4
+        self.assertEqual(watchdog.stall(2, ["tunnel.ini"]), 4.0)
+
+    def test_slowest_connector_of_worker(self):
+        watchdog = Watchdog(timeout=10)
+        watchdog.beat("a.ini", {'pid': 1, 'stall': 1.0})
+        watchdog.beat("b.ini", {'pid': 1, 'stall': 7.0})
+        self.assertEqual(watchdog.stall(1, ["a.ini", "b.ini"]), 7.0)
+
+
+class ConnectorProgressTest(unittest.TestCase):
+    def test_expected_wait_is_not_a_stall(self):
+        clock = FakeClock()
+        with mock.patch.object(heartbeat.time, "monotonic", clock):
+            progress = ConnectorProgress()
+            progress.mark(30)
+            clock.now += 20
+            self.assertEqual(progress.heartbeat()['stall'], 0.0)
+            clock.now += 15
+            self.assertEqual(progress.heartbeat()['stall'], 5.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import logging
+import tempfile
+import threading
+import time
+import unittest
+
+import paramiko
+
+from benchmarks.ssh_server import LocalSSHServer
+from tunnel_infra.keepalive import KeepAliveScheduler, ProbedTransport
+
+logger = logging.getLogger("test")
+
+
+class KeepAliveTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.server = LocalSSHServer(cls.directory.name)
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        cls.directory.cleanup()
+
+    def setUp(self):
+        self.client = paramiko.SSHClient()
+        self.client.load_system_host_keys(self.server.known_hosts_file)
+        self.client.connect(self.server.host, self.server.port, username="test",
+                            key_filename=self.server.client_key_file, look_for_keys=False, allow_agent=False,
+                            transport_factory=ProbedTransport)
+        self.transport = self.client.get_transport()
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_round_trip_time(self):
+        rtt = self.transport.round_trip_time(5)
+        self.assertIsNotNone(rtt)
+        self.assertGreaterEqual(rtt, 0)
+
+    def test_probe_keeps_answers_of_other_requests(self):
+        self.assertTrue(self.transport.send_probe())
+        port = self.transport.request_port_forward("127.0.0.1", 0)
+        self.assertGreater(port, 0)
+        self.transport.cancel_port_forward("127.0.0.1", port)
+        self.assertIsNotNone(self.transport.round_trip_time(5))
+
+    def test_scheduler(self):
+        scheduler = KeepAliveScheduler()
+        failed = threading.Event()
+        keep_alive = scheduler.register(self.transport, 0.2, failed.set, logger, max_interval=0.4)
+        time.sleep(1.5)
+        self.assertFalse(failed.is_set())
+        self.assertLess(time.monotonic() - keep_alive.last_success, 1)
+        self.assertEqual(keep_alive.interval, 0.4)
+        self.server.close_transports()
+        self.assertTrue(failed.wait(5))
+        scheduler.unregister(keep_alive)
+
+
+if __name__ == '__main__':
+    unittest.main()
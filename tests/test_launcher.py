@@ -0,0 +1,25 @@
+import logging
+import unittest
+from unittest import mock
+
+from tunnel_infra import launcher
+from tunnel_infra.launcher import set_start_method
+
+logger = logging.getLogger("test")
+
+
+class SetStartMethodTest(unittest.TestCase):
+    def test_unavailable_method_keeps_default(self):
+        with mock.patch.object(launcher.multiprocessing, "set_start_method") as set_method, \
+                self.assertLogs(logger, logging.WARNING):
+            set_start_method("teleport", logger)
+        set_method.assert_not_called()
+
+    def test_available_method(self):
+        with mock.patch.object(launcher.multiprocessing, "set_start_method") as set_method:
+            set_start_method("spawn", logger)
+        set_method.assert_called_once_with("spawn", force=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import logging
+import unittest
+
+from tunnel_infra.PortDispatcher import PortDispatcher
+
+logger = logging.getLogger("test")
+
+
+class FakeChannel:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeTunnel:
+    def __init__(self, port_to_forward: int):
+        self.port_to_forward = port_to_forward
+        self.accepted = []
+
+    def accept_channel(self, chan):
+        self.accepted.append(chan)
+
+
+class PortDispatcherTest(unittest.TestCase):
+    def test_channels_go_to_the_tunnel_of_their_port(self):
+        dispatcher = PortDispatcher(logger)
+        first, second = FakeTunnel(10389), FakeTunnel(10636)
+        dispatcher.register(first)
+        dispatcher.register(second)
+        chan = FakeChannel()
+        dispatcher(chan, ("10.0.0.1", 50000), ("0.0.0.0", 10636))
+        self.assertEqual(second.accepted, [chan])
+        self.assertEqual(first.accepted, [])
+
+    def test_channel_of_unknown_port_is_closed(self):
+        dispatcher = PortDispatcher(logger)
+        tunnel = FakeTunnel(10389)
+        dispatcher.register(tunnel)
+        dispatcher.unregister(tunnel)
+        chan = FakeChannel()
+        with self.assertLogs(logger, logging.WARNING):
+            dispatcher(chan, ("10.0.0.1", 50000), ("0.0.0.0", 10389))
+        self.assertTrue(chan.closed)
+
+    def test_unregister_keeps_the_replacement(self):
+        dispatcher = PortDispatcher(logger)
+        old, new = FakeTunnel(10389), FakeTunnel(10389)
+        dispatcher.register(old)
+        dispatcher.register(new)
+        dispatcher.unregister(old)
+        chan = FakeChannel()
+        dispatcher(chan, ("10.0.0.1", 50000), ("0.0.0.0", 10389))
+        self.assertEqual(new.accepted, [chan])
+
+
+if __name__ == '__main__':
+    unittest.main()
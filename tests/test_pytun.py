@@ -0,0 +1,78 @@
+import logging
+import multiprocessing
+import subprocess
+import sys
+import time
+import unittest
+
+import pytun
+from tunnel_infra.TunnelWorkerProcess import TunnelWorkerProcess
+
+logger = logging.getLogger("test")
+
+
+class FakeConnector:
+    def __init__(self, tunnel_name: str):
+        self.tunnel_name = tunnel_name
+        self.shares_process = False
+
+
+class ShardWorkersTest(unittest.TestCase):
+    def test_connectors_spread_among_workers(self):
+        files = ["%d.ini" % each for each in range(5)]
+        processes = {each: FakeConnector(files[each]) for each in range(5)}
+        workers = {}
+        pytun.shard_workers(files, logger, processes, workers, 2, [])
+        self.assertEqual(workers, {0: [0, 2, 4], 1: [1, 3]})
+        self.assertEqual(set(processes), {0, 1})
+        self.assertIsInstance(processes[0], TunnelWorkerProcess)
+        self.assertEqual(processes[1].tunnel_name, "1.ini, 3.ini")
+        self.assertTrue(all(each.shares_process for each in processes[0].connectors))
+
+    def test_more_workers_than_connectors(self):
+        files = ["0.ini"]
+        processes = {0: FakeConnector(files[0])}
+        workers = {}
+        pytun.shard_workers(files, logger, processes, workers, 4, [])
+        self.assertEqual(workers, {0: [0]})
+
+
+def exit_right_away():
+    pass
+
+
+class WaitForEventsTest(unittest.TestCase):
+    def test_wakes_up_when_a_connector_exits(self):
+        control_reader, control_writer = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=exit_right_away)
+        process.start()
+        try:
+            start = time.monotonic()
+            ready = pytun.wait_for_events({0: process}, control_reader, 30)
+            self.assertLess(time.monotonic() - start, 30)
+            self.assertEqual(ready, [process.sentinel])
+        finally:
+            process.join()
+            control_reader.close()
+            control_writer.close()
+
+    def test_wakes_up_on_control_message(self):
+        control_reader, control_writer = multiprocessing.Pipe(duplex=False)
+        control_writer.send("rotate")
+        try:
+            self.assertEqual(pytun.wait_for_events({}, control_reader, 30), [control_reader])
+        finally:
+            control_reader.close()
+            control_writer.close()
+
+
+class LazyImportTest(unittest.TestCase):
+    def test_alert_senders_not_imported(self):
+        # spawned connectors import pytun, the alert senders are only imported when they are configured
+        code = "import sys, pytun; print(','.join(m for m in ('requests', 'email_validator') if m in sys.modules))"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import multiprocessing
+import unittest
+
+from tunnel_infra.readiness import ReadySignal, ReadyCountdown
+
+
+class ReadySignalTest(unittest.TestCase):
+    def test_only_first_report_is_sent(self):
+        reader, writer = multiprocessing.Pipe(duplex=False)
+        signal = ReadySignal(writer)
+        signal(False)
+        signal(True)
+        self.assertTrue(reader.poll(5))
+        self.assertIs(reader.recv(), False)
+        # the write end was closed after the first report
+        with self.assertRaises(EOFError):
+            reader.recv()
+
+
+class ReadyCountdownTest(unittest.TestCase):
+    def test_ready_once_every_connector_forwards(self):
+        reports = []
+        countdown = ReadyCountdown(3, reports.append)
+        countdown(True)
+        countdown(True)
+        self.assertEqual(reports, [])
+        countdown(True)
+        self.assertEqual(reports, [True])
+
+    def test_first_failure_is_reported(self):
+        reports = []
+        countdown = ReadyCountdown(3, reports.append)
+        countdown(True)
+        countdown(False)
+        self.assertEqual(reports, [False])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import logging
+import socket
+import time
+import unittest
+
+from tunnel_infra.recipient_pool import RecipientPool
+
+logger = logging.getLogger("test")
+FILL_TIMEOUT = 5
+
+
+class RecipientPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.host, self.port = self.listener.getsockname()
+
+    def tearDown(self):
+        self.listener.close()
+
+    def wait_for_idle(self, pool: RecipientPool, idle: int):
+        deadline = time.monotonic() + FILL_TIMEOUT
+        while pool.stats()['idle'] < idle and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(pool.stats()['idle'], idle)
+
+    def test_pooled_connection(self):
+        pool = RecipientPool(self.host, self.port, logger, size=2)
+        pool.start()
+        try:
+            self.wait_for_idle(pool, 2)
+            sock = pool.get()
+            self.assertIsNotNone(sock)
+            with sock:
+                self.assertEqual(sock.getpeername(), (self.host, self.port))
+            self.assertEqual(pool.stats()['hits'], 1)
+            # the pool opens another connection in place of the one taken
+            self.wait_for_idle(pool, 2)
+        finally:
+            pool.stop()
+        self.assertEqual(pool.stats()['idle'], 0)
+
+    def test_closed_connection_is_dropped(self):
+        pool = RecipientPool(self.host, self.port, logger, size=0)
+        sock = socket.create_connection((self.host, self.port))
+        pool.idle.append((sock, time.monotonic()))
+        # the recipient closes the idle connection
+        self.listener.accept()[0].close()
+        time.sleep(0.05)
+        self.assertIsNone(pool.get())
+        stats = pool.stats()
+        self.assertEqual(stats['dead'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(sock.fileno(), -1)
+
+    def test_expired_connection_is_dropped(self):
+        pool = RecipientPool(self.host, self.port, logger, size=0, max_idle_time=1)
+        sock = socket.create_connection((self.host, self.port))
+        pool.idle.append((sock, time.monotonic() - 2))
+        self.assertIsNone(pool.get())
+        self.assertEqual(pool.stats()['expired'], 1)
+        self.assertEqual(sock.fileno(), -1)
+
+
+if __name__ == '__main__':
+    unittest.main()
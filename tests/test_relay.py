@@ -0,0 +1,196 @@
+import contextlib
+import logging
+import socket
+import threading
+import time
+import unittest
+from unittest import mock
+
+from benchmarks.relay_throughput import SocketChannel
+from tunnel_infra import relay as relay_module
+from tunnel_infra.relay import ChannelRelay, SelectorRelayEngine, _SelectorLoop, RelayEngineStopped, RelayBuffer, \
+    ThreadRelayEngine, MIN_RELAY_BUFFER_SIZE
+from tunnel_infra.shaping import BandwidthShaper
+
+logger = logging.getLogger("test")
+TRANSFER_TIMEOUT = 20
+
+
+def echo(sock: socket.socket):
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            break
+        sock.sendall(data)
+    sock.shutdown(socket.SHUT_WR)
+
+
+def transfer(relay_fn, payload: bytes, shaper: BandwidthShaper = None) -> bytes:
+    """
+    Send ``payload`` through a relay to an echo recipient and return what comes back
+    """
+    recipient_sock, echo_sock = socket.socketpair()
+    chan_sock, client = socket.socketpair()
+    client.settimeout(TRANSFER_TIMEOUT)
+    relay_fn(ChannelRelay(SocketChannel(chan_sock), recipient_sock, logger,
+                          shaper=shaper.channel() if shaper else None))
+    echo_thread = threading.Thread(target=echo, args=(echo_sock,), daemon=True)
+    echo_thread.start()
+
+    def send():
+        client.sendall(payload)
+        client.shutdown(socket.SHUT_WR)
+
+    send_thread = threading.Thread(target=send, daemon=True)
+    send_thread.start()
+    received = bytearray()
+    try:
+        while True:
+            data = client.recv(65536)
+            if not data:
+                break
+            received += data
+    finally:
+        send_thread.join()
+        echo_thread.join(TRANSFER_TIMEOUT)
+        client.close()
+        echo_sock.close()
+    return bytes(received)
+
+
+class RelayBufferTest(unittest.TestCase):
+    def test_adaptive_buffer_grows_when_filled(self):
+        buffer = RelayBuffer(4 * MIN_RELAY_BUFFER_SIZE)
+        self.assertEqual(buffer.size, MIN_RELAY_BUFFER_SIZE)
+        buffer.filled(MIN_RELAY_BUFFER_SIZE - 1)
+        self.assertEqual(buffer.size, MIN_RELAY_BUFFER_SIZE)
+        for _ in range(3):
+            buffer.filled(buffer.size)
+        self.assertEqual(buffer.size, 4 * MIN_RELAY_BUFFER_SIZE)
+        self.assertEqual(len(buffer.view), buffer.size)
+
+    def test_fixed_buffer(self):
+        buffer = RelayBuffer(4 * MIN_RELAY_BUFFER_SIZE, adaptive=False)
+        self.assertEqual(buffer.size, 4 * MIN_RELAY_BUFFER_SIZE)
+        buffer.filled(buffer.size)
+        self.assertEqual(buffer.size, 4 * MIN_RELAY_BUFFER_SIZE)
+
+
+class ThreadRelayTest(unittest.TestCase):
+    def test_transfer(self):
+        engine = ThreadRelayEngine(logger)
+        payload = bytes(range(256)) * 4096
+
+        def relay_fn(relay):
+            threading.Thread(target=engine.relay, args=(relay,), daemon=True).start()
+
+        self.assertEqual(transfer(relay_fn, payload), payload)
+
+
+class SelectorRelayTest(unittest.TestCase):
+    def test_throttled_relay_is_woken_up(self):
+        loop = _SelectorLoop("test", logger)
+        recipient_sock, _ = socket.socketpair()
+        chan_sock, _ = socket.socketpair()
+        relay = ChannelRelay(SocketChannel(chan_sock), recipient_sock, logger, shaper=BandwidthShaper(1000).channel())
+        relay.to_chan.resume_at = 100.0
+        # the shaper lets the relay read again while the loop looks at it
+        clock = iter([99.99, 100.01, 100.02, 100.03])
+        with mock.patch.object(relay_module.time, "monotonic", lambda: next(clock)):
+            loop._update(relay)
+        listened = relay.sock in loop.selector.get_map()
+        self.assertTrue(listened or relay in loop.throttled)
+        loop._discard(relay)
+
+    def test_bandwidth_limit(self):
+        engine = SelectorRelayEngine(logger)
+        engine.start()
+        shaper = BandwidthShaper(1000000)
+        payload = bytes(range(256)) * 1024
+        try:
+            for _ in range(5):
+                self.assertEqual(transfer(engine.relay, payload, shaper), payload)
+        finally:
+            engine.stop()
+
+    def test_stopped_engine(self):
+        engine = SelectorRelayEngine(logger)
+        engine.start()
+        engine.stop()
+        with self.assertRaises(RelayEngineStopped):
+            engine.submit(print)
+        recipient_sock, _ = socket.socketpair()
+        chan_sock, _ = socket.socketpair()
+        closed = []
+        engine.relay(ChannelRelay(SocketChannel(chan_sock), recipient_sock, logger, on_close=lambda: closed.append(1)))
+        self.assertEqual(closed, [1])
+        self.assertEqual(recipient_sock.fileno(), -1)
+
+
+class ChannelRelayTest(unittest.TestCase):
+    def setUp(self):
+        self.recipient_sock, self.recipient = socket.socketpair()
+        chan_sock, self.client = socket.socketpair()
+        for each in (self.recipient, self.client):
+            each.settimeout(TRANSFER_TIMEOUT)
+        self.relay = ChannelRelay(SocketChannel(chan_sock), self.recipient_sock, logger, buffer_size=65536)
+
+    def tearDown(self):
+        self.relay.close()
+        self.recipient.close()
+        self.client.close()
+
+    def test_slow_recipient_stops_reads(self):
+        relay = self.relay
+        def send():
+            # fails once the test closes the client
+            with contextlib.suppress(OSError):
+                self.client.sendall(bytes(8 * 1024 * 1024))
+
+        threading.Thread(target=send, daemon=True).start()
+        deadline = time.monotonic() + TRANSFER_TIMEOUT
+        # the recipient doesn't read, so the data piles up in the relay until it stops reading the channel
+        while relay.wants_read(relay.chan) and time.monotonic() < deadline:
+            relay.on_readable(relay.chan)
+        self.assertFalse(relay.wants_read(relay.chan))
+        self.assertLess(relay.to_sock.pending_bytes, 2 * relay.to_sock.buffer.max_size)
+        received = len(self.recipient.recv(65536))
+        relay.on_writable(relay.sock)
+        self.assertLess(relay.to_sock.pending_bytes, relay.to_sock.buffer.max_size + received)
+        self.client.close()
+
+    def test_half_close(self):
+        relay = self.relay
+        self.client.sendall(b"request")
+        self.client.shutdown(socket.SHUT_WR)
+        relay.on_readable(relay.chan)
+        relay.on_readable(relay.chan)
+        self.assertEqual(self.recipient.recv(65536), b"request")
+        # the recipient sees the end of the request and still answers it
+        self.assertEqual(self.recipient.recv(65536), b"")
+        self.assertFalse(relay.done)
+        self.recipient.sendall(b"response")
+        relay.on_readable(relay.sock)
+        self.assertEqual(self.client.recv(65536), b"response")
+        self.recipient.shutdown(socket.SHUT_WR)
+        relay.on_readable(relay.sock)
+        self.assertEqual(self.client.recv(65536), b"")
+        self.assertTrue(relay.done)
+
+    def test_throttled_once_per_delayed_read(self):
+        shaper = BandwidthShaper(1000)
+        recipient_sock, _ = socket.socketpair()
+        chan_sock, _ = socket.socketpair()
+        relay = ChannelRelay(SocketChannel(chan_sock), recipient_sock, logger, shaper=shaper.channel())
+        shaper.bucket.take(shaper.bucket.capacity)
+        try:
+            # the relay checks the delay again each time it's woken up before the bucket refills
+            for _ in range(3):
+                relay.on_readable(recipient_sock)
+            self.assertEqual(shaper.stats()['throttled'], 1)
+        finally:
+            relay.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import socket
+import time
+import unittest
+from unittest import mock
+
+from lib import resolver as resolver_module
+from lib.resolver import ResolverCache, create_connection, _interleave, CONNECTION_ATTEMPT_DELAY
+
+IPV4 = (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", 0))
+IPV6 = (socket.AF_INET6, socket.SOCK_STREAM, 6, "", ("::1", 0, 0, 0))
+
+
+def address(port: int) -> tuple:
+    return socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", port)
+
+
+def closed_port() -> int:
+    listener = socket.create_server(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+    listener.close()
+    return port
+
+
+class ResolverCacheTest(unittest.TestCase):
+    def test_lookups_are_cached(self):
+        resolver = ResolverCache()
+        with mock.patch.object(resolver_module.socket, "getaddrinfo", return_value=[IPV4]) as getaddrinfo:
+            self.assertEqual(resolver.resolve("example.com", 80), [IPV4])
+            self.assertEqual(resolver.resolve("example.com", 80), [IPV4])
+        getaddrinfo.assert_called_once()
+
+    def test_failed_lookups_are_cached(self):
+        resolver = ResolverCache()
+        error = socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        with mock.patch.object(resolver_module.socket, "getaddrinfo", side_effect=error) as getaddrinfo:
+            for _ in range(2):
+                with self.assertRaises(socket.gaierror):
+                    resolver.resolve("example.com", 80)
+        getaddrinfo.assert_called_once()
+
+    def test_expired_addresses_kept_when_refresh_fails(self):
+        resolver = ResolverCache(ttl=0)
+        error = socket.gaierror(socket.EAI_AGAIN, "Temporary failure in name resolution")
+        with mock.patch.object(resolver_module.socket, "getaddrinfo", side_effect=[[IPV4], error]) as getaddrinfo:
+            self.assertEqual(resolver.resolve("example.com", 80), [IPV4])
+            # refreshed in the background, the expired addresses are returned meanwhile
+            self.assertEqual(resolver.resolve("example.com", 80), [IPV4])
+            entry = resolver.entries[("example.com", 80)]
+            deadline = time.monotonic() + 5
+            while entry.refreshing and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(resolver.resolve("example.com", 80), [IPV4])
+        self.assertEqual(getaddrinfo.call_count, 2)
+
+
+class CreateConnectionTest(unittest.TestCase):
+    def test_families_are_interleaved(self):
+        self.assertEqual(_interleave([IPV6, IPV6, IPV4, IPV4]), [IPV6, IPV4, IPV6, IPV4])
+
+    def test_refused_address_tries_next_right_away(self):
+        listener = socket.create_server(("127.0.0.1", 0))
+        port = listener.getsockname()[1]
+        resolver = ResolverCache()
+        try:
+            with mock.patch.object(resolver_module.socket, "getaddrinfo",
+                                   return_value=[address(closed_port()), address(port)]):
+                start = time.monotonic()
+                sock = create_connection(("example.com", port), 5, resolver)
+            with sock:
+                self.assertEqual(sock.getpeername(), ("127.0.0.1", port))
+                self.assertEqual(sock.gettimeout(), 5)
+            self.assertLess(time.monotonic() - start, CONNECTION_ATTEMPT_DELAY)
+        finally:
+            listener.close()
+
+    def test_every_address_refused(self):
+        resolver = ResolverCache()
+        with mock.patch.object(resolver_module.socket, "getaddrinfo",
+                               return_value=[address(closed_port()), address(closed_port())]):
+            with self.assertRaises(OSError):
+                create_connection(("example.com", 80), 5, resolver)
+
+
+if __name__ == '__main__':
+    unittest.main()
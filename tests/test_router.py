@@ -0,0 +1,144 @@
+import logging
+import socket
+import ssl
+import threading
+import time
+import unittest
+
+from benchmarks.relay_throughput import SocketChannel
+from tunnel_infra.Tunnel import Tunnel
+from tunnel_infra.balancer import RecipientBalancer
+from tunnel_infra.relay import RELAY_ENGINE_SELECTOR
+from tunnel_infra.router import Router, NeedMoreData, sniff_host
+
+logger = logging.getLogger("test")
+
+
+def client_hello(server_name: str | None) -> bytes:
+    incoming, outgoing = ssl.MemoryBIO(), ssl.MemoryBIO()
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    tls = context.wrap_bio(incoming, outgoing, server_hostname=server_name)
+    try:
+        tls.do_handshake()
+    except ssl.SSLWantReadError:
+        pass
+    return outgoing.read()
+
+
+class SniffHostTest(unittest.TestCase):
+    def test_tls_server_name(self):
+        self.assertEqual(sniff_host(client_hello("Wiki.Internal")), "wiki.internal")
+
+    def test_tls_without_server_name(self):
+        self.assertIsNone(sniff_host(client_hello(None)))
+
+    def test_truncated_tls(self):
+        hello = client_hello("wiki.internal")
+        for size in (1, 4, 5, len(hello) // 2, len(hello) - 1):
+            with self.assertRaises(NeedMoreData):
+                sniff_host(hello[:size])
+
+    def test_malformed_tls(self):
+        hello = bytearray(client_hello("wiki.internal"))
+        # a length of the session id that goes past the end of the record
+        hello[5 + 4 + 2 + 32] = 0xff
+        self.assertIsNone(sniff_host(bytes(hello)))
+        self.assertIsNone(sniff_host(b"\x16\x03\x01\x00\x01\x02"))
+
+    def test_http_host(self):
+        self.assertEqual(sniff_host(b"GET / HTTP/1.1\r\nHost: Example.com.\r\n\r\n"), "example.com")
+        self.assertEqual(sniff_host(b"POST /x HTTP/1.1\r\nhost:example.com:8080\r\n\r\n"), "example.com")
+        self.assertEqual(sniff_host(b"GET / HTTP/1.1\r\nHost: [::1]:8080\r\n\r\n"), "::1")
+
+    def test_http_without_host(self):
+        self.assertIsNone(sniff_host(b"GET / HTTP/1.0\r\nAccept: */*\r\n\r\n"))
+
+    def test_truncated_http(self):
+        for data in (b"", b"G", b"GET", b"GET / HTTP/1.1\r\n", b"GET / HTTP/1.1\r\nAccept: */*\r\nHo"):
+            with self.assertRaises(NeedMoreData):
+                sniff_host(data)
+
+    def test_other_protocols(self):
+        for data in (b"SSH-2.0-OpenSSH_9.0\r\n", b"\x00\x00\x00\x08", b"HELLO world", b"GETX / HTTP/1.1\r\n"):
+            self.assertIsNone(sniff_host(data))
+
+    def test_invalid_host_encoding(self):
+        self.assertIsNone(sniff_host(b"GET / HTTP/1.1\r\nHost: \xff\xfe\r\n\r\n"))
+
+
+def balancer(port: int = 1) -> RecipientBalancer:
+    return RecipientBalancer.single("test", "127.0.0.1", port, logger)
+
+
+class RouterTest(unittest.TestCase):
+    def setUp(self):
+        self.exact, self.wildcard, self.specific, self.default = balancer(), balancer(), balancer(), balancer()
+        self.router = Router({"Wiki.Internal.": self.exact, "*.apps.internal": self.wildcard,
+                              "*.eu.apps.internal": self.specific}, self.default, logger, sniff_timeout=0.2)
+
+    def test_match(self):
+        self.assertIs(self.router.match("wiki.internal"), self.exact)
+        self.assertIs(self.router.match("a.apps.internal"), self.wildcard)
+        self.assertIs(self.router.match("a.eu.apps.internal"), self.specific)
+        self.assertIsNone(self.router.match("apps.internal"))
+        self.assertIsNone(self.router.match("other.internal"))
+        self.assertIsNone(self.router.match(None))
+
+    def route(self, data: bytes | None):
+        chan_sock, client = socket.socketpair()
+        self.addCleanup(chan_sock.close)
+        self.addCleanup(client.close)
+        if data is not None:
+            client.sendall(data)
+        return self.router.route(SocketChannel(chan_sock))
+
+    def test_route(self):
+        request = b"GET / HTTP/1.1\r\nHost: x.apps.internal\r\n\r\n"
+        self.assertEqual(self.route(request), (request, self.wildcard))
+        hello = client_hello("wiki.internal")
+        self.assertEqual(self.route(hello), (hello, self.exact))
+        self.assertEqual(self.router.stats()['routed'], 2)
+
+    def test_client_sends_nothing(self):
+        start = time.monotonic()
+        self.assertEqual(self.route(None), (b"", self.default))
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(self.router.stats()['unmatched'], 1)
+
+
+REQUEST = b"GET / HTTP/1.1\r\nHost: wiki.internal\r\n\r\n"
+
+
+class PeerSocketChannel(SocketChannel):
+    def getpeername(self):
+        return self.sock.getpeername()
+
+
+class RoutedTunnelTest(unittest.TestCase):
+    def test_silent_clients_dont_block_connects(self):
+        listener = socket.create_server(("127.0.0.1", 0))
+        self.addCleanup(listener.close)
+        recipient = RecipientBalancer.single("test", "127.0.0.1", listener.getsockname()[1], logger)
+        router = Router({"wiki.internal": recipient}, recipient, logger, sniff_timeout=5)
+        tunnel = Tunnel("test", recipient_host="127.0.0.1", recipient_port=listener.getsockname()[1], client=None,
+                        port_to_forward=0, logger=logger, relay_engine=RELAY_ENGINE_SELECTOR, router=router)
+        # a single worker connects to the recipients
+        tunnel.relay_engine.connect_workers = 1
+        tunnel.relay_engine.start()
+        self.addCleanup(tunnel.relay_engine.stop)
+        for data in (None, None, REQUEST):
+            chan_sock, client = socket.socketpair()
+            self.addCleanup(client.close)
+            if data:
+                client.sendall(data)
+            tunnel.accept_channel(PeerSocketChannel(chan_sock))
+        listener.settimeout(2)
+        conn, _ = listener.accept()
+        conn.settimeout(2)
+        self.assertEqual(conn.recv(1024), REQUEST)
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
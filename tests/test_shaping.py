@@ -0,0 +1,44 @@
+import unittest
+from unittest import mock
+
+from tunnel_infra import shaping
+from tunnel_infra.shaping import BandwidthShaper, PriorityGate, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW, \
+    PRIORITY_DEFER, PRIORITY_WINDOW
+
+
+class PriorityGateTest(unittest.TestCase):
+    def test_lower_classes_deferred_while_higher_is_active(self):
+        gate = PriorityGate()
+        gate.mark(PRIORITY_NORMAL)
+        self.assertEqual(gate.deferral(PRIORITY_HIGH), 0.0)
+        self.assertEqual(gate.deferral(PRIORITY_NORMAL), 0.0)
+        self.assertEqual(gate.deferral(PRIORITY_LOW), PRIORITY_DEFER)
+
+    def test_idle_class_defers_nobody(self):
+        gate = PriorityGate()
+        gate.last_active[PRIORITY_HIGH] = shaping.time.monotonic() - PRIORITY_WINDOW
+        self.assertEqual(gate.deferral(PRIORITY_LOW), 0.0)
+
+
+class ChannelShaperTest(unittest.TestCase):
+    def test_connector_and_channel_limits(self):
+        shaper = BandwidthShaper(rate=100000, channel_rate=10000)
+        channel = shaper.channel()
+        with mock.patch.object(shaping, "priority_gate", PriorityGate()):
+            self.assertEqual(channel.allowance(), 10000)
+            channel.consumed(10000)
+            self.assertGreater(channel.delay(False), 0)
+            # the other channels have their own limit and share the one of the connector
+            self.assertEqual(shaper.channel().allowance(), 10000)
+            self.assertLess(shaper.bucket.available(), 91000)
+        self.assertEqual(shaper.stats()['bytes'], 10000)
+
+    def test_unlimited(self):
+        channel = BandwidthShaper().channel()
+        self.assertIsNone(channel.allowance())
+        with mock.patch.object(shaping, "priority_gate", PriorityGate()):
+            self.assertEqual(channel.delay(True), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
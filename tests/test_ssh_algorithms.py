@@ -0,0 +1,34 @@
+import socket
+import unittest
+
+import paramiko
+
+from tunnel_infra.ssh_algorithms import parse_algorithms, apply_algorithms
+
+
+class SSHAlgorithmsTest(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_algorithms('ciphers', "aes128-ctr, aes256-ctr"), ("aes128-ctr", "aes256-ctr"))
+        self.assertIsNone(parse_algorithms('macs', None))
+        self.assertIsNone(parse_algorithms('macs', " , "))
+
+    def test_unknown_algorithm(self):
+        with self.assertRaises(ValueError):
+            parse_algorithms('kex', "curve25519-sha256@libssh.org, rot13")
+
+    def test_apply(self):
+        sock, peer = socket.socketpair()
+        transport = paramiko.Transport(sock)
+        try:
+            apply_algorithms(transport, ciphers=("aes256-ctr",), macs=None)
+            security_options = transport.get_security_options()
+            self.assertEqual(security_options.ciphers, ("aes256-ctr",))
+            # the defaults of paramiko are kept
+            self.assertEqual(security_options.digests, paramiko.Transport._preferred_macs)
+        finally:
+            transport.close()
+            peer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
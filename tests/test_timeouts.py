@@ -0,0 +1,65 @@
+import logging
+import socket
+import threading
+import time
+import unittest
+
+from benchmarks.relay_throughput import SocketChannel
+from tunnel_infra.relay import ChannelRelay, SelectorRelayEngine, ThreadRelayEngine
+from tunnel_infra.timeouts import ChannelTimeouts, REAPED_IDLE, REAPED_LIFETIME, REAP_INTERVAL
+
+logger = logging.getLogger("test")
+
+
+class ChannelTimeoutsTest(unittest.TestCase):
+    def test_expired(self):
+        timeouts = ChannelTimeouts(idle_timeout=10, max_lifetime=100)
+        self.assertIsNone(timeouts.expired(0, 95, 99))
+        self.assertEqual(timeouts.expired(0, 80, 90), REAPED_IDLE)
+        self.assertEqual(timeouts.expired(0, 95, 100), REAPED_LIFETIME)
+        self.assertEqual(timeouts.deadline(0, 95), 100)
+        self.assertEqual(timeouts.deadline(0, 50), 60)
+
+    def test_disabled(self):
+        timeouts = ChannelTimeouts()
+        self.assertFalse(timeouts.enabled)
+        self.assertIsNone(timeouts.expired(0, 0, 1e9))
+        self.assertIsNone(timeouts.deadline(0, 0))
+
+
+class RelayTimeoutsTest(unittest.TestCase):
+    def idle_relay(self, timeouts: ChannelTimeouts) -> tuple[ChannelRelay, threading.Event]:
+        recipient_sock, self.recipient = socket.socketpair()
+        chan_sock, self.client = socket.socketpair()
+        closed = threading.Event()
+        relay = ChannelRelay(SocketChannel(chan_sock), recipient_sock, logger, on_close=closed.set, timeouts=timeouts)
+        return relay, closed
+
+    def tearDown(self):
+        self.recipient.close()
+        self.client.close()
+
+    def test_thread_engine_reaps_idle_relay(self):
+        timeouts = ChannelTimeouts(idle_timeout=0.2)
+        relay, closed = self.idle_relay(timeouts)
+        start = time.monotonic()
+        threading.Thread(target=ThreadRelayEngine(logger).relay, args=(relay,), daemon=True).start()
+        self.assertTrue(closed.wait(5))
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertEqual(timeouts.stats()['reaped_idle'], 1)
+
+    def test_selector_engine_reaps_relay(self):
+        timeouts = ChannelTimeouts(max_lifetime=0.2)
+        relay, closed = self.idle_relay(timeouts)
+        engine = SelectorRelayEngine(logger)
+        engine.start()
+        try:
+            engine.relay(relay)
+            self.assertTrue(closed.wait(REAP_INTERVAL + 5))
+        finally:
+            engine.stop()
+        self.assertEqual(timeouts.stats()['reaped_lifetime'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from unittest import mock
+
+from lib import token_bucket
+from lib.token_bucket import TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch.object(token_bucket.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_starts_full(self):
+        bucket = TokenBucket(10, 5)
+        self.assertEqual(bucket.available(), 5)
+        self.assertTrue(all(bucket.consume() for _ in range(5)))
+        self.assertFalse(bucket.consume())
+
+    def test_default_capacity(self):
+        self.assertEqual(TokenBucket(10).capacity, 10)
+        self.assertEqual(TokenBucket(0.5).capacity, 1)
+
+    def test_refill_up_to_capacity(self):
+        bucket = TokenBucket(10, 5)
+        bucket.consume(5)
+        self.clock.now += 0.2
+        self.assertAlmostEqual(bucket.available(), 2)
+        self.clock.now += 10
+        self.assertEqual(bucket.available(), 5)
+
+    def test_delay(self):
+        bucket = TokenBucket(10, 5)
+        self.assertEqual(bucket.delay(), 0)
+        bucket.consume(5)
+        self.assertAlmostEqual(bucket.delay(3), 0.3)
+
+    def test_take_goes_into_debt(self):
+        bucket = TokenBucket(10, 5)
+        bucket.take(15)
+        self.assertAlmostEqual(bucket.available(), -10)
+        self.assertAlmostEqual(bucket.delay(), 1.1)
+        self.assertFalse(bucket.consume())
+        self.clock.now += 1.2
+        self.assertTrue(bucket.consume())
+
+
+if __name__ == '__main__':
+    unittest.main()
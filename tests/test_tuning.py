@@ -0,0 +1,35 @@
+import logging
+import unittest
+from unittest import mock
+
+from paramiko.common import MIN_WINDOW_SIZE, MIN_PACKET_SIZE
+
+from tunnel_infra import tuning
+from tunnel_infra.tuning import TransportTuning, MAX_TUNED_WINDOW_SIZE
+
+logger = logging.getLogger("test")
+
+
+class TransportTuningTest(unittest.TestCase):
+    def test_invalid_sizes(self):
+        for window_size, max_packet_size in ((0, 32768), (-1, 32768), (65536, 0), (65536, -1), (32768, 65536)):
+            with self.assertRaises(ValueError):
+                TransportTuning(logger, window_size=window_size, max_packet_size=max_packet_size)
+
+    def test_sizes_clamped_to_paramiko_range(self):
+        transport = mock.Mock(sock=None)
+        TransportTuning(logger, window_size=1024, max_packet_size=512).apply(transport)
+        self.assertEqual(transport.default_window_size, MIN_WINDOW_SIZE)
+        self.assertEqual(transport.default_max_packet_size, MIN_PACKET_SIZE)
+
+    def test_auto_tuned_window(self):
+        transport = mock.Mock(sock=None)
+        transport_tuning = TransportTuning(logger, auto_tune=True, link_bandwidth=10 ** 9)
+        with mock.patch.object(tuning, "measure_rtt", return_value=1.0):
+            transport_tuning.apply(transport)
+        self.assertEqual(transport.default_window_size, MAX_TUNED_WINDOW_SIZE)
+        self.assertEqual(transport_tuning.stats()['window_size'], MAX_TUNED_WINDOW_SIZE)
+
+
+if __name__ == '__main__':
+    unittest.main()
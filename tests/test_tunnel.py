@@ -0,0 +1,157 @@
+import logging
+import socket
+import time
+import unittest
+
+from tunnel_infra.Tunnel import Tunnel
+from tunnel_infra.admission import AdmissionControl
+from tunnel_infra.balancer import Recipient, RecipientBalancer
+from tunnel_infra.circuit_breaker import CircuitBreaker, CIRCUIT_CLOSED
+from tunnel_infra.relay import RELAY_ENGINE_SELECTOR
+from tunnel_infra.router import Router
+
+logger = logging.getLogger("test")
+
+
+class FakeChannel:
+    """
+    Stands in for a paramiko ``Channel`` that is never relayed
+    """
+    origin_addr = ("127.0.0.1", 0)
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FailingBalancer:
+    def candidates(self):
+        raise ValueError("no candidates")
+
+
+class FailingRouter(Router):
+    def __init__(self):
+        super().__init__({}, FailingBalancer(), logger)
+
+    def route(self, chan):
+        raise ValueError("routing failed")
+
+
+class StoppedRouter(Router):
+    def __init__(self):
+        super().__init__({}, FailingBalancer(), logger)
+
+    def submit(self, fn, *args):
+        raise RuntimeError("cannot schedule new futures after shutdown")
+
+
+class FailingSocketOptions:
+    def __init__(self):
+        self.socks = []
+
+    def apply(self, sock: socket.socket):
+        self.socks.append(sock)
+        raise OSError("option not supported")
+
+
+def create_tunnel(**kwargs) -> Tunnel:
+    listener = socket.create_server(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+    listener.close()
+    return Tunnel("test", recipient_host="127.0.0.1", recipient_port=port, client=None, port_to_forward=port,
+                  logger=logger, admission=AdmissionControl(logger, max_channels=1), **kwargs)
+
+
+class TunnelHandlerTest(unittest.TestCase):
+    def assert_channel_given_back(self, tunnel: Tunnel, chan: FakeChannel):
+        self.assertTrue(chan.closed)
+        self.assertEqual(tunnel.channels, 0)
+        self.assertEqual(tunnel.admission.active, 0)
+
+    def handle(self, tunnel: Tunnel, handler=None) -> FakeChannel:
+        chan = FakeChannel()
+        # what ``accept_channel`` and ``start_channel`` do before the engine calls the handler
+        tunnel.admission.active += 1
+        tunnel.channels += 1
+        (handler or tunnel.handler)(chan)
+        return chan
+
+    def test_routing_error_closes_channel(self):
+        tunnel = create_tunnel(router=FailingRouter())
+        self.assert_channel_given_back(tunnel, self.handle(tunnel, tunnel.route_channel))
+
+    def test_balancer_error_closes_channel(self):
+        tunnel = create_tunnel(balancer=FailingBalancer())
+        self.assert_channel_given_back(tunnel, self.handle(tunnel))
+
+    def test_unreachable_recipient_closes_channel(self):
+        tunnel = create_tunnel()
+        self.assert_channel_given_back(tunnel, self.handle(tunnel))
+
+    def test_socket_options_error_closes_socket(self):
+        listener = socket.create_server(("127.0.0.1", 0))
+        host, port = listener.getsockname()
+        circuit_breaker = CircuitBreaker(host, port, logger, failure_threshold=1)
+        balancer = RecipientBalancer("test", [Recipient(host, port, circuit_breaker)], logger)
+        socket_options = FailingSocketOptions()
+        tunnel = create_tunnel(balancer=balancer, socket_options=socket_options)
+        try:
+            self.assert_channel_given_back(tunnel, self.handle(tunnel))
+        finally:
+            listener.close()
+        self.assertEqual([each.fileno() for each in socket_options.socks], [-1])
+        # the recipient accepted the connection
+        self.assertEqual(circuit_breaker.failures, 0)
+        self.assertEqual(circuit_breaker.state, CIRCUIT_CLOSED)
+
+    def test_stopped_engine_closes_channel(self):
+        tunnel = create_tunnel(relay_engine=RELAY_ENGINE_SELECTOR)
+        tunnel.relay_engine.start()
+        tunnel.relay_engine.stop()
+        chan = FakeChannel()
+        tunnel.accept_channel(chan)
+        self.assert_channel_given_back(tunnel, chan)
+
+    def test_stopped_router_closes_channel(self):
+        tunnel = create_tunnel(router=StoppedRouter())
+        chan = FakeChannel()
+        tunnel.accept_channel(chan)
+        self.assert_channel_given_back(tunnel, chan)
+
+    def test_stopped_tunnel_closes_channel(self):
+        tunnel = create_tunnel()
+        tunnel.stop()
+        chan = FakeChannel()
+        tunnel.accept_channel(chan)
+        self.assert_channel_given_back(tunnel, chan)
+
+
+class TunnelDrainTest(unittest.TestCase):
+    def test_drain_after_handler_error(self):
+        tunnel = create_tunnel(router=FailingRouter())
+        chan = FakeChannel()
+        tunnel.accept_channel(chan)
+        start = time.monotonic()
+        self.assertEqual(tunnel.drain(5), 0)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertTrue(chan.closed)
+        self.assertEqual(tunnel.admission.active, 0)
+
+    def test_drain_closes_queued_channels(self):
+        tunnel = create_tunnel()
+        # a channel of another tunnel takes the only slot
+        tunnel.admission.admit(FakeChannel(), lambda chan: None)
+        chan = FakeChannel()
+        tunnel.accept_channel(chan)
+        self.assertEqual(tunnel.admission.stats()['queue_depth'], 1)
+        self.assertEqual(tunnel.drain(0), 1)
+        self.assertTrue(chan.closed)
+        self.assertEqual(tunnel.admission.stats()['queue_depth'], 0)
+        # the slot taken by the other tunnel
+        self.assertEqual(tunnel.admission.active, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.ssh_server import LocalSSHServer
+from tunnel_infra.TunnelProcess import TunnelProcess
+
+
+def write_config(directory: str, **options) -> str:
+    path = os.path.join(directory, "connector.ini")
+    values = {
+        "connector_name": "test",
+        "server_host": "127.0.0.1",
+        "server_port": 1,
+        "port": 10000,
+        "username": "test",
+        "keyfile": os.path.join(directory, "missing_key"),
+        "remote_host": "127.0.0.1",
+        "remote_port": 1,
+        "log_level": "CRITICAL",
+        **options,
+    }
+    with open(path, "w") as f:
+        f.write("[connector]\n" + "".join("%s=%s\n" % each for each in values.items()))
+    return path
+
+
+class TunnelProcessForwardTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.default_log_path = TunnelProcess.default_log_path
+        TunnelProcess.default_log_path = self.directory.name
+
+    def tearDown(self):
+        TunnelProcess.default_log_path = self.default_log_path
+        self.directory.cleanup()
+
+    def assert_reports_failure(self, connector: TunnelProcess):
+        reports = []
+        connector.on_ready = reports.append
+        with self.assertRaises(Exception):
+            connector.forward()
+        self.assertEqual(reports, [False])
+
+    def test_connect_failure_is_reported(self):
+        self.assert_reports_failure(TunnelProcess.from_config_file(write_config(self.directory.name)))
+
+    def test_striped_connect_failure_is_reported(self):
+        self.assert_reports_failure(TunnelProcess.from_config_file(write_config(self.directory.name, transports=2)))
+
+
+class TunnelProcessConnectTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.default_log_path = TunnelProcess.default_log_path
+        TunnelProcess.default_log_path = self.directory.name
+        self.server = LocalSSHServer(self.directory.name)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+        TunnelProcess.default_log_path = self.default_log_path
+        self.directory.cleanup()
+
+    def test_connect_with_key_file(self):
+        connector = TunnelProcess.from_config_file(write_config(
+            self.directory.name, server_host=self.server.host, server_port=self.server.port,
+            keyfile=self.server.client_key_file, server_key=self.server.known_hosts_file))
+        client = connector.ssh_connect(exit_on_failure=False)
+        try:
+            self.assertTrue(client.get_transport().is_authenticated())
+        finally:
+            client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import logging
+import threading
+
+from tunnel_infra.Tunnel import Tunnel
+
+
+class PortDispatcher:
+    def __init__(self, logger: logging.Logger):
+        """
+        Handler for the channels of a transport shared by several tunnels. Paramiko keeps a single handler per
+        transport, so the channels are routed to the tunnel that forwards their destination port.
+
+        :param logger: Logger used for channels that don't belong to any tunnel
+        """
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.tunnels: dict[int, Tunnel] = {}
+
+    def register(self, tunnel: Tunnel):
+        with self.lock:
+            self.tunnels[tunnel.port_to_forward] = tunnel
+
+    def unregister(self, tunnel: Tunnel):
+        with self.lock:
+            if self.tunnels.get(tunnel.port_to_forward) is tunnel:
+                del self.tunnels[tunnel.port_to_forward]
+
+    def __call__(self, chan, origin_addr_port, server_addr_port):
+        with self.lock:
+            tunnel = self.tunnels.get(server_addr_port[1])
+        if tunnel is None:
+            self.logger.warning("Rejecting connection from %r to port %d, no connector forwards it",
+                                origin_addr_port, server_addr_port[1])
+            chan.close()
+            return
+        tunnel.accept_channel(chan)
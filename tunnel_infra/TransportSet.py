@@ -0,0 +1,86 @@
+import threading
+from logging import Logger
+
+from paramiko import SSHException
+
+from tunnel_infra.PortDispatcher import PortDispatcher
+from tunnel_infra.Tunnel import Tunnel
+
+
+class TransportSet:
+    def __init__(self, connectors: list, logger: Logger, transports: int = 1):
+        """
+        Forward the ports of several connectors to the same server over one or more SSH transports.
+
+        With a single connector every transport asks for the same port, so the server can spread the incoming
+        connections among them, and transports whose forward is rejected are closed. With several connectors their
+        forwards are spread across the transports.
+
+        :param connectors: ``TunnelProcess`` of each connector, they must share the same ``transport_key``. They are
+            only used for their configuration, the first one is used to connect
+        :param logger: Logger used by every tunnel of the set
+        :param transports: Number of SSH transports to open
+        """
+        self.connectors = connectors
+        self.logger = logger
+        self.transports = max(1, transports)
+        self.clients = []
+        self.tunnels: list[Tunnel] = []
+        self.stopped = threading.Event()
+
+    def start(self):
+        leader = self.connectors[0]
+        striped = len(self.connectors) == 1
+        for i in range(self.transports):
+            client = leader.ssh_connect(exit_on_failure=False)
+            self.clients.append(client)
+            dispatcher = PortDispatcher(self.logger)
+            connectors = self.connectors if striped else self.connectors[i::self.transports]
+            for j, connector in enumerate(connectors):
+                # the transport is checked by its first tunnel only
+                tunnel = connector.create_tunnel(client, logger=self.logger, keep_alive_time=None if j == 0 else 0)
+                dispatcher.register(tunnel)
+                try:
+                    tunnel.open_forward(handler=dispatcher)
+                except SSHException as e:
+                    tunnel.stop()
+                    if striped and i > 0:
+                        self.logger.warning("The server rejected forwarding port %d on more than one transport, "
+                                            "using %d transports: %r", tunnel.port_to_forward, i, e)
+                        client.close()
+                        self.clients.remove(client)
+                        return
+                    raise
+                self.tunnels.append(tunnel)
+                self.logger.info(
+                    "Now forwarding remote port %d to %s:%d through transport %d..."
+                    % (tunnel.port_to_forward, tunnel.recipient_host, tunnel.recipient_port, i)
+                )
+                threading.Thread(target=self._serve, args=(tunnel,), daemon=True).start()
+
+    def _serve(self, tunnel: Tunnel):
+        tunnel.serve()
+        self.stopped.set()
+
+    def wait(self):
+        """
+        Block until any of the tunnels stops, which means that one of the transports is down
+        """
+        self.stopped.wait()
+
+    def stop(self, drain_timeout: float = 0):
+        """
+        :param drain_timeout: Seconds to wait for the channels being relayed to finish, see ``Tunnel.drain``
+        """
+        if drain_timeout:
+            drains = [threading.Thread(target=each.drain, args=(drain_timeout,), daemon=True) for each in self.tunnels]
+            for each in drains:
+                each.start()
+            for each in drains:
+                each.join()
+        for each in self.tunnels:
+            each.stop()
+        self.tunnels = []
+        for each in self.clients:
+            each.close()
+        self.clients = []
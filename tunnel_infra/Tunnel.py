@@ -1,13 +1,25 @@
 import contextlib
 import logging
-import select
-import socket
 import threading
+import time
 
 import paramiko
 from paramiko.client import SSHClient
 
 from alerts.alert_sender import AlertSender
+from observation.heartbeat import ConnectorProgress
+from tunnel_infra.admission import AdmissionControl
+from tunnel_infra.balancer import RecipientBalancer
+from tunnel_infra.keepalive import keep_alive_scheduler
+from tunnel_infra.relay import ChannelRelay, create_relay_engine, RELAY_ENGINE_THREADS, DEFAULT_RELAY_LOOPS, \
+    DEFAULT_RELAY_BUFFER_SIZE, RelayEngineStopped
+from tunnel_infra.router import Router
+from tunnel_infra.shaping import BandwidthShaper
+from tunnel_infra.timeouts import ChannelTimeouts
+from tunnel_infra.tuning import SocketOptions
+
+# seconds that the accept loop waits for a channel before checking the tunnel again
+ACCEPT_TIMEOUT = 10
 
 
 class Tunnel:
@@ -21,7 +33,19 @@ class Tunnel:
         port_to_forward: int,
         logger: logging.Logger,
         keep_alive_time: int = 30,
-        alert_senders: list[AlertSender] | None = None
+        keep_alive_max_time: int | None = None,
+        alert_senders: list[AlertSender] | None = None,
+        relay_engine: str = RELAY_ENGINE_THREADS,
+        relay_loops: int = DEFAULT_RELAY_LOOPS,
+        relay_buffer_size: int = DEFAULT_RELAY_BUFFER_SIZE,
+        relay_buffer_adaptive: bool = True,
+        admission: AdmissionControl | None = None,
+        balancer: RecipientBalancer | None = None,
+        router: Router | None = None,
+        shaper: BandwidthShaper | None = None,
+        socket_options: SocketOptions | None = None,
+        timeouts: ChannelTimeouts | None = None,
+        progress: ConnectorProgress | None = None
     ):
         """
         Create an SSH tunnel by asking the ``client`` to forward the data that it receives in the
@@ -32,6 +56,27 @@ class Tunnel:
         :param recipient_port: Port that's going to receive the data forwarded by the client
         :param client: Client to forward data from
         :param port_to_forward: Port from where the client forwards the data
+        :param keep_alive_time: Time in seconds between checks of the transport, 0 to leave the checks to another
+            tunnel sharing the transport
+        :param keep_alive_max_time: Longest time in seconds between checks, the time between checks grows up to it
+            while the transport is healthy. Four times ``keep_alive_time`` if None
+        :param relay_engine: How channels are relayed, ``threads`` uses a thread per channel and ``selector`` relays
+            every channel from ``relay_loops`` selector loops
+        :param relay_loops: Number of selector loops used by the ``selector`` relay engine
+        :param relay_buffer_size: Size of the buffers used to relay the data of each channel
+        :param relay_buffer_adaptive: Grow the relay buffers up to ``relay_buffer_size`` only when the traffic of the
+            channel requires it
+        :param admission: Limits of the channels relayed, shared by every tunnel of the connector. No limits if None
+        :param balancer: Recipients that receive the channels, shared by every tunnel of the connector. Only
+            recipient_host:recipient_port if None
+        :param router: Chooses the recipients of each channel by the host name it asks for, ``balancer`` receives every
+            channel if None
+        :param shaper: Bandwidth and priority of the channels, shared by every tunnel of the connector. No limits if
+            None
+        :param socket_options: Options of the sockets connected to the recipients, the OS defaults if None
+        :param timeouts: Idle and lifetime timeouts of the channels, shared by every tunnel of the connector. Channels
+            never expire if None
+        :param progress: Marked by the accept loop and watching the keep alive checks, reported to the supervisor
         """
         self.name = name
         self.recipient_host = recipient_host
@@ -40,119 +85,283 @@ class Tunnel:
         self.port_to_forward = port_to_forward
         self.logger = logger
         self.keep_alive_time = keep_alive_time
+        self.keep_alive_max_time = keep_alive_max_time
         self.alert_senders = alert_senders
+        self.relay_engine = create_relay_engine(relay_engine, logger, loops=relay_loops)
+        self.relay_buffer_size = relay_buffer_size
+        self.relay_buffer_adaptive = relay_buffer_adaptive
+        self.admission = admission or AdmissionControl(logger)
+        self.balancer = balancer or RecipientBalancer.single(name, recipient_host, recipient_port, logger)
+        self.router = router
+        self.shaper = shaper
+        self.socket_options = socket_options
+        self.timeouts = timeouts
+        self.progress = progress
 
         self.transport: paramiko.transport.Transport | None = None
-        self.timer: threading.Timer | None = None
+        self.keep_alive = None
         self.failed = False
+        self.draining = False
+        self.stopped = False
+        # channels started by this tunnel and not closed yet, see ``drain``
+        self.channels = 0
+        self.channels_closed = threading.Condition()
 
-    def handler(self, chan, host, port):
+    def handler(self, chan, initial_data: bytes = b"", balancer: RecipientBalancer | None = None):
         """
-        Forward data received through the channel to host:port using a socket and forward data received through the
-        socket to the channel.
+        Forward data received through the channel to a recipient using a socket and forward data received through the
+        socket to the channel. Recipients are tried in the order given by the balancer until one connects.
+
+        :param initial_data: Data already read from the channel by the router, sent to the recipient first
+        :param balancer: Recipients chosen by the router, ``self.balancer`` if None
         """
-        with socket.socket() as sock:
+        try:
+            recipient, sock = self.connect_recipient(balancer or self.balancer)
+        except Exception as e:
+            # nothing relays the channel, so its admission slot and its count are given back here
+            self.logger.exception("Failed to choose a recipient for connection from %r: %r", chan.origin_addr, e)
+            recipient, sock = None, None
+
+        if recipient is None:
+            self.refuse_channel(chan, "no recipient could receive it")
+            return
+
+        recipient.acquire()
+
+        def on_close():
+            recipient.release()
+            self.admission.release()
+            self.channel_closed()
+
+        relay = ChannelRelay(chan, sock, self.logger, buffer_size=self.relay_buffer_size,
+                             adaptive_buffer=self.relay_buffer_adaptive, on_close=on_close, initial_data=initial_data,
+                             shaper=self.shaper.channel() if self.shaper else None, timeouts=self.timeouts)
+        try:
+            self.logger.debug(
+                "Connected!  Connector open %r -> %r -> %r",
+                chan.origin_addr,
+                chan.getpeername(),
+                (recipient.host, recipient.port),
+            )
+        except OSError as e:
+            # the transport was closed while connecting to the recipient
+            self.logger.debug(e)
+            relay.close()
+            return
+        self.relay_engine.relay(relay)
+
+    def connect_recipient(self, balancer: RecipientBalancer):
+        """
+        Connect to the first recipient of ``balancer`` that accepts the connection
+
+        :return: Recipient and the socket connected to it, both None if no recipient accepted it
+        """
+        recipient, sock = None, None
+        for each in balancer.candidates():
+            if not each.circuit_breaker.allow():
+                continue
             try:
-                sock.settimeout(2)
-                sock.connect((host, port))
+                sock = each.connect()
             except Exception as e:
+                if isinstance(e, TimeoutError) and self.timeouts:
+                    self.timeouts.connect_timed_out()
                 self.logger.exception(
-                    "Forwarding request to %s:%d failed: %r" % (host, port, e)
+                    "Forwarding request to %s:%d failed: %r" % (each.host, each.port, e)
                 )
-                if self.alert_senders:
+                # alert once when the recipient goes down instead of once per connection
+                if each.circuit_breaker.record_failure(e) and self.alert_senders:
                     message = (
                         "Failed to Establish connection to %s:%d with error: %r"
-                        % (host, port, e)
+                        % (each.host, each.port, e)
                     )
-                    for each in self.alert_senders:
+                    for sender in self.alert_senders:
                         try:
-                            each.send_alert(self.name, message=message)
+                            sender.send_alert(self.name, message=message)
                         except Exception as e:
                             self.logger.exception("Failed to send alert: %r", e)
-                return
+                continue
+            # the recipient accepted the connection, failing to set the options is not its failure
+            each.circuit_breaker.record_success()
+            if self.socket_options:
+                try:
+                    self.socket_options.apply(sock)
+                except Exception as e:
+                    sock.close()
+                    sock = None
+                    self.logger.exception("Failed to set the options of the socket connected to %s:%d: %r",
+                                          each.host, each.port, e)
+                    continue
+            recipient = each
+            break
+        return recipient, sock
 
-            self.logger.debug(
-                "Connected!  Connector open %r -> %r -> %r",
-                chan.origin_addr,
-                chan.getpeername(),
-                (host, port),
-            )
-            try:
-                while True:
-                    r, w, x = select.select([sock, chan], [], [])
-                    if sock in r:
-                        data = sock.recv(1024)
-                        if len(data) == 0:
-                            break
-                        chan.send(data)
-                    if chan in r:
-                        data = chan.recv(1024)
-                        if len(data) == 0:
-                            break
-                        sock.send(data)
-                chan.close()
-                self.logger.debug("Connector closed from %r", chan.origin_addr)
-            except ConnectionResetError as e:
-                self.logger.debug(e)
-            except Exception as e:
-                self.logger.exception(e)
+    def on_transport_down(self):
+        """
+        Called by the keep alive scheduler when the transport fails its checks, stops serving the tunnel
+        """
+        self.failed = True
+        # wakes up ``serve`` and any other tunnel sharing the transport
+        transport = self.transport
+        if transport:
+            with contextlib.suppress(Exception):
+                transport.close()
 
-    def validate_tunnel_up(self):
-        # we use multiple methods as some methods for checking if the connection is active return false positives
-        self.logger.debug("Going to check if connector is up")
+    def accept_channel(self, chan):
+        """
+        Relay a channel opened by the server for a connection to ``port_to_forward`` once ``admission`` allows it
+        """
+        self.admission.admit(chan, self.start_channel)
+
+    def start_channel(self, chan):
+        with self.channels_closed:
+            self.channels += 1
+        if self.stopped:
+            # the channel waited for admission until the tunnel was stopped
+            self.refuse_channel(chan, "the tunnel is stopped")
+            return
         try:
-            self.transport.send_ignore()
+            if self.router:
+                self.router.submit(self.route_channel, chan)
+            else:
+                self.connect_channel(chan)
         except Exception as e:
-            self.logger.exception("Connector down! %s", e)
-            self.failed = True
-            return
+            self.logger.exception("Failed to start connection from %r: %r", chan.origin_addr, e)
+            self.refuse_channel(chan, "it couldn't be started")
 
-        if not self.transport.is_active():
-            self.logger.exception("Connector down! Transport is not active")
-            self.failed = True
-            return
+    def route_channel(self, chan):
+        """
+        Choose the recipients of a channel by its first bytes, from a worker of the router
+        """
         try:
-            chn = self.transport.open_session(timeout=30)
-            chn.close()
+            initial_data, balancer = self.router.route(chan)
         except Exception as e:
-            self.logger.exception(
-                "Connector down! Failed to start a check session %s with timeout 30 seconds",
-                e,
-            )
-            self.failed = True
+            self.logger.exception("Failed to route connection from %r: %r", chan.origin_addr, e)
+            self.refuse_channel(chan, "it couldn't be routed")
             return
-        self.timer = threading.Timer(self.keep_alive_time, self.validate_tunnel_up)
-        self.timer.start()
+        self.connect_channel(chan, initial_data, balancer)
+
+    def connect_channel(self, chan, initial_data: bytes = b"", balancer: RecipientBalancer | None = None):
+        """
+        Connect the channel to a recipient and relay it, see ``handler``
+        """
+        try:
+            self.relay_engine.submit(self.handler, chan, initial_data, balancer)
+        except RelayEngineStopped as e:
+            self.refuse_channel(chan, e)
+
+    def refuse_channel(self, chan, reason):
+        """
+        Close a channel started by ``start_channel`` that won't be relayed, giving back its admission slot
+        """
+        chan.close()
+        self.admission.release()
+        self.channel_closed()
+        self.logger.debug("Closed connection from %r, %s", chan.origin_addr, reason)
+
+    def channel_closed(self):
+        with self.channels_closed:
+            self.channels -= 1
+            self.channels_closed.notify_all()
+
+    def open_forward(self, handler=None):
+        """
+        Ask the server to forward ``port_to_forward`` and start checking the transport.
+
+        :param handler: Handler given to the transport for the incoming channels when the transport is shared with
+            other tunnels, see ``PortDispatcher``. Without it the channels are taken from the transport accept queue
+        :raises paramiko.SSHException: if the server rejects the forward
+        """
+        # get a connection to the client
+        self.transport = self.client.get_transport()
+        self.relay_engine.start()
+
+        # ask client to forward the data that it receives in the `port_to_forward` through this SSH session
+        self.transport.request_port_forward("", self.port_to_forward, handler=handler)
+
+        if self.keep_alive_time:
+            self.keep_alive = keep_alive_scheduler().register(
+                self.transport, self.keep_alive_time, self.on_transport_down, self.logger,
+                max_interval=self.keep_alive_max_time
+            )
+            if self.progress:
+                self.progress.watch_keep_alive(self.keep_alive)
 
-    def reverse_forward_tunnel(self):
+    def serve(self):
+        """
+        Relay the channels of the forward until the tunnel fails
+        """
         try:
-            # get a connection to the client
-            self.transport = self.client.get_transport()
-
-            # ask client to forward the data that it receives in the `port_to_forward` through this SSH session
-            self.transport.request_port_forward("", self.port_to_forward)
-
-            self.timer = threading.Timer(30, self.validate_tunnel_up)
-            self.timer.start()
-            while True:
-                chan = self.transport.accept(10)
-                if self.failed:
-                    return
+            # the transport wakes up accept when it's closed
+            while not self.failed and not self.draining and self.transport.is_active():
+                if self.progress:
+                    self.progress.mark(ACCEPT_TIMEOUT)
+                chan = self.transport.accept(ACCEPT_TIMEOUT)
                 if chan is None:
                     continue
-                thr = threading.Thread(
-                    target=self.handler,
-                    args=(chan, self.recipient_host, self.recipient_port),
-                    daemon=True,
-                )
-                thr.start()
+                self.accept_channel(chan)
+        except Exception as e:
+            self.logger.exception("Failed to forward")
+
+    def reverse_forward_tunnel(self, handler=None, on_forward=None):
+        """
+        Forward ``port_to_forward`` and relay its connections until the tunnel fails, see ``open_forward``
+
+        :param on_forward: Called with True once the server forwards the port, or with False if it can't be forwarded
+        """
+        try:
+            self.open_forward(handler)
         except Exception as e:
             self.logger.exception("Failed to forward")
+            if on_forward:
+                on_forward(False)
+            return
+        if on_forward:
+            on_forward(True)
+        self.serve()
+
+    def drain(self, timeout: float) -> int:
+        """
+        Stop forwarding the port, so the server doesn't open new channels through this tunnel, and wait up to
+        ``timeout`` seconds for the channels being relayed to finish before stopping the tunnel
+
+        :return: Channels cut because they were still open or waiting for admission after ``timeout``
+        """
+        self.draining = True
+        transport = self.transport
+        if transport and transport.is_active():
+            with contextlib.suppress(Exception):
+                # cancel_port_forward also drops the handler of the transport, which other tunnels may be using
+                transport.global_request("cancel-tcpip-forward", ("", self.port_to_forward), wait=True)
+            # channels opened before the server stopped forwarding
+            chan = transport.accept(0)
+            while chan is not None:
+                self.accept_channel(chan)
+                chan = transport.accept(0)
+        deadline = time.monotonic() + timeout
+        with self.channels_closed:
+            if self.channels:
+                self.logger.info("Draining %d connections of port %d", self.channels, self.port_to_forward)
+            while self.channels and time.monotonic() < deadline:
+                self.channels_closed.wait(deadline - time.monotonic())
+            remaining = self.channels
+        # channels still waiting for admission would be started once the tunnel is stopped
+        remaining += self.admission.discard(self.start_channel)
+        if remaining:
+            self.logger.warning("Closing %d connections of port %d still open after %d seconds", remaining,
+                                self.port_to_forward, timeout)
+        self.stop()
+        return remaining
 
     def stop(self):
-        if self.timer:
-            self.timer.cancel()
-            self.timer = None
+        self.stopped = True
+        self.admission.discard(self.start_channel)
+        if self.keep_alive:
+            keep_alive_scheduler().unregister(self.keep_alive)
+            if self.progress:
+                self.progress.forget_keep_alive(self.keep_alive)
+            self.keep_alive = None
+
+        self.relay_engine.stop()
 
         if self.transport:
             with contextlib.suppress(Exception):
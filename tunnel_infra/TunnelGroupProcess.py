@@ -0,0 +1,95 @@
+import multiprocessing
+import os
+import signal
+import sys
+from logging import Logger
+from typing import Callable
+
+from alerts.alert_sender import AlertSender
+from tunnel_infra.TransportSet import TransportSet
+from tunnel_infra.TunnelProcess import TunnelProcess
+
+
+class TunnelGroupProcess(multiprocessing.Process):
+
+    def __init__(self, connectors: list[TunnelProcess]) -> None:
+        """
+        Run several connectors over a single SSH transport, or over ``transports`` of the first connector. The
+        connectors must share the same ``transport_key``, the first one is used to connect and to log for the whole
+        group.
+
+        :param connectors: Connectors of the group. They are only used for their configuration, they are not started
+        """
+        self.connectors = connectors
+        self.leader = connectors[0]
+        self.tunnel_name = ", ".join(each.tunnel_name for each in connectors)
+        self.server_host = self.leader.server_host
+        self.server_port = self.leader.server_port
+        # the leader makes the handshakes of the whole group
+        self.leader.handshake_priority = max(each.handshake_priority for each in connectors)
+        self.transport_set: TransportSet | None = None
+        # told once whether the ports could be forwarded, see ``ReadySignal``
+        self.on_ready: Callable[[bool], None] | None = None
+
+        super().__init__()
+
+    @property
+    def logger(self) -> Logger:
+        return self.leader.logger
+
+    def exit_gracefully(self, *args):
+        self.logger.info("Exit gracefully called for %s", os.getpid())
+        self.stop_forwarding(self.leader.drain_timeout)
+        sys.exit(0)
+
+    def stop_forwarding(self, drain_timeout: float = 0):
+        if self.transport_set:
+            self.transport_set.stop(drain_timeout)
+            self.transport_set = None
+
+    def report_forwarding(self, forwarding: bool = True):
+        """
+        Tell ``on_ready`` whether the ports could be forwarded the first time
+        """
+        if self.on_ready:
+            on_ready, self.on_ready = self.on_ready, None
+            on_ready(forwarding)
+
+    @property
+    def handshake_priority(self) -> int:
+        return self.leader.handshake_priority
+
+    def run(self):
+        self.logger.info("Starting TunnelGroupProcess for %s with the process id: %s", self.tunnel_name, os.getpid())
+        signal.signal(signal.SIGINT, self.exit_gracefully)
+        signal.signal(signal.SIGTERM, self.exit_gracefully)
+        self.forward_forever()
+
+    def forward_forever(self):
+        for each in self.connectors:
+            # the reconnect loop of the leader reconnects the whole group
+            each.progress = self.leader.progress
+            each.prepare_forwarding()
+        self.leader.stagger_start()
+        self.leader.reconnect_loop(self.forward)
+
+    def forward(self):
+        """
+        Connect to the server and forward the ports of every connector until the connection is lost
+        """
+        self.transport_set = TransportSet(self.connectors, self.logger, transports=self.leader.transports)
+        try:
+            self.transport_set.start()
+            self.report_forwarding()
+            # a failure of any tunnel means that its transport is down
+            self.transport_set.wait()
+        finally:
+            # a rotation doesn't wait for a group that failed before forwarding, once forwarding this does nothing
+            self.report_forwarding(False)
+            if self.transport_set:
+                self.transport_set.stop()
+                self.transport_set = None
+
+    @staticmethod
+    def from_config_files(ini_files: list[str], alert_senders: list[AlertSender] = None):
+        return TunnelGroupProcess([TunnelProcess.from_config_file(each, alert_senders) for each in ini_files])
@@ -1,27 +1,63 @@
 import configparser
+import contextlib
 import multiprocessing
 import os
 import signal
 import sys
+import time
 from functools import cached_property
 from logging import Logger
+from typing import Callable
 
 import paramiko
+from paramiko.common import DEFAULT_WINDOW_SIZE, DEFAULT_MAX_PACKET_SIZE
 
 from alerts.alert_sender import AlertSender
 from configure_logger import LogManager
+from lib import create_connection
+from observation.heartbeat import ConnectorProgress, heartbeat_reporter
+from observation.stats import stats_reporter
 from os.path import isabs, dirname, realpath, join
 
+from tunnel_infra.TransportSet import TransportSet
+from tunnel_infra.admission import AdmissionControl, DEFAULT_CHANNEL_QUEUE_SIZE, DEFAULT_CHANNEL_QUEUE_TIMEOUT
 from tunnel_infra.Tunnel import Tunnel
+from tunnel_infra.backoff import Backoff
+from tunnel_infra.balancer import RecipientBalancer, Recipient, parse_recipients, BALANCING_ROUND_ROBIN, \
+    BALANCING_STRATEGIES, DEFAULT_HEALTH_CHECK_INTERVAL
+from tunnel_infra.handshake import HandshakeScheduler
+from tunnel_infra.circuit_breaker import CircuitBreaker, DEFAULT_CIRCUIT_FAILURE_THRESHOLD, \
+    DEFAULT_CIRCUIT_RECOVERY_TIME
+from tunnel_infra.keepalive import ProbedTransport
+from tunnel_infra.recipient_pool import RecipientPool, DEFAULT_RECIPIENT_POOL_IDLE_TIME, RECIPIENT_CONNECT_TIMEOUT
+from tunnel_infra.relay import RELAY_ENGINE_THREADS, RELAY_ENGINES, DEFAULT_RELAY_LOOPS, DEFAULT_RELAY_BUFFER_SIZE
+from tunnel_infra.router import Router, DEFAULT_SNIFF_TIMEOUT
+from tunnel_infra.shaping import BandwidthShaper, PRIORITIES, PRIORITY_NORMAL
+from tunnel_infra.ssh_algorithms import parse_algorithms, apply_algorithms
+from tunnel_infra.timeouts import ChannelTimeouts
+from tunnel_infra.tuning import SocketOptions, TransportTuning, DEFAULT_LINK_BANDWIDTH, check_ssh_sizes
 
 DEFAULT_KEEP_ALIVE_TIME = 30
+DEFAULT_RECONNECT_ATTEMPTS = 10
+DEFAULT_RECONNECT_MIN_DELAY = 1
+DEFAULT_RECONNECT_MAX_DELAY = 60
+DEFAULT_DRAIN_TIMEOUT = 30
 
 SSH_PORT = 22
+SSH_CONNECT_TIMEOUT = 10
 DEFAULT_PORT = 4000
 
 
 class TunnelProcess(multiprocessing.Process):
     default_log_path = './logs'
+    # set when the connector runs in a process with other connectors, see ``TunnelWorkerProcess``
+    shares_process = False
+    # queue where the connectors send their stats to the supervisor, see ``StatsReporter``
+    default_stats_queue = None
+    # queue where the connectors send their heartbeats to the supervisor, see ``Watchdog``
+    default_heartbeat_queue = None
+    # limits the SSH handshakes of every connector process, see ``HandshakeScheduler``
+    default_handshake_scheduler = None
 
     def __init__(
             self,
@@ -40,7 +76,53 @@ class TunnelProcess(multiprocessing.Process):
             log_to_console: bool,
             log_filename: str = None,
             log_path: str = None,
-            alert_senders: list[AlertSender] = None
+            alert_senders: list[AlertSender] = None,
+            relay_engine: str = RELAY_ENGINE_THREADS,
+            relay_loops: int = DEFAULT_RELAY_LOOPS,
+            relay_buffer_size: int = DEFAULT_RELAY_BUFFER_SIZE,
+            relay_buffer_adaptive: bool = True,
+            transports: int = 1,
+            ciphers: tuple[str, ...] = None,
+            macs: tuple[str, ...] = None,
+            kex: tuple[str, ...] = None,
+            compression: bool = False,
+            keep_alive_max_time: int = None,
+            reconnect_attempts: int = DEFAULT_RECONNECT_ATTEMPTS,
+            reconnect_min_delay: float = DEFAULT_RECONNECT_MIN_DELAY,
+            reconnect_max_delay: float = DEFAULT_RECONNECT_MAX_DELAY,
+            max_channels: int = 0,
+            accept_rate: float = 0,
+            accept_burst: float = None,
+            channel_queue_size: int = DEFAULT_CHANNEL_QUEUE_SIZE,
+            channel_queue_timeout: float = DEFAULT_CHANNEL_QUEUE_TIMEOUT,
+            config_file: str = None,
+            stats_queue=None,
+            heartbeat_queue=None,
+            handshake_scheduler: HandshakeScheduler = None,
+            handshake_priority: int = 0,
+            recipient_pool_size: int = 0,
+            recipient_pool_idle_time: float = DEFAULT_RECIPIENT_POOL_IDLE_TIME,
+            circuit_failure_threshold: int = DEFAULT_CIRCUIT_FAILURE_THRESHOLD,
+            circuit_recovery_time: float = DEFAULT_CIRCUIT_RECOVERY_TIME,
+            recipients: list[tuple[str, int]] = None,
+            balancing: str = BALANCING_ROUND_ROBIN,
+            health_check_interval: float = DEFAULT_HEALTH_CHECK_INTERVAL,
+            routes: dict[str, list[tuple[str, int]]] = None,
+            sniff_timeout: float = DEFAULT_SNIFF_TIMEOUT,
+            bandwidth_limit: float = 0,
+            channel_bandwidth_limit: float = 0,
+            priority: str = PRIORITY_NORMAL,
+            tcp_nodelay: bool = False,
+            tcp_keepalive: bool = False,
+            socket_buffer_size: int = 0,
+            ssh_window_size: int = DEFAULT_WINDOW_SIZE,
+            ssh_max_packet_size: int = DEFAULT_MAX_PACKET_SIZE,
+            auto_tune: bool = False,
+            link_bandwidth: float = None,
+            idle_timeout: float = 0,
+            max_lifetime: float = 0,
+            connect_timeout: float = RECIPIENT_CONNECT_TIMEOUT,
+            drain_timeout: float = DEFAULT_DRAIN_TIMEOUT
     ) -> None:
         """
 
@@ -56,6 +138,66 @@ class TunnelProcess(multiprocessing.Process):
         :param recipient_host: Host that's going to receive the data forwarded by the server
         :param recipient_port: Port that's going to receive the data forwarded by the server
         :param keep_alive_time: Time in seconds to check that the tunnel is working
+        :param relay_engine: Engine used to relay the channels of the tunnel, ``threads`` or ``selector``
+        :param relay_loops: Number of selector loops used by the ``selector`` relay engine
+        :param relay_buffer_size: Size of the buffers used to relay the data of each connection
+        :param relay_buffer_adaptive: Start with small relay buffers and grow them up to ``relay_buffer_size``
+        :param transports: Number of SSH transports used to forward the port, to spread the encryption of a busy
+            connector across several connections
+        :param ciphers: Ciphers to offer to the server in preference order, paramiko defaults if None
+        :param macs: MACs to offer to the server in preference order, paramiko defaults if None
+        :param kex: Key exchange algorithms to offer to the server in preference order, paramiko defaults if None
+        :param compression: Ask the server to compress the SSH traffic
+        :param keep_alive_max_time: Longest time in seconds between checks of a healthy tunnel, four times
+            ``keep_alive_time`` if None
+        :param reconnect_attempts: Consecutive failed reconnections before the process exits to be started again by
+            the supervisor, 0 to exit as soon as the connection is lost
+        :param reconnect_min_delay: Seconds to wait before the first reconnection
+        :param reconnect_max_delay: Longest time in seconds between reconnections, a connection that stays up longer
+            than this resets the delay and the count of attempts
+        :param max_channels: Connections relayed at the same time, 0 for no limit
+        :param accept_rate: Connections accepted per second, 0 for no limit
+        :param accept_burst: Connections accepted at once above ``accept_rate``, ``accept_rate`` if None
+        :param channel_queue_size: Connections that can wait for the limits, more connections are closed right away
+        :param channel_queue_timeout: Seconds a connection can wait for the limits before it's closed
+        :param config_file: Configuration file of the connector, its stats are reported with this name
+        :param stats_queue: Queue to send the stats of the connector to the supervisor, ``default_stats_queue`` if None
+        :param heartbeat_queue: Queue to send the heartbeats of the connector to the supervisor,
+            ``default_heartbeat_queue`` if None
+        :param handshake_scheduler: Limits the SSH handshakes made at the same time by every connector,
+            ``default_handshake_scheduler`` if None
+        :param handshake_priority: Connectors with a higher priority connect first when several wait for a handshake
+        :param recipient_pool_size: Idle connections to the recipient kept open to relay new connections right away, 0
+            to connect to the recipient for each connection
+        :param recipient_pool_idle_time: Seconds an idle connection to the recipient is kept open
+        :param circuit_failure_threshold: Consecutive failed connections to the recipient after which connections are
+            closed right away until it's reachable again, 0 to always connect
+        :param circuit_recovery_time: Seconds before checking again a recipient that is down
+        :param recipients: Every recipient that receives the connections, only recipient_host:recipient_port if None
+        :param balancing: How connections are spread among the recipients, see ``RecipientBalancer``
+        :param health_check_interval: Seconds between health checks of the recipients when there are several, 0 to
+            rely only on failed connections
+        :param routes: Recipients by the host name asked for by each connection (TLS SNI or HTTP Host), connections
+            that don't match any route go to ``recipients``. See ``Router``
+        :param sniff_timeout: Seconds to wait for the first bytes of a connection to route it
+        :param bandwidth_limit: Bytes per second relayed by all the connections of the connector, 0 for no limit
+        :param channel_bandwidth_limit: Bytes per second relayed by each connection, 0 for no limit
+        :param priority: Priority class of the connections when writing into the SSH transports of the process, see
+            ``BandwidthShaper``
+        :param tcp_nodelay: Disable Nagle's algorithm on the sockets to the server and the recipients
+        :param tcp_keepalive: Enable TCP keep alive on the sockets to the server and the recipients
+        :param socket_buffer_size: Send and receive buffer size of the sockets in bytes, 0 for the OS default
+        :param ssh_window_size: SSH window of the channels opened by the server, in bytes
+        :param ssh_max_packet_size: Largest SSH packet of the channels opened by the server, in bytes
+        :param auto_tune: Grow the SSH window and the socket buffers to the bandwidth-delay product of the link to the
+            server, measured after connecting. See ``TransportTuning``
+        :param link_bandwidth: Bandwidth in bytes per second used by ``auto_tune``, ``bandwidth_limit`` or 100 Mbit/s
+            if None
+        :param idle_timeout: Seconds without data after which a connection is closed, 0 for never
+        :param max_lifetime: Seconds after which a connection is closed even if it's busy, 0 for never
+        :param connect_timeout: Seconds to connect to a recipient
+        :param drain_timeout: Seconds that a stopped connector waits for its connections to finish, 0 to close them
+            right away
         """
         self.tunnel_name = tunnel_name
         self.server_host = server_host
@@ -68,6 +210,54 @@ class TunnelProcess(multiprocessing.Process):
         self.recipient_port = recipient_port
         self.keep_alive_time = keep_alive_time
         self.alert_senders = alert_senders
+        self.relay_engine = relay_engine
+        self.relay_loops = relay_loops
+        self.relay_buffer_size = relay_buffer_size
+        self.relay_buffer_adaptive = relay_buffer_adaptive
+        self.transports = transports
+        self.ciphers = ciphers
+        self.macs = macs
+        self.kex = kex
+        self.compression = compression
+        self.keep_alive_max_time = keep_alive_max_time
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_min_delay = reconnect_min_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.max_channels = max_channels
+        self.accept_rate = accept_rate
+        self.accept_burst = accept_burst
+        self.channel_queue_size = channel_queue_size
+        self.channel_queue_timeout = channel_queue_timeout
+        self.config_file = config_file
+        self.stats_queue = stats_queue if stats_queue is not None else TunnelProcess.default_stats_queue
+        self.heartbeat_queue = (heartbeat_queue if heartbeat_queue is not None
+                                else TunnelProcess.default_heartbeat_queue)
+        self.handshake_scheduler = (handshake_scheduler if handshake_scheduler is not None
+                                    else TunnelProcess.default_handshake_scheduler)
+        self.handshake_priority = handshake_priority
+        self.recipient_pool_size = recipient_pool_size
+        self.recipient_pool_idle_time = recipient_pool_idle_time
+        self.circuit_failure_threshold = circuit_failure_threshold
+        self.circuit_recovery_time = circuit_recovery_time
+        self.recipients = recipients or [(recipient_host, recipient_port)]
+        self.balancing = balancing
+        self.health_check_interval = health_check_interval
+        self.routes = routes or {}
+        self.sniff_timeout = sniff_timeout
+        self.bandwidth_limit = bandwidth_limit
+        self.channel_bandwidth_limit = channel_bandwidth_limit
+        self.priority = priority
+        self.tcp_nodelay = tcp_nodelay
+        self.tcp_keepalive = tcp_keepalive
+        self.socket_buffer_size = socket_buffer_size
+        self.ssh_window_size = ssh_window_size
+        self.ssh_max_packet_size = ssh_max_packet_size
+        self.auto_tune = auto_tune
+        self.link_bandwidth = link_bandwidth or bandwidth_limit or DEFAULT_LINK_BANDWIDTH
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.connect_timeout = connect_timeout
+        self.drain_timeout = drain_timeout
 
         self.log_level = log_level
         self.log_to_console = log_to_console
@@ -79,60 +269,286 @@ class TunnelProcess(multiprocessing.Process):
         )
 
         self.tunnel: Tunnel | None = None
+        self.transport_set: TransportSet | None = None
+        # told once whether the port could be forwarded, see ``ReadySignal``
+        self.on_ready: Callable[[bool], None] | None = None
 
         super().__init__()
 
     @cached_property
     def logger(self) -> Logger:
+        # connectors sharing a process need loggers of their own, the paramiko logs go to the log of the process
         return LogManager.configure_logger(
             self.log_filename,
             self.log_level,
             self.log_to_console,
-            name="connector",
-            path=self.log_path
+            name="connector.%s" % os.path.splitext(self.log_filename)[0] if self.shares_process else "connector",
+            path=self.log_path,
+            paramiko_logs=not self.shares_process
         )
 
     def exit_gracefully(self, *args):
-        self.logger.info("Exit gracefully called for %s", self.pid)
+        self.logger.info("Exit gracefully called for %s", os.getpid())
+        self.stop_forwarding(self.drain_timeout)
+        sys.exit(0)
+
+    def stop_forwarding(self, drain_timeout: float = 0):
+        """
+        :param drain_timeout: Seconds to wait for the connections being relayed to finish, see ``Tunnel.drain``
+        """
         if self.tunnel:
-            self.tunnel.stop()
+            if drain_timeout:
+                self.tunnel.drain(drain_timeout)
+            else:
+                self.tunnel.stop()
             self.tunnel = None
-        sys.exit(0)
+        if self.transport_set:
+            self.transport_set.stop(drain_timeout)
+            self.transport_set = None
+
+    def report_forwarding(self, forwarding: bool = True):
+        """
+        Tell ``on_ready`` whether the ports could be forwarded the first time. Every way of failing before forwarding
+        reports False, so a rotation doesn't wait ``ROTATION_READY_TIMEOUT`` for it
+        """
+        if self.on_ready:
+            on_ready, self.on_ready = self.on_ready, None
+            on_ready(forwarding)
 
     def run(self):
-        self.logger.info("Starting TunnelProcess with the process id: %s", self.pid)
+        self.logger.info("Starting TunnelProcess with the process id: %s", os.getpid())
         signal.signal(signal.SIGINT, self.exit_gracefully)
         signal.signal(signal.SIGTERM, self.exit_gracefully)
-        client = self.ssh_connect()
+        self.forward_forever()
+
+    def forward_forever(self):
+        self.prepare_forwarding()
+        self.stagger_start()
+        self.reconnect_loop(self.forward)
+
+    def prepare_forwarding(self):
+        """
+        Start what the connector keeps across reconnections
+        """
+        self.report_stats()
+        self.report_heartbeats()
+        self.balancer.start()
+        if self.router:
+            self.router.start()
+
+    @cached_property
+    def balancer(self) -> RecipientBalancer:
+        """
+        Recipients of the connector with their circuit breakers and pools, kept across reconnections
+        """
+        return self.create_balancer(self.recipients)
+
+    @cached_property
+    def router(self) -> Router | None:
+        if not self.routes:
+            return None
+        return Router({pattern: self.create_balancer(recipients) for pattern, recipients in self.routes.items()},
+                      self.balancer, self.logger, sniff_timeout=self.sniff_timeout)
+
+    @cached_property
+    def shaper(self) -> BandwidthShaper:
+        return BandwidthShaper(self.bandwidth_limit, self.channel_bandwidth_limit, self.priority)
+
+    @cached_property
+    def timeouts(self) -> ChannelTimeouts:
+        return ChannelTimeouts(self.idle_timeout, self.max_lifetime, self.connect_timeout)
+
+    @cached_property
+    def tuning(self) -> TransportTuning:
+        """
+        Settings of the sockets and the SSH windows, tuned again on each connection
+        """
+        socket_options = SocketOptions(self.tcp_nodelay, self.tcp_keepalive, self.socket_buffer_size)
+        return TransportTuning(self.logger, window_size=self.ssh_window_size, max_packet_size=self.ssh_max_packet_size,
+                               auto_tune=self.auto_tune, link_bandwidth=self.link_bandwidth,
+                               socket_options=socket_options)
+
+    def create_balancer(self, recipients: list[tuple[str, int]]) -> RecipientBalancer:
+        balanced = []
+        for host, port in recipients:
+            breaker = CircuitBreaker(host, port, self.logger, failure_threshold=self.circuit_failure_threshold,
+                                     recovery_time=self.circuit_recovery_time, connect_timeout=self.connect_timeout)
+            pool = None
+            if self.recipient_pool_size:
+                pool = RecipientPool(host, port, self.logger, self.recipient_pool_size,
+                                     max_idle_time=self.recipient_pool_idle_time, connect_timeout=self.connect_timeout)
+            balanced.append(Recipient(host, port, breaker, pool, connect_timeout=self.connect_timeout))
+        return RecipientBalancer(self.tunnel_name, balanced, self.logger, strategy=self.balancing,
+                                 health_check_interval=self.health_check_interval)
+
+    @cached_property
+    def admission(self) -> AdmissionControl:
+        """
+        Limits of the connections of the connector, shared by all its tunnels and kept across reconnections
+        """
+        return AdmissionControl(self.logger, max_channels=self.max_channels, accept_rate=self.accept_rate,
+                                accept_burst=self.accept_burst, queue_size=self.channel_queue_size,
+                                queue_timeout=self.channel_queue_timeout)
+
+    def stats(self) -> dict:
+        stats = {'admission': self.admission.stats(), 'recipients': self.balancer.stats(),
+                 'bandwidth': self.shaper.stats(), 'tuning': self.tuning.stats(), 'timeouts': self.timeouts.stats()}
+        if self.router:
+            stats['router'] = self.router.stats()
+        return stats
+
+    def report_stats(self):
+        """
+        Send the stats of the connector to the supervisor periodically, if it's listening
+        """
+        if self.stats_queue is not None and self.config_file:
+            stats_reporter(self.stats_queue).register(self.config_file, self.stats)
+
+    @cached_property
+    def progress(self) -> ConnectorProgress:
+        """
+        Progress of the accept and reconnect loops of the connector, kept across reconnections
+        """
+        return ConnectorProgress()
+
+    def report_heartbeats(self):
+        """
+        Send the progress of the connector to the supervisor periodically, if it's watching
+        """
+        if self.heartbeat_queue is not None and self.config_file:
+            heartbeat_reporter(self.heartbeat_queue).register(self.config_file, self.progress.heartbeat)
+
+    def stagger_start(self):
+        """
+        Wait a random time before the first handshake, so connectors started together don't all connect at once
+        """
+        offset = self.handshake_scheduler.start_offset() if self.handshake_scheduler else 0
+        if offset:
+            self.logger.debug("Waiting %.1f seconds before connecting", offset)
+            self.progress.mark(offset)
+            time.sleep(offset)
+
+    def handshake(self):
+        """
+        Context of an SSH handshake, waits until ``handshake_scheduler`` has a slot for it
+        """
+        if self.handshake_scheduler is None:
+            return contextlib.nullcontext()
+        return self.handshake_scheduler.slot(self.handshake_priority, self.logger, self.progress)
+
+    def reconnect_loop(self, forward):
+        """
+        Call ``forward`` again each time the connection is lost, waiting a jittered exponential backoff between calls.
+        Keeps the process, its configuration and its keys while the server comes back. Exits the process after
+        ``reconnect_attempts`` consecutive failures, so the supervisor starts it again
+
+        :param forward: Connects and forwards until the connection is lost, raises if it can't connect
+        """
+        backoff = Backoff(self.reconnect_min_delay, self.reconnect_max_delay)
+        while True:
+            start = time.monotonic()
+            self.progress.mark()
+            try:
+                forward()
+            except KeyboardInterrupt:
+                self.logger.info("Port forwarding stopped.")
+                sys.exit(0)
+            except Exception as e:
+                self.logger.error("Port forwarding stopped with error %r", e)
+            if time.monotonic() - start >= self.reconnect_max_delay:
+                backoff.reset()
+            if backoff.attempts >= self.reconnect_attempts:
+                self.logger.error("Connection lost after %d attempts to reconnect, exiting", backoff.attempts)
+                sys.exit(1)
+            delay = backoff.next_delay()
+            self.logger.info("Connection lost, reconnecting in %.1f seconds (attempt %d of %d)", delay,
+                             backoff.attempts, self.reconnect_attempts)
+            self.progress.mark(delay)
+            time.sleep(delay)
+
+    def forward(self):
+        """
+        Connect to the server and forward the port until the connection is lost
+        """
+        if self.transports > 1:
+            return self.forward_striped()
+        try:
+            client = self.ssh_connect(exit_on_failure=False)
+        except Exception:
+            self.report_forwarding(False)
+            raise
         self.logger.info(
             "Now forwarding remote port %d to %s:%d ..."
             % (self.server_port_to_forward, self.recipient_host, self.recipient_port)
         )
         try:
-            tunnel = Tunnel(
-                self.tunnel_name,
-                port_to_forward=self.server_port_to_forward,
-                recipient_host=self.recipient_host,
-                recipient_port=self.recipient_port,
-                client=client,
-                logger=self.logger,
-                keep_alive_time=self.keep_alive_time,
-                alert_senders=self.alert_senders
-            )
-            self.tunnel = tunnel
-            tunnel.reverse_forward_tunnel()
-            sys.exit(0)
-        except KeyboardInterrupt:
-            self.logger.info("Port forwarding stopped.")
-            sys.exit(0)
-        except Exception as e:
-            self.logger.exception("Port forwarding stopped with error %s", e)
-            sys.exit(1)
+            self.tunnel = self.create_tunnel(client)
+            self.tunnel.reverse_forward_tunnel(on_forward=self.report_forwarding)
         finally:
+            # a rotation doesn't wait for a connector that failed before forwarding, once forwarding this does nothing
+            self.report_forwarding(False)
             if self.tunnel:
                 self.tunnel.stop()
-            if client:
-                client.close()
+                self.tunnel = None
+            client.close()
+
+    def forward_striped(self):
+        """
+        Forward the port through ``transports`` SSH transports until one of them is lost
+        """
+        self.transport_set = TransportSet([self], self.logger, transports=self.transports)
+        try:
+            self.transport_set.start()
+            self.report_forwarding()
+            self.transport_set.wait()
+        finally:
+            # a rotation doesn't wait for a connector that failed before forwarding, once forwarding this does nothing
+            self.report_forwarding(False)
+            if self.transport_set:
+                self.transport_set.stop()
+                self.transport_set = None
+
+    def create_tunnel(self, client, logger: Logger = None, keep_alive_time: int = None) -> Tunnel:
+        """
+        Create the tunnel configured by this connector over an already connected ``client``
+
+        :param logger: Logger of the tunnel, the connector logger by default
+        :param keep_alive_time: Overrides the keep alive time of the connector
+        """
+        return Tunnel(
+            self.tunnel_name,
+            port_to_forward=self.server_port_to_forward,
+            recipient_host=self.recipient_host,
+            recipient_port=self.recipient_port,
+            client=client,
+            logger=logger or self.logger,
+            keep_alive_time=self.keep_alive_time if keep_alive_time is None else keep_alive_time,
+            keep_alive_max_time=self.keep_alive_max_time,
+            alert_senders=self.alert_senders,
+            relay_engine=self.relay_engine,
+            relay_loops=self.relay_loops,
+            relay_buffer_size=self.relay_buffer_size,
+            relay_buffer_adaptive=self.relay_buffer_adaptive,
+            admission=self.admission,
+            balancer=self.balancer,
+            router=self.router,
+            shaper=self.shaper,
+            socket_options=self.tuning.socket_options,
+            timeouts=self.timeouts,
+            progress=self.progress
+        )
+
+    @property
+    def transport_key(self) -> tuple:
+        """
+        Connectors with the same key authenticate the same way against the same server, so they can share a transport
+        """
+        return self.server_host, self.server_port, self.user_to_login, self.key_file, self.server_key
+
+    def create_transport(self, *args, **kwargs) -> paramiko.Transport:
+        transport = ProbedTransport(*args, **kwargs)
+        apply_algorithms(transport, ciphers=self.ciphers, macs=self.macs, kex=self.kex)
+        return transport
 
     def ssh_connect(self, exit_on_failure=True):
         client = None
@@ -144,15 +560,20 @@ class TunnelProcess(multiprocessing.Process):
 
             client.set_missing_host_key_policy(paramiko.RejectPolicy())
             self.logger.info("Connecting to ssh host %s:%d ..." % (self.server_host, self.server_port))
-            client.connect(
-                self.server_host,
-                self.server_port,
-                username=self.user_to_login,
-                key_filename=self.key_file,  # private key of the client, what is called "host key" in SSH
-                look_for_keys=False,
-                allow_agent=False,
-                timeout=10
-            )
+            with self.handshake():
+                client.connect(
+                    self.server_host,
+                    self.server_port,
+                    sock=create_connection((self.server_host, self.server_port), SSH_CONNECT_TIMEOUT),
+                    username=self.user_to_login,
+                    key_filename=self.key_file,  # private key of the client, what is called "host key" in SSH
+                    look_for_keys=False,
+                    allow_agent=False,
+                    timeout=SSH_CONNECT_TIMEOUT,
+                    compress=self.compression,
+                    transport_factory=self.create_transport
+                )
+            self.tuning.apply(client.get_transport())
         except Exception as e:
             self.logger.info("Failed to connect to %s:%d: %r" % (self.server_host, self.server_port, e))
 
@@ -182,6 +603,38 @@ class TunnelProcess(multiprocessing.Process):
         if server_key is not None and not isabs(server_key):
             server_key = join(directory, server_key)
 
+        recipient_port = int(defaults.get('remote_port', SSH_PORT))
+        recipients = parse_recipients(defaults['recipients'], recipient_port) if 'recipients' in defaults else None
+        if recipients:
+            recipient_host, recipient_port = recipients[0]
+        else:
+            recipient_host = defaults['remote_host']
+
+        # host name = recipients, see Router
+        routes = {}
+        if 'routes' in config:
+            for pattern, value in config['routes'].items():
+                if pattern not in config.defaults():
+                    routes[pattern] = parse_recipients(value, recipient_port)
+
+        balancing = defaults.get('balancing', BALANCING_ROUND_ROBIN)
+        if balancing not in BALANCING_STRATEGIES:
+            raise ValueError("balancing can only be %s but '%s' was received" % (" or ".join(BALANCING_STRATEGIES),
+                                                                                balancing))
+
+        priority = defaults.get('priority', PRIORITY_NORMAL)
+        if priority not in PRIORITIES:
+            raise ValueError("priority can only be %s but '%s' was received" % (" or ".join(PRIORITIES), priority))
+
+        relay_engine = defaults.get('relay_engine', RELAY_ENGINE_THREADS)
+        if relay_engine not in RELAY_ENGINES:
+            raise ValueError("relay_engine can only be %s but '%s' was received" % (" or ".join(RELAY_ENGINES),
+                                                                                      relay_engine))
+
+        ssh_window_size = int(defaults.get('ssh_window_size', DEFAULT_WINDOW_SIZE))
+        ssh_max_packet_size = int(defaults.get('ssh_max_packet_size', DEFAULT_MAX_PACKET_SIZE))
+        check_ssh_sizes(ssh_window_size, ssh_max_packet_size)
+
         return TunnelProcess(
             tunnel_name=defaults.get('connector_name' if 'connector_name' in defaults else 'tunnel_name', realpath(ini_file)),
             server_host=defaults['server_host'],
@@ -190,13 +643,56 @@ class TunnelProcess(multiprocessing.Process):
             server_key=server_key,
             user_to_login=defaults["username"],
             key_file=key_file,
-            recipient_host=defaults['remote_host'],
-            recipient_port=int(defaults.get('remote_port', SSH_PORT)),
+            recipient_host=recipient_host,
+            recipient_port=recipient_port,
             keep_alive_time=int(defaults.get("keep_alive_time", DEFAULT_KEEP_ALIVE_TIME)),
             alert_senders=alert_senders,
             log_filename=f"{os.path.splitext(os.path.basename(ini_file))[0]}.log",
             log_level=defaults.get('log_level', 'DEBUG'),
             log_to_console=bool(defaults.get('log_to_console', False)),
-            log_path=TunnelProcess.default_log_path
+            log_path=TunnelProcess.default_log_path,
+            relay_engine=relay_engine,
+            relay_loops=int(defaults.get('relay_loops', DEFAULT_RELAY_LOOPS)),
+            relay_buffer_size=int(defaults.get('relay_buffer_size', DEFAULT_RELAY_BUFFER_SIZE)),
+            relay_buffer_adaptive=defaults.getboolean('relay_buffer_adaptive', True),
+            transports=int(defaults.get('transports', 1)),
+            ciphers=parse_algorithms('ciphers', defaults.get('ciphers')),
+            macs=parse_algorithms('macs', defaults.get('macs')),
+            kex=parse_algorithms('kex', defaults.get('kex')),
+            compression=defaults.getboolean('compression', False),
+            keep_alive_max_time=int(defaults['keep_alive_max_time']) if 'keep_alive_max_time' in defaults else None,
+            reconnect_attempts=int(defaults.get('reconnect_attempts', DEFAULT_RECONNECT_ATTEMPTS)),
+            reconnect_min_delay=float(defaults.get('reconnect_min_delay', DEFAULT_RECONNECT_MIN_DELAY)),
+            reconnect_max_delay=float(defaults.get('reconnect_max_delay', DEFAULT_RECONNECT_MAX_DELAY)),
+            max_channels=int(defaults.get('max_channels', 0)),
+            accept_rate=float(defaults.get('accept_rate', 0)),
+            accept_burst=float(defaults['accept_burst']) if 'accept_burst' in defaults else None,
+            channel_queue_size=int(defaults.get('channel_queue_size', DEFAULT_CHANNEL_QUEUE_SIZE)),
+            channel_queue_timeout=float(defaults.get('channel_queue_timeout', DEFAULT_CHANNEL_QUEUE_TIMEOUT)),
+            config_file=ini_file,
+            handshake_priority=int(defaults.get('handshake_priority', 0)),
+            recipient_pool_size=int(defaults.get('recipient_pool_size', 0)),
+            recipient_pool_idle_time=float(defaults.get('recipient_pool_idle_time', DEFAULT_RECIPIENT_POOL_IDLE_TIME)),
+            circuit_failure_threshold=int(defaults.get('circuit_failure_threshold', DEFAULT_CIRCUIT_FAILURE_THRESHOLD)),
+            circuit_recovery_time=float(defaults.get('circuit_recovery_time', DEFAULT_CIRCUIT_RECOVERY_TIME)),
+            recipients=recipients,
+            balancing=balancing,
+            health_check_interval=float(defaults.get('health_check_interval', DEFAULT_HEALTH_CHECK_INTERVAL)),
+            routes=routes,
+            sniff_timeout=float(defaults.get('sniff_timeout', DEFAULT_SNIFF_TIMEOUT)),
+            bandwidth_limit=float(defaults.get('bandwidth_limit', 0)),
+            channel_bandwidth_limit=float(defaults.get('channel_bandwidth_limit', 0)),
+            priority=priority,
+            tcp_nodelay=defaults.getboolean('tcp_nodelay', False),
+            tcp_keepalive=defaults.getboolean('tcp_keepalive', False),
+            socket_buffer_size=int(defaults.get('socket_buffer_size', 0)),
+            ssh_window_size=ssh_window_size,
+            ssh_max_packet_size=ssh_max_packet_size,
+            auto_tune=defaults.getboolean('auto_tune', False),
+            link_bandwidth=float(defaults['link_bandwidth']) if 'link_bandwidth' in defaults else None,
+            idle_timeout=float(defaults.get('idle_timeout', 0)),
+            max_lifetime=float(defaults.get('max_lifetime', 0)),
+            connect_timeout=float(defaults.get('connect_timeout', RECIPIENT_CONNECT_TIMEOUT)),
+            drain_timeout=float(defaults.get('drain_timeout', DEFAULT_DRAIN_TIMEOUT))
         )
 
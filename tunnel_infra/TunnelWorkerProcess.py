@@ -0,0 +1,105 @@
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+from concurrent.futures.thread import ThreadPoolExecutor
+from functools import cached_property
+from logging import Logger
+from typing import Callable
+
+from alerts.alert_sender import AlertSender
+from alerts.pooled_alerter import DifferentThreadAlert
+from configure_logger import LogManager
+from tunnel_infra.TunnelGroupProcess import TunnelGroupProcess
+from tunnel_infra.TunnelProcess import TunnelProcess
+from tunnel_infra.readiness import ReadyCountdown
+
+
+class TunnelWorkerProcess(multiprocessing.Process):
+
+    def __init__(self, connectors: list[TunnelProcess | TunnelGroupProcess], index: int,
+                 alert_senders: list[AlertSender] = None) -> None:
+        """
+        Run several connectors in a single process, each one from its own thread. A connector that gives up
+        reconnecting is started again without disturbing the other connectors of the worker.
+
+        :param connectors: Connectors of the worker. They are only used for their configuration, they are not started
+        :param index: Number of the worker, used for its log file
+        """
+        self.connectors = connectors
+        self.index = index
+        self.alert_senders = alert_senders or []
+        self.tunnel_name = ", ".join(each.tunnel_name for each in connectors)
+        for each in connectors:
+            for connector in each.connectors if isinstance(each, TunnelGroupProcess) else [each]:
+                connector.shares_process = True
+        # told once whether every connector could forward its ports, see ``ReadySignal``
+        self.on_ready: Callable[[bool], None] | None = None
+
+        super().__init__()
+
+    @cached_property
+    def logger(self) -> Logger:
+        leader = self.connectors[0].leader if isinstance(self.connectors[0], TunnelGroupProcess) else self.connectors[0]
+        return LogManager.configure_logger("worker_%d.log" % self.index, leader.log_level, leader.log_to_console,
+                                           name="worker", path=leader.log_path, paramiko_logs=True)
+
+    def exit_gracefully(self, *args):
+        self.logger.info("Exit gracefully called for %s", os.getpid())
+        # connectors drain their connections at the same time
+        drains = [threading.Thread(target=each.stop_forwarding, args=(self.drain_timeout(each),), daemon=True)
+                  for each in self.connectors]
+        for each in drains:
+            each.start()
+        for each in drains:
+            each.join()
+        sys.exit(0)
+
+    @staticmethod
+    def drain_timeout(connector: TunnelProcess | TunnelGroupProcess) -> float:
+        return connector.leader.drain_timeout if isinstance(connector, TunnelGroupProcess) else connector.drain_timeout
+
+    @property
+    def handshake_priority(self) -> int:
+        return max(each.handshake_priority for each in self.connectors)
+
+    def run(self):
+        self.logger.info("Starting TunnelWorkerProcess %d for %s with the process id: %s", self.index,
+                         self.tunnel_name, os.getpid())
+        signal.signal(signal.SIGINT, self.exit_gracefully)
+        signal.signal(signal.SIGTERM, self.exit_gracefully)
+        alerter = DifferentThreadAlert(alerters=self.alert_senders, logger=self.logger,
+                                       process_pool=ThreadPoolExecutor(1))
+        stopped = queue.Queue()
+        if self.on_ready:
+            countdown = ReadyCountdown(len(self.connectors), self.on_ready)
+            for each in self.connectors:
+                each.on_ready = countdown
+        for each in self.connectors:
+            self.start_connector(each, stopped)
+        while True:
+            try:
+                connector = stopped.get(timeout=1)
+            except queue.Empty:
+                continue
+            self.logger.info("Connector %s is down, going to restart it", connector.tunnel_name)
+            alerter.send_alert(connector.tunnel_name)
+            self.start_connector(connector, stopped)
+
+    def start_connector(self, connector: TunnelProcess | TunnelGroupProcess, stopped: queue.Queue):
+        threading.Thread(target=self._forward, args=(connector, stopped), name=connector.tunnel_name,
+                         daemon=True).start()
+
+    def _forward(self, connector: TunnelProcess | TunnelGroupProcess, stopped: queue.Queue):
+        try:
+            connector.forward_forever()
+        except SystemExit:
+            # the connector gave up reconnecting
+            pass
+        except Exception as e:
+            self.logger.exception("Connector %s stopped with error %s", connector.tunnel_name, e)
+        finally:
+            connector.stop_forwarding()
+            stopped.put(connector)
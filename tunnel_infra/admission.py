@@ -0,0 +1,149 @@
+import collections
+import threading
+import time
+from logging import Logger
+from typing import Callable
+
+from lib import TokenBucket
+
+DEFAULT_CHANNEL_QUEUE_SIZE = 64
+DEFAULT_CHANNEL_QUEUE_TIMEOUT = 10
+
+
+class _Waiting:
+    def __init__(self, chan, start: Callable, deadline: float):
+        self.chan = chan
+        self.start = start
+        self.deadline = deadline
+
+
+class AdmissionControl:
+    def __init__(self, logger: Logger, max_channels: int = 0, accept_rate: float = 0, accept_burst: float = None,
+                 queue_size: int = DEFAULT_CHANNEL_QUEUE_SIZE, queue_timeout: float = DEFAULT_CHANNEL_QUEUE_TIMEOUT):
+        """
+        Limit the channels relayed by a connector. A channel that can't start right away waits in a bounded queue, it
+        is closed when the queue is full or when it waits more than ``queue_timeout`` seconds.
+
+        :param max_channels: Channels relayed at the same time, 0 for no limit
+        :param accept_rate: Channels started per second, 0 for no limit
+        :param accept_burst: Channels that can be started at once above ``accept_rate``, ``accept_rate`` if None
+        :param queue_size: Channels that can wait to be started
+        :param queue_timeout: Seconds that a channel can wait to be started
+        """
+        self.logger = logger
+        self.max_channels = max_channels
+        self.bucket = TokenBucket(accept_rate, accept_burst) if accept_rate else None
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.condition = threading.Condition()
+        self.waiting: collections.deque[_Waiting] = collections.deque()
+        self.active = 0
+        self.accepted = 0
+        self.rejected_queue_full = 0
+        self.rejected_queue_timeout = 0
+        self.max_queue_depth = 0
+        self.thread: threading.Thread | None = None
+
+    def _can_start(self) -> bool:
+        if self.max_channels and self.active >= self.max_channels:
+            return False
+        return self.bucket is None or self.bucket.consume()
+
+    def admit(self, chan, start: Callable):
+        """
+        Call ``start(chan)`` now or once the limits allow it, or close the channel if it can't wait
+        """
+        with self.condition:
+            if not self.waiting and self._can_start():
+                self.active += 1
+                self.accepted += 1
+            elif len(self.waiting) < self.queue_size:
+                self.waiting.append(_Waiting(chan, start, time.monotonic() + self.queue_timeout))
+                self.max_queue_depth = max(self.max_queue_depth, len(self.waiting))
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="admission", daemon=True)
+                    self.thread.start()
+                self.condition.notify()
+                return
+            else:
+                self.rejected_queue_full += 1
+                self._reject(chan, "the queue of channels is full")
+                return
+        self._start(chan, start)
+
+    def release(self):
+        """
+        Called when a started channel is closed
+        """
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+    def discard(self, start: Callable) -> int:
+        """
+        Close the channels waiting to be started with ``start``, whose tunnel is stopping
+
+        :return: Channels closed
+        """
+        with self.condition:
+            discarded = [each for each in self.waiting if each.start == start]
+            for each in discarded:
+                self.waiting.remove(each)
+        for each in discarded:
+            self._reject(each.chan, "its tunnel is stopping")
+        return len(discarded)
+
+    def _reject(self, chan, reason: str):
+        self.logger.warning("Rejected connection from %r, %s", chan.origin_addr, reason)
+        chan.close()
+
+    def _start(self, chan, start: Callable):
+        """
+        Call ``start(chan)`` for a channel that got a slot, giving the slot back if it fails
+        """
+        try:
+            start(chan)
+        except Exception as e:
+            self.logger.exception("Failed to start connection from %r: %r", chan.origin_addr, e)
+            chan.close()
+            self.release()
+
+    def _run(self):
+        try:
+            while True:
+                to_start, expired = [], []
+                with self.condition:
+                    now = time.monotonic()
+                    while self.waiting and self.waiting[0].deadline <= now:
+                        expired.append(self.waiting.popleft())
+                        self.rejected_queue_timeout += 1
+                    while self.waiting and self._can_start():
+                        to_start.append(self.waiting.popleft())
+                        self.active += 1
+                        self.accepted += 1
+                    if not to_start and not expired:
+                        timeout = self.waiting[0].deadline - now if self.waiting else None
+                        full = self.max_channels and self.active >= self.max_channels
+                        if self.waiting and self.bucket and not full:
+                            timeout = min(timeout, self.bucket.delay())
+                        self.condition.wait(timeout)
+                        continue
+                for each in expired:
+                    self._reject(each.chan, "it waited more than %d seconds" % self.queue_timeout)
+                for each in to_start:
+                    self._start(each.chan, each.start)
+        finally:
+            # the next channel that has to wait starts a new thread
+            with self.condition:
+                self.thread = None
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {
+                'active_channels': self.active,
+                'queue_depth': len(self.waiting),
+                'max_queue_depth': self.max_queue_depth,
+                'accepted': self.accepted,
+                'rejected_queue_full': self.rejected_queue_full,
+                'rejected_queue_timeout': self.rejected_queue_timeout,
+            }
@@ -0,0 +1,27 @@
+import random
+
+
+class Backoff:
+    def __init__(self, initial: float = 1, maximum: float = 60, factor: float = 2, jitter: float = 0.5):
+        """
+        Exponential backoff with jitter, so many connectors that fail at the same time don't retry at the same time.
+
+        :param initial: Delay before the first retry
+        :param maximum: Longest delay between retries
+        :param factor: The delay is multiplied by it after each retry
+        :param jitter: Fraction of each delay that is random, 0 for no jitter and 1 for a delay between 0 and the
+            exponential delay
+        """
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        delay = min(self.maximum, self.initial * self.factor ** self.attempts)
+        self.attempts += 1
+        return delay * (1 - self.jitter * random.random())
+
+    def reset(self):
+        self.attempts = 0
@@ -0,0 +1,218 @@
+import itertools
+import random
+import socket
+import threading
+import time
+from logging import Logger
+
+from lib import create_connection
+from tunnel_infra.circuit_breaker import CircuitBreaker, CIRCUIT_OPEN
+from tunnel_infra.recipient_pool import RecipientPool, RECIPIENT_CONNECT_TIMEOUT
+
+BALANCING_ROUND_ROBIN = "round_robin"
+BALANCING_LEAST_CONNECTIONS = "least_connections"
+BALANCING_LATENCY = "latency"
+BALANCING_STRATEGIES = (BALANCING_ROUND_ROBIN, BALANCING_LEAST_CONNECTIONS, BALANCING_LATENCY)
+
+DEFAULT_HEALTH_CHECK_INTERVAL = 10
+# weight of each new measure in the average connection time of a recipient
+LATENCY_SMOOTHING = 0.3
+
+
+def parse_recipients(value: str, default_port: int) -> list[tuple[str, int]]:
+    """
+    Parse a comma separated list of ``host:port`` from a connector config. The port is ``default_port`` when it's
+    missing, IPv6 addresses go between brackets: ``[::1]:636``
+    """
+    recipients = []
+    for each in value.split(","):
+        each = each.strip()
+        if not each:
+            continue
+        if each.startswith("["):
+            host, _, rest = each[1:].partition("]")
+            port = rest[1:] if rest.startswith(":") else ""
+        elif each.count(":") == 1:
+            host, port = each.split(":")
+        else:
+            host, port = each, ""
+        try:
+            recipients.append((host, int(port) if port else default_port))
+        except ValueError:
+            raise ValueError("recipients must be a comma separated list of host:port but '%s' was received" % each)
+    if not recipients:
+        raise ValueError("recipients can't be empty")
+    return recipients
+
+
+class Recipient:
+    def __init__(self, host: str, port: int, circuit_breaker: CircuitBreaker, pool: RecipientPool | None = None,
+                 connect_timeout: float = RECIPIENT_CONNECT_TIMEOUT):
+        """
+        A service that receives the connections of a connector
+
+        :param circuit_breaker: Stops connecting to the recipient while it's down
+        :param pool: Idle connections to the recipient to use before connecting to it
+        :param connect_timeout: Seconds to connect to the recipient
+        """
+        self.host = host
+        self.port = port
+        self.circuit_breaker = circuit_breaker
+        self.pool = pool
+        self.connect_timeout = connect_timeout
+        self.lock = threading.Lock()
+        self.active = 0
+        self.connections = 0
+        self.latency: float | None = None
+        self.healthy = True
+
+    @property
+    def name(self) -> str:
+        return "[%s]:%d" % (self.host, self.port) if ":" in self.host else "%s:%d" % (self.host, self.port)
+
+    @property
+    def available(self) -> bool:
+        return self.circuit_breaker.state != CIRCUIT_OPEN
+
+    def connect(self) -> socket.socket:
+        if self.pool:
+            sock = self.pool.get()
+            if sock:
+                return sock
+        start = time.monotonic()
+        sock = create_connection((self.host, self.port), self.connect_timeout)
+        self.record_latency(time.monotonic() - start)
+        return sock
+
+    def probe(self) -> bool:
+        """
+        Connect to the recipient and close the connection right away, without the pool and without logging
+
+        :return: Whether the recipient accepted the connection
+        """
+        start = time.monotonic()
+        try:
+            create_connection((self.host, self.port), self.connect_timeout).close()
+        except Exception:
+            return False
+        self.record_latency(time.monotonic() - start)
+        return True
+
+    def record_latency(self, seconds: float):
+        with self.lock:
+            self.latency = seconds if self.latency is None else self.latency + LATENCY_SMOOTHING * (seconds - self.latency)
+
+    def acquire(self):
+        with self.lock:
+            self.active += 1
+            self.connections += 1
+
+    def release(self):
+        with self.lock:
+            self.active -= 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = {
+                'active_channels': self.active,
+                'connections': self.connections,
+                'latency': self.latency,
+                'healthy': self.healthy,
+            }
+        stats['circuit_breaker'] = self.circuit_breaker.stats()
+        if self.pool:
+            stats['recipient_pool'] = self.pool.stats()
+        return stats
+
+
+class RecipientBalancer:
+    def __init__(self, name: str, recipients: list[Recipient], logger: Logger, strategy: str = BALANCING_ROUND_ROBIN,
+                 health_check_interval: float = DEFAULT_HEALTH_CHECK_INTERVAL):
+        """
+        Spread the channels of a connector among its recipients.
+
+        Recipients whose circuit is open are skipped, and the ones that failed the last health check are only used
+        when no other recipient is left. Health checks run every ``health_check_interval`` seconds when there is more
+        than one recipient.
+
+        :param name: Name of the connector
+        :param strategy: ``round_robin``, ``least_connections`` to prefer the recipients relaying fewer channels or
+            ``latency`` to prefer, at random, the recipients that connect faster
+        :param health_check_interval: Seconds between health checks, 0 to rely only on failed connections
+        """
+        self.name = name
+        self.recipients = recipients
+        self.logger = logger
+        self.strategy = strategy
+        self.health_check_interval = health_check_interval
+        self.counter = itertools.count()
+        self.thread: threading.Thread | None = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def single(name: str, host: str, port: int, logger: Logger) -> 'RecipientBalancer':
+        """
+        Balancer for one recipient that is always connected
+        """
+        return RecipientBalancer(name, [Recipient(host, port, CircuitBreaker(host, port, logger, failure_threshold=0))],
+                                 logger)
+
+    def start(self):
+        for each in self.recipients:
+            if each.pool:
+                each.pool.start()
+        with self.lock:
+            if self.thread is None and self.health_check_interval and len(self.recipients) > 1:
+                self.thread = threading.Thread(target=self._health_check, name="health-check", daemon=True)
+                self.thread.start()
+
+    def candidates(self) -> list[Recipient]:
+        """
+        Recipients to try for a new channel, in order
+        """
+        if len(self.recipients) == 1:
+            return self.recipients if self.recipients[0].available else []
+        healthy = [each for each in self.recipients if each.available and each.healthy]
+        unhealthy = [each for each in self.recipients if each.available and not each.healthy]
+        if healthy:
+            start = next(self.counter) % len(healthy)
+            healthy = healthy[start:] + healthy[:start]
+        if self.strategy == BALANCING_LEAST_CONNECTIONS:
+            # sorted is stable, so recipients with the same channels keep the round robin order
+            healthy.sort(key=lambda each: each.active)
+        elif self.strategy == BALANCING_LATENCY:
+            healthy = self._by_latency(healthy)
+        return healthy + unhealthy
+
+    @staticmethod
+    def _by_latency(recipients: list[Recipient]) -> list[Recipient]:
+        if len(recipients) < 2:
+            return recipients
+        measured = [each.latency for each in recipients if each.latency is not None]
+        # recipients never measured count as average ones
+        default = sum(measured) / len(measured) if measured else 1.0
+        weights = [1 / max(each.latency if each.latency is not None else default, 1e-4) for each in recipients]
+        first = random.choices(recipients, weights)[0]
+        rest = sorted((each for each in recipients if each is not first),
+                      key=lambda each: each.latency if each.latency is not None else default)
+        return [first] + rest
+
+    def check_health(self):
+        """
+        Probe every recipient, logging only the ones that became healthy or unhealthy
+        """
+        for each in self.recipients:
+            healthy = each.probe()
+            if healthy and not each.healthy:
+                self.logger.info("Recipient %s is healthy again", each.name)
+            elif not healthy and each.healthy:
+                self.logger.warning("Recipient %s is unhealthy, it didn't accept a connection", each.name)
+            each.healthy = healthy
+
+    def _health_check(self):
+        while True:
+            time.sleep(self.health_check_interval)
+            self.check_health()
+
+    def stats(self) -> dict:
+        return {each.name: each.stats() for each in self.recipients}
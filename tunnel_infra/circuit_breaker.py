@@ -0,0 +1,143 @@
+import threading
+import time
+from logging import Logger
+
+from lib import create_connection
+from tunnel_infra.backoff import Backoff
+from tunnel_infra.recipient_pool import RECIPIENT_CONNECT_TIMEOUT
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+DEFAULT_CIRCUIT_FAILURE_THRESHOLD = 5
+DEFAULT_CIRCUIT_RECOVERY_TIME = 5
+CIRCUIT_MAX_RECOVERY_TIME = 60
+
+
+class CircuitBreaker:
+    def __init__(self, host: str, port: int, logger: Logger,
+                 failure_threshold: int = DEFAULT_CIRCUIT_FAILURE_THRESHOLD,
+                 recovery_time: float = DEFAULT_CIRCUIT_RECOVERY_TIME,
+                 max_recovery_time: float = CIRCUIT_MAX_RECOVERY_TIME,
+                 connect_timeout: float = RECIPIENT_CONNECT_TIMEOUT):
+        """
+        Stop connecting to a recipient that is down.
+
+        After ``failure_threshold`` consecutive failed connections the circuit opens and channels are closed right away
+        instead of waiting for the connection timeout. A background thread tries to connect to the recipient every
+        ``recovery_time`` seconds, growing up to ``max_recovery_time``. Once it connects the circuit is half open: a
+        single channel is relayed to check the recipient, closing the circuit if it connects or opening it again if
+        it doesn't.
+
+        :param host: Recipient host
+        :param port: Recipient port
+        :param failure_threshold: Consecutive failed connections that open the circuit, 0 to never open it
+        :param recovery_time: Seconds before the first check of the recipient once the circuit is open
+        :param max_recovery_time: Longest time in seconds between checks of the recipient
+        :param connect_timeout: Timeout of the checks of the recipient
+        """
+        self.host = host
+        self.port = port
+        self.logger = logger
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.max_recovery_time = max_recovery_time
+        self.connect_timeout = connect_timeout
+        self.lock = threading.Lock()
+        self.state = CIRCUIT_CLOSED
+        self.trial_in_flight = False
+        self.consecutive_failures = 0
+        self.failures = 0
+        self.rejected = 0
+        self.opened_times = 0
+        self.opened_at: float | None = None
+        self.last_error: str | None = None
+        self.thread: threading.Thread | None = None
+
+    def allow(self) -> bool:
+        """
+        :return: Whether a channel can connect to the recipient, then it has to call ``record_success`` or
+            ``record_failure`` with the result
+        """
+        if not self.failure_threshold:
+            return True
+        with self.lock:
+            if self.state == CIRCUIT_CLOSED:
+                return True
+            if self.state == CIRCUIT_HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        if not self.failure_threshold:
+            return
+        with self.lock:
+            self.consecutive_failures = 0
+            if self.state == CIRCUIT_HALF_OPEN:
+                self.state = CIRCUIT_CLOSED
+                self.trial_in_flight = False
+                self.opened_at = None
+                self.logger.info("Circuit to %s:%d closed, %s:%d is reachable again",
+                                 self.host, self.port, self.host, self.port)
+
+    def record_failure(self, error: Exception) -> bool:
+        """
+        :return: Whether this failure opened the circuit, always True when the circuit never opens
+        """
+        if not self.failure_threshold:
+            return True
+        with self.lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = repr(error)
+            if self.state == CIRCUIT_HALF_OPEN:
+                self.trial_in_flight = False
+                self._open()
+                return True
+            if self.state == CIRCUIT_CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self._open()
+                return True
+            return False
+
+    def _open(self):
+        self.state = CIRCUIT_OPEN
+        self.opened_times += 1
+        self.opened_at = time.time()
+        self.logger.warning("Circuit to %s:%d opened after %d consecutive failures, closing its connections until it's "
+                            "reachable", self.host, self.port, self.consecutive_failures)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._probe, name="circuit-breaker", daemon=True)
+            self.thread.start()
+
+    def _probe(self):
+        backoff = Backoff(self.recovery_time, self.max_recovery_time)
+        while True:
+            time.sleep(backoff.next_delay())
+            try:
+                with create_connection((self.host, self.port), self.connect_timeout):
+                    pass
+            except OSError as e:
+                with self.lock:
+                    self.last_error = repr(e)
+                self.logger.debug("%s:%d is still unreachable: %r", self.host, self.port, e)
+                continue
+            with self.lock:
+                self.state = CIRCUIT_HALF_OPEN
+                self.thread = None
+            self.logger.info("Circuit to %s:%d half open, checking it with the next connection", self.host, self.port)
+            return
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'opened_times': self.opened_times,
+                'opened_at': self.opened_at,
+                'last_error': self.last_error,
+            }
@@ -0,0 +1,129 @@
+import contextlib
+import multiprocessing
+import random
+import time
+from logging import Logger
+
+from observation.heartbeat import ConnectorProgress
+
+DEFAULT_HANDSHAKE_CONCURRENCY = 4
+DEFAULT_HANDSHAKE_STAGGER = 1
+# a process that dies during a handshake gives its slot back after this many seconds
+HANDSHAKE_LEASE_TIME = 60
+# processes waiting for a slot refresh their place in the queue this often, places not refreshed for
+# WAITER_EXPIRY seconds belong to processes that died waiting
+WAITER_REFRESH = 0.5
+WAITER_EXPIRY = 5
+MAX_WAITERS = 256
+# fields of each place in the queue
+_PRIORITY, _TICKET, _REFRESHED_AT = range(3)
+_FIELDS = 3
+
+
+class HandshakeScheduler:
+    def __init__(self, max_in_flight: int = DEFAULT_HANDSHAKE_CONCURRENCY, stagger: float = DEFAULT_HANDSHAKE_STAGGER,
+                 max_waiters: int = MAX_WAITERS):
+        """
+        Limit the SSH handshakes made at the same time by every connector process, so a server that comes back or a
+        mass restart doesn't get every connector doing key exchanges at once. Waiting connectors get a slot by
+        priority, then in arrival order.
+
+        Created by the supervisor and given to the processes when they start, the state lives in shared memory.
+
+        :param max_in_flight: Handshakes at the same time
+        :param stagger: Connectors wait a random time up to this many seconds before their first handshake
+        :param max_waiters: Connectors that can wait in order, the rest wait until a place in the queue is free
+        """
+        self.max_in_flight = max_in_flight
+        self.stagger = stagger
+        self.max_waiters = max_waiters
+        self.condition = multiprocessing.Condition()
+        # wall clock time when each slot expires, 0 for a free slot. Processes don't share monotonic clocks
+        self.leases = multiprocessing.RawArray('d', max_in_flight)
+        # priority, ticket and last refresh of each place in the queue, ticket 0 for a free place
+        self.waiters = multiprocessing.RawArray('d', max_waiters * _FIELDS)
+        self.tickets = multiprocessing.RawValue('q', 0)
+
+    def start_offset(self) -> float:
+        """
+        Seconds that a connector waits before its first handshake
+        """
+        return random.uniform(0, self.stagger) if self.stagger else 0.0
+
+    def _free_lease(self, now: float) -> int | None:
+        for i in range(self.max_in_flight):
+            if self.leases[i] <= now:
+                return i
+        return None
+
+    def _join(self, priority: int, ticket: int, now: float) -> int | None:
+        for i in range(self.max_waiters):
+            base = i * _FIELDS
+            if not self.waiters[base + _TICKET] or self.waiters[base + _REFRESHED_AT] < now - WAITER_EXPIRY:
+                self.waiters[base + _PRIORITY] = priority
+                self.waiters[base + _TICKET] = ticket
+                self.waiters[base + _REFRESHED_AT] = now
+                return i
+        return None
+
+    def _is_next(self, place: int, now: float) -> bool:
+        base = place * _FIELDS
+        priority, ticket = self.waiters[base + _PRIORITY], self.waiters[base + _TICKET]
+        for i in range(self.max_waiters):
+            other = i * _FIELDS
+            if i == place or not self.waiters[other + _TICKET]:
+                continue
+            if self.waiters[other + _REFRESHED_AT] < now - WAITER_EXPIRY:
+                continue
+            if (-self.waiters[other + _PRIORITY], self.waiters[other + _TICKET]) < (-priority, ticket):
+                return False
+        return True
+
+    def acquire(self, priority: int = 0, progress: ConnectorProgress = None) -> int:
+        """
+        Wait for a handshake slot, connectors with a higher ``priority`` get one first
+
+        :param progress: Marked while waiting, so the watchdog doesn't take a connector waiting in the queue for a
+            stalled one
+        :return: Slot to give to ``release``
+        """
+        with self.condition:
+            self.tickets.value += 1
+            ticket = self.tickets.value
+            place = None
+            while True:
+                now = time.time()
+                if place is None:
+                    place = self._join(priority, ticket, now)
+                else:
+                    self.waiters[place * _FIELDS + _REFRESHED_AT] = now
+                lease = self._free_lease(now)
+                if lease is not None and place is not None and self._is_next(place, now):
+                    self.leases[lease] = now + HANDSHAKE_LEASE_TIME
+                    self.waiters[place * _FIELDS + _TICKET] = 0
+                    return lease
+                if progress:
+                    progress.mark(WAITER_REFRESH)
+                self.condition.wait(WAITER_REFRESH)
+
+    def release(self, lease: int):
+        with self.condition:
+            self.leases[lease] = 0
+            self.condition.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, priority: int = 0, logger: Logger = None, progress: ConnectorProgress = None):
+        """
+        Hold a handshake slot while in the ``with`` block, see ``acquire``
+        """
+        start = time.monotonic()
+        lease = self.acquire(priority, progress)
+        if progress:
+            progress.mark()
+        waited = time.monotonic() - start
+        if logger and waited >= 1:
+            logger.info("Waited %.1f seconds for other connectors to finish their handshakes", waited)
+        try:
+            yield
+        finally:
+            self.release(lease)
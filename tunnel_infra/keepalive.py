@@ -0,0 +1,242 @@
+import os
+import threading
+import time
+from logging import Logger
+from typing import Callable
+
+import paramiko
+
+# global request without side effects, OpenSSH answers it with a failure which proves the server is alive as well
+PROBE_REQUEST = "keepalive@openssh.com"
+# seconds to wait for the answer to a probe before escalating to a session probe
+PROBE_TIMEOUT = 15
+SESSION_PROBE_TIMEOUT = 30
+# when checks keep succeeding on an idle transport the interval doubles up to keep_alive_time * this factor
+DEFAULT_MAX_KEEP_ALIVE_FACTOR = 4
+
+
+class ProbedTransport(paramiko.Transport):
+    """
+    Transport that can send keep alive probes without waiting for their answer.
+
+    Probes are global requests made with the public ``global_request`` from a helper thread. paramiko matches the
+    answer of a global request to the last request waiting for one, so the requests that wait for an answer are made
+    one at a time.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_probe_answer = 0.0
+        self._probe_condition = threading.Condition()
+        self._probing = False
+        self._global_requests_lock = threading.Lock()
+
+    def global_request(self, kind, data=None, wait=True):
+        if not wait:
+            return super().global_request(kind, data, wait)
+        with self._global_requests_lock:
+            return super().global_request(kind, data, wait)
+
+    def send_probe(self) -> bool:
+        """
+        Send a global request to the server, its answer updates ``last_probe_answer``
+
+        :return: False if the last probe is still waiting for its answer, then no probe is sent
+        """
+        with self._probe_condition:
+            if self._probing:
+                return False
+            self._probing = True
+        threading.Thread(target=self._probe, name="keepalive-probe", daemon=True).start()
+        return True
+
+    def _probe(self):
+        answered = False
+        try:
+            # returns once the server answers, with a failure for OpenSSH, or once the transport is closed
+            self.global_request(PROBE_REQUEST, wait=True)
+            answered = self.active
+        except Exception:
+            pass
+        with self._probe_condition:
+            self._probing = False
+            if answered:
+                self.last_probe_answer = time.monotonic()
+            self._probe_condition.notify_all()
+
+    def round_trip_time(self, timeout: float = PROBE_TIMEOUT) -> float | None:
+        """
+        Send a probe and wait for its answer
+
+        :return: Seconds until the probe was answered, None if it wasn't answered in ``timeout`` seconds
+        """
+        with self._probe_condition:
+            # the answer of an earlier probe would be taken for the answer of this one
+            if not self._probe_condition.wait_for(lambda: not self._probing, timeout):
+                return None
+        start = time.monotonic()
+        if not self.send_probe():
+            return None
+        with self._probe_condition:
+            if not self._probe_condition.wait_for(lambda: self.last_probe_answer >= start or not self.active, timeout):
+                return None
+        if self.last_probe_answer < start:
+            return None
+        return self.last_probe_answer - start
+
+
+class _KeepAlive:
+    def __init__(self, transport: paramiko.Transport, interval: float, max_interval: float,
+                 on_failure: Callable[[], None], logger: Logger):
+        self.transport = transport
+        self.base_interval = interval
+        self.interval = interval
+        self.max_interval = max(interval, max_interval)
+        self.on_failure = on_failure
+        self.logger = logger
+        self.due = time.monotonic() + interval
+        self.probe_sent: float | None = None
+        self.last_success = time.monotonic()
+
+    def overdue(self, now: float) -> float:
+        """
+        Seconds since the transport should have passed or failed a check after the last one it passed
+        """
+        longest_check = min(PROBE_TIMEOUT, self.base_interval) + SESSION_PROBE_TIMEOUT
+        return max(0.0, now - (self.last_success + self.interval + longest_check))
+
+
+class KeepAliveScheduler:
+    def __init__(self):
+        """
+        Check the transports of every tunnel of the process from a single thread.
+
+        A check sends a cheap global request probe. Only when the probe is not answered in ``PROBE_TIMEOUT`` seconds the
+        check escalates to opening a session, which costs the server much more. The interval between checks of a
+        transport doubles while its checks succeed, up to its maximum interval, and goes back to the configured one
+        when a probe is not answered.
+        """
+        self.keep_alives: set[_KeepAlive] = set()
+        self.condition = threading.Condition()
+        self.thread: threading.Thread | None = None
+
+    def register(self, transport: paramiko.Transport, interval: float, on_failure: Callable[[], None], logger: Logger,
+                 max_interval: float | None = None) -> _KeepAlive:
+        """
+        Check ``transport`` every ``interval`` seconds and call ``on_failure`` once if it's down
+
+        :param max_interval: Longest interval between checks, ``interval * DEFAULT_MAX_KEEP_ALIVE_FACTOR`` if None
+        :return: Handle to give to ``unregister``
+        """
+        if max_interval is None:
+            max_interval = interval * DEFAULT_MAX_KEEP_ALIVE_FACTOR
+        keep_alive = _KeepAlive(transport, interval, max_interval, on_failure, logger)
+        with self.condition:
+            self.keep_alives.add(keep_alive)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="keepalive", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return keep_alive
+
+    def unregister(self, keep_alive: _KeepAlive):
+        with self.condition:
+            self.keep_alives.discard(keep_alive)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                now = time.monotonic()
+                due = [each for each in self.keep_alives if each.due <= now]
+                if not due:
+                    # keep alives waiting for a session probe are due at infinity
+                    timeout = min(min((each.due for each in self.keep_alives), default=now + 60), now + 60) - now
+                    self.condition.wait(timeout)
+                    continue
+            for each in due:
+                try:
+                    self._check(each, now)
+                except Exception as e:
+                    self._fail(each, "Connector down! %r" % e)
+
+    def _check(self, keep_alive: _KeepAlive, now: float):
+        transport = keep_alive.transport
+        if not transport.is_active():
+            self._fail(keep_alive, "Connector down! Transport is not active")
+            return
+
+        probed = isinstance(transport, ProbedTransport)
+        with self.condition:
+            if keep_alive.probe_sent is not None:
+                if getattr(transport, "last_probe_answer", 0.0) >= keep_alive.probe_sent:
+                    keep_alive.probe_sent = None
+                    keep_alive.last_success = now
+                    keep_alive.interval = min(keep_alive.interval * 2, keep_alive.max_interval)
+                    keep_alive.due = now + keep_alive.interval
+                    keep_alive.logger.debug("Connector is up, next check in %d seconds", keep_alive.interval)
+                else:
+                    self._escalate(keep_alive)
+                return
+            if probed:
+                keep_alive.probe_sent = now
+                keep_alive.due = now + min(PROBE_TIMEOUT, keep_alive.base_interval)
+
+        keep_alive.logger.debug("Going to check if connector is up")
+        if probed:
+            # a probe still waiting for its answer is answered before this check is due again, or the check escalates
+            transport.send_probe()
+        else:
+            transport.send_ignore()
+            with self.condition:
+                self._escalate(keep_alive)
+
+    def _escalate(self, keep_alive: _KeepAlive):
+        """
+        Check the transport by opening a session, in its own thread as it may block up to ``SESSION_PROBE_TIMEOUT``.
+        Called holding ``condition``
+        """
+        keep_alive.due = float("inf")
+        if keep_alive.probe_sent is not None:
+            keep_alive.logger.warning("Connector probe not answered in %d seconds, opening a check session",
+                                      min(PROBE_TIMEOUT, keep_alive.base_interval))
+        threading.Thread(target=self._session_probe, args=(keep_alive,), daemon=True).start()
+
+    def _session_probe(self, keep_alive: _KeepAlive):
+        try:
+            keep_alive.transport.open_session(timeout=SESSION_PROBE_TIMEOUT).close()
+        except Exception as e:
+            self._fail(keep_alive, "Connector down! Failed to start a check session %r with timeout %d seconds"
+                       % (e, SESSION_PROBE_TIMEOUT))
+            return
+        with self.condition:
+            keep_alive.probe_sent = None
+            keep_alive.last_success = time.monotonic()
+            keep_alive.interval = keep_alive.base_interval
+            keep_alive.due = keep_alive.last_success + keep_alive.interval
+            self.condition.notify()
+
+    def _fail(self, keep_alive: _KeepAlive, message: str):
+        with self.condition:
+            if keep_alive not in self.keep_alives:
+                return
+            self.keep_alives.discard(keep_alive)
+        keep_alive.logger.error(message)
+        keep_alive.on_failure()
+
+
+_scheduler: KeepAliveScheduler | None = None
+_scheduler_pid: int | None = None
+_scheduler_lock = threading.Lock()
+
+
+def keep_alive_scheduler() -> KeepAliveScheduler:
+    """
+    Scheduler shared by every tunnel of the current process
+    """
+    global _scheduler, _scheduler_pid
+    with _scheduler_lock:
+        # a forked child doesn't inherit the thread of the scheduler of its parent
+        if _scheduler is None or _scheduler_pid != os.getpid():
+            _scheduler = KeepAliveScheduler()
+            _scheduler_pid = os.getpid()
+        return _scheduler
@@ -0,0 +1,137 @@
+import multiprocessing
+import time
+from logging import Logger
+
+from alerts.alert_sender import AlertSender
+from tunnel_infra.TunnelGroupProcess import TunnelGroupProcess
+from tunnel_infra.TunnelProcess import TunnelProcess
+from tunnel_infra.TunnelWorkerProcess import TunnelWorkerProcess
+
+START_METHOD_FORKSERVER = 'forkserver'
+START_METHOD_SPAWN = 'spawn'
+# warm processes kept by the supervisor when connectors are spawned, see ``WarmPool``
+DEFAULT_WARM_PROCESSES = 2
+# seconds without restarts before the warm processes in use are replaced, importing the connector code takes CPU
+# from the handshakes of the restarted connectors
+WARM_REFILL_DELAY = 5
+# modules imported once by the fork server, every connector forked from it starts with them
+FORKSERVER_PRELOAD = ['paramiko', 'tunnel_infra.TunnelProcess', 'tunnel_infra.TunnelGroupProcess',
+                      'tunnel_infra.TunnelWorkerProcess']
+# class attributes of ``TunnelProcess`` set by the supervisor, given to the warm processes
+WARM_DEFAULTS = ['default_log_path', 'default_stats_queue', 'default_heartbeat_queue', 'default_handshake_scheduler']
+
+
+def set_start_method(method: str, logger: Logger):
+    """
+    Start the connector processes with ``method``, before any process, queue or lock is created. A fork server imports
+    the connector code once and forks every connector from it. The default of the platform is kept when it doesn't
+    support ``method``
+    """
+    available = multiprocessing.get_all_start_methods()
+    if method not in available:
+        logger.warning("start_method can only be %s on this platform but '%s' was received, using %s",
+                       " or ".join(available), method, multiprocessing.get_start_method())
+        return
+    if method == START_METHOD_FORKSERVER:
+        multiprocessing.set_forkserver_preload(FORKSERVER_PRELOAD)
+    multiprocessing.set_start_method(method, force=True)
+
+
+def create_process(files, key, alert_senders, groups=None, workers=None):
+    if workers and key in workers:
+        return TunnelWorkerProcess([create_connector(files, each, alert_senders, groups) for each in workers[key]],
+                                   list(workers).index(key), alert_senders)
+    return create_connector(files, key, alert_senders, groups)
+
+
+def create_connector(files, key, alert_senders, groups=None):
+    if groups and key in groups:
+        return TunnelGroupProcess.from_config_files([files[each] for each in groups[key]], alert_senders)
+    return TunnelProcess.from_config_file(files[key], alert_senders)
+
+
+class WarmProcess(multiprocessing.Process):
+
+    def __init__(self) -> None:
+        """
+        Process started ahead of time that imports the connector code and waits to be given a connector, which then
+        runs in it. Spawned processes take seconds to import paramiko and the rest, a warm one only has to connect.
+        Used by the supervisor in place of the process of the connector, see ``WarmPool``
+        """
+        self.defaults = {name: getattr(TunnelProcess, name) for name in WARM_DEFAULTS}
+        self.requests, self.requests_writer = multiprocessing.Pipe(duplex=False)
+        self.tunnel_name = None
+        super().__init__()
+
+    def adopt(self, connector, spec: tuple):
+        """
+        Run ``connector`` in this process
+
+        :param connector: Process of the connector created by the supervisor, its configuration is read again here
+        :param spec: Arguments of ``create_process`` for the connector
+        """
+        self.tunnel_name = connector.tunnel_name
+        # the pipe of a rotation is passed on to the process, see ``ReadySignal``
+        self.requests_writer.send((spec, connector.on_ready))
+        self.requests_writer.close()
+
+    def run(self):
+        for name, value in self.defaults.items():
+            setattr(TunnelProcess, name, value)
+        try:
+            spec, on_ready = self.requests.recv()
+        except (EOFError, KeyboardInterrupt):
+            # the supervisor stopped before giving a connector
+            return
+        connector = create_process(*spec)
+        connector.on_ready = on_ready
+        connector.run()
+
+
+class WarmPool:
+    def __init__(self, size: int, logger: Logger):
+        """
+        ``WarmProcess`` kept ready by the supervisor, so a connector that is restarted or rotated only waits for its
+        handshake. When every warm process is in use connectors start their own process
+        """
+        self.size = size
+        self.logger = logger
+        self.idle: list[WarmProcess] = []
+        self.used_at = None
+
+    def refill(self):
+        """
+        Replace the warm processes in use once no connector was started for ``WARM_REFILL_DELAY`` seconds
+        """
+        if self.used_at is None or time.monotonic() - self.used_at >= WARM_REFILL_DELAY:
+            self.fill()
+
+    def fill(self):
+        self.idle = [each for each in self.idle if each.is_alive()]
+        while len(self.idle) < self.size:
+            process = WarmProcess()
+            process.start()
+            self.idle.append(process)
+
+    def start(self, connector, files, key, alert_senders: list[AlertSender], groups=None, workers=None):
+        """
+        Start ``connector``, created by ``create_process`` with the same arguments
+
+        :return: Process that runs the connector
+        """
+        self.used_at = time.monotonic()
+        self.idle = [each for each in self.idle if each.is_alive()]
+        if not self.idle:
+            connector.start()
+            return connector
+        process = self.idle.pop(0)
+        process.adopt(connector, (files, key, alert_senders, groups, workers))
+        self.logger.debug("Connector %s runs in warm process %s", process.tunnel_name, process.pid)
+        return process
+
+    def stop(self):
+        for each in self.idle:
+            each.terminate()
+        for each in self.idle:
+            each.join()
+        self.idle = []
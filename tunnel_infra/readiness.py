@@ -0,0 +1,46 @@
+import contextlib
+import threading
+from typing import Callable
+
+
+class ReadySignal:
+    def __init__(self, conn):
+        """
+        Tell the supervisor whether a connector process could forward its ports, so the process it replaces can be
+        drained. Only the first report is sent. Given to the process before it starts, see ``rotate_tunnels`` in
+        pytun.py
+
+        :param conn: Write end of a ``multiprocessing.Pipe`` read by the supervisor
+        """
+        self.conn = conn
+        self.sent = False
+
+    def __call__(self, forwarding: bool = True):
+        """
+        :param forwarding: False when the server refused to forward a port, it may not let two connections forward
+            the same port
+        """
+        if self.sent:
+            return
+        self.sent = True
+        with contextlib.suppress(OSError):
+            self.conn.send(forwarding)
+            self.conn.close()
+
+
+class ReadyCountdown:
+    def __init__(self, count: int, on_ready: Callable[[bool], None]):
+        """
+        Call ``on_ready`` once ``count`` connectors sharing a process are forwarding their ports, or as soon as one of
+        them can't
+        """
+        self.count = count
+        self.on_ready = on_ready
+        self.lock = threading.Lock()
+
+    def __call__(self, forwarding: bool = True):
+        with self.lock:
+            self.count -= 1
+            if forwarding and self.count:
+                return
+        self.on_ready(forwarding)
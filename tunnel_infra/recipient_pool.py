@@ -0,0 +1,149 @@
+import collections
+import socket
+import threading
+import time
+from logging import Logger
+
+from lib import create_connection
+from tunnel_infra.backoff import Backoff
+
+RECIPIENT_CONNECT_TIMEOUT = 2
+DEFAULT_RECIPIENT_POOL_IDLE_TIME = 30
+
+
+def is_alive(sock: socket.socket) -> bool:
+    """
+    Check without blocking that an idle connection hasn't been closed by its peer
+    """
+    try:
+        sock.setblocking(False)
+        # data sent by the peer before the connection is used is relayed as usual
+        return sock.recv(1, socket.MSG_PEEK) != b""
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+
+
+class RecipientPool:
+    def __init__(self, host: str, port: int, logger: Logger, size: int,
+                 max_idle_time: float = DEFAULT_RECIPIENT_POOL_IDLE_TIME,
+                 connect_timeout: float = RECIPIENT_CONNECT_TIMEOUT):
+        """
+        Keep ``size`` connections to the recipient open, so a new channel doesn't wait to connect to it.
+
+        Connections are closed after ``max_idle_time`` seconds without being used, and checked right before being
+        handed to a channel. Only useful for services that don't close idle connections sooner and that don't expect
+        a request right after a connection is opened.
+
+        :param host: Recipient host
+        :param port: Recipient port
+        :param size: Idle connections to keep
+        :param max_idle_time: Seconds an idle connection is kept
+        :param connect_timeout: Timeout to connect to the recipient
+        """
+        self.host = host
+        self.port = port
+        self.logger = logger
+        self.size = size
+        self.max_idle_time = max_idle_time
+        self.connect_timeout = connect_timeout
+        self.idle: collections.deque[tuple[socket.socket, float]] = collections.deque()
+        self.condition = threading.Condition()
+        self.thread: threading.Thread | None = None
+        self.running = False
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.dead = 0
+        self.connect_failures = 0
+
+    def start(self):
+        with self.condition:
+            if self.thread is not None:
+                return
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name="recipient-pool", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.thread = None
+            idle, self.idle = self.idle, collections.deque()
+            self.condition.notify()
+        for sock, connected_at in idle:
+            sock.close()
+
+    def get(self) -> socket.socket | None:
+        """
+        Take an idle connection to the recipient
+
+        :return: A connected socket or None if there isn't any, then the caller has to connect by itself
+        """
+        while True:
+            with self.condition:
+                if not self.idle:
+                    self.misses += 1
+                    self.condition.notify()
+                    return None
+                sock, connected_at = self.idle.pop()
+                self.condition.notify()
+            if time.monotonic() - connected_at > self.max_idle_time:
+                self.expired += 1
+                sock.close()
+                continue
+            if not is_alive(sock):
+                self.dead += 1
+                sock.close()
+                continue
+            self.hits += 1
+            return sock
+
+    def _run(self):
+        backoff = Backoff(1, 30)
+        while True:
+            expired = []
+            with self.condition:
+                if not self.running:
+                    return
+                now = time.monotonic()
+                # the oldest connections are at the left
+                while self.idle and now - self.idle[0][1] > self.max_idle_time:
+                    expired.append(self.idle.popleft()[0])
+                    self.expired += 1
+                missing = self.size - len(self.idle)
+                if not missing and not expired:
+                    self.condition.wait(self.idle[0][1] + self.max_idle_time - now)
+                    continue
+            for each in expired:
+                each.close()
+            if not missing:
+                continue
+            try:
+                sock = create_connection((self.host, self.port), self.connect_timeout)
+            except OSError as e:
+                self.connect_failures += 1
+                delay = backoff.next_delay()
+                self.logger.debug("Failed to open a pooled connection to %s:%d, retrying in %.1f seconds: %r",
+                                  self.host, self.port, delay, e)
+                with self.condition:
+                    self.condition.wait_for(lambda: not self.running, delay)
+                continue
+            backoff.reset()
+            with self.condition:
+                if not self.running:
+                    sock.close()
+                    return
+                self.idle.append((sock, time.monotonic()))
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {
+                'idle': len(self.idle),
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'dead': self.dead,
+                'connect_failures': self.connect_failures,
+            }
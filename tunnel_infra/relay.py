@@ -0,0 +1,596 @@
+import contextlib
+import logging
+import select
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures.thread import ThreadPoolExecutor
+
+from tunnel_infra.timeouts import ChannelTimeouts, REAP_INTERVAL
+
+RELAY_ENGINE_THREADS = "threads"
+RELAY_ENGINE_SELECTOR = "selector"
+RELAY_ENGINES = (RELAY_ENGINE_THREADS, RELAY_ENGINE_SELECTOR)
+
+DEFAULT_RELAY_LOOPS = 1
+DEFAULT_CONNECT_WORKERS = 16
+
+MIN_RELAY_BUFFER_SIZE = 4096
+DEFAULT_RELAY_BUFFER_SIZE = 65536
+
+# seconds between retries to write to a channel whose SSH window is full, for the selector loops
+CHANNEL_WRITE_RETRY = 0.001
+# seconds a relay thread blocks waiting for the SSH window, before checking the other end again
+CHANNEL_WRITE_WAIT = 0.01
+
+
+class RelayEngineStopped(Exception):
+    """
+    Raised by ``submit`` once the engine is stopped
+    """
+
+
+class RelayBuffer:
+    def __init__(self, max_size: int = DEFAULT_RELAY_BUFFER_SIZE, adaptive: bool = True):
+        """
+        Preallocated buffer reused by every read of one direction of a relay.
+
+        :param max_size: Size of the buffer, or the size it can grow up to when ``adaptive``
+        :param adaptive: Start with a small buffer and double it each time a read fills it completely, so idle
+            connections don't hold large buffers
+        """
+        self.max_size = max(MIN_RELAY_BUFFER_SIZE, max_size)
+        self.adaptive = adaptive
+        self._allocate(MIN_RELAY_BUFFER_SIZE if adaptive else self.max_size)
+
+    def _allocate(self, size: int):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+
+    @property
+    def size(self) -> int:
+        return len(self.buffer)
+
+    def filled(self, nbytes: int):
+        """
+        Register that a read returned ``nbytes`` so the buffer can grow. Must not be called while a view of the
+        buffer is still in use.
+        """
+        if self.adaptive and nbytes >= self.size and self.size < self.max_size:
+            self._allocate(min(self.size * 2, self.max_size))
+
+
+class _Direction:
+    def __init__(self, reader, writer, buffer: RelayBuffer):
+        """
+        One direction of a relay, data read from ``reader`` waiting to be written to ``writer``
+        """
+        self.reader = reader
+        self.writer = writer
+        self.buffer = buffer
+        self.pending: deque = deque()
+        self.pending_bytes = 0
+        self.eof = False
+        self.shutdown = False
+        # monotonic time until which the reader is left alone because the relay is over its bandwidth
+        self.resume_at = 0.0
+
+    def queue(self, data):
+        if len(data):
+            self.pending.append(data)
+            self.pending_bytes += len(data)
+
+
+class ChannelRelay:
+    def __init__(self, chan, sock: socket.socket, logger: logging.Logger,
+                 buffer_size: int = DEFAULT_RELAY_BUFFER_SIZE, adaptive_buffer: bool = True, on_close=None,
+                 initial_data: bytes = b"", shaper=None, timeouts: ChannelTimeouts = None):
+        """
+        Data relayed between an SSH channel and the socket connected to the recipient of the tunnel.
+
+        Both ends are used without blocking. Data that can't be written right away is queued for its direction and
+        nothing more is read from that direction until the queue is below ``buffer_size``, so a slow reader slows
+        down the writer instead of growing buffers. EOF on one end is forwarded as a half-close to the other one and
+        the relay is done when both directions reached EOF.
+
+        :param chan: Channel opened by the server for a forwarded connection
+        :param sock: Socket connected to the recipient
+        :param logger: Logger of the tunnel
+        :param buffer_size: Size of the buffers used to read from each side
+        :param adaptive_buffer: Grow the buffers from a small size up to ``buffer_size`` as the traffic requires it
+        :param on_close: Called once when the relay is closed
+        :param initial_data: Data already read from the channel, sent to the recipient first
+        :param shaper: ``ChannelShaper`` that limits the bandwidth and sets the priority of the relay, if any
+        :param timeouts: Idle and lifetime timeouts after which the engine closes the relay, if any
+        """
+        self.chan = chan
+        self.sock = sock
+        self.logger = logger
+        self.on_close = on_close
+        self.shaper = shaper
+        self.timeouts = timeouts if timeouts and timeouts.enabled else None
+        self.created_at = self.last_activity = time.monotonic()
+        self.reap_reason: str | None = None
+        self.closed = False
+        self.chan.settimeout(0.0)
+        self.sock.setblocking(False)
+        # data read from the socket is received straight into a reusable buffer. Paramiko channels don't support
+        # recv_into, so for them the buffer only sets how much is read at once
+        self.to_chan = _Direction(sock, chan, RelayBuffer(buffer_size, adaptive_buffer))
+        self.to_sock = _Direction(chan, sock, RelayBuffer(buffer_size, adaptive_buffer))
+        self.to_sock.queue(initial_data)
+
+    @property
+    def done(self) -> bool:
+        # once the channel is closed there is nobody left to receive what the recipient sends
+        return self.closed or (self.to_sock.shutdown and (self.to_chan.shutdown or self.chan.closed))
+
+    def wants_read(self, source, now: float = None) -> bool:
+        direction = self.to_chan if source is self.sock else self.to_sock
+        if self.shaper and direction.resume_at > (time.monotonic() if now is None else now):
+            return False
+        return not direction.eof and direction.pending_bytes < direction.buffer.max_size
+
+    def throttle_delay(self, now: float = None) -> float | None:
+        """
+        Seconds until a direction held back by the shaper can be read again, None if none is held back
+
+        :param now: Monotonic time to compare with, the same one given to ``wants_read`` so both agree on which
+            directions are held back
+        """
+        if not self.shaper:
+            return None
+        if now is None:
+            now = time.monotonic()
+        waiting = [each.resume_at - now for each in (self.to_chan, self.to_sock) if each.resume_at > now]
+        return min(waiting) if waiting else None
+
+    def wait_timeout(self) -> float | None:
+        """
+        Seconds that an engine can wait for the ends of the relay before it has to look at it again, None for no limit
+        """
+        delays = [self.throttle_delay()]
+        if self.timeouts:
+            delays.append(max(0.0, self.timeouts.deadline(self.created_at, self.last_activity) - time.monotonic()))
+        delays = [each for each in delays if each is not None]
+        return min(delays) if delays else None
+
+    def reap_if_expired(self) -> bool:
+        """
+        Check the timeouts of the relay, the engine has to close it when they expired
+        """
+        if not self.timeouts:
+            return False
+        self.reap_reason = self.timeouts.expired(self.created_at, self.last_activity, time.monotonic())
+        return self.reap_reason is not None
+
+    @property
+    def wants_sock_write(self) -> bool:
+        return self.to_sock.pending_bytes > 0
+
+    @property
+    def wants_chan_write(self) -> bool:
+        """
+        Data is waiting for the SSH window of the channel. Channels can't be polled for writing, so the engines retry
+        ``flush`` periodically while this is true.
+        """
+        return self.to_chan.pending_bytes > 0
+
+    def _send(self, direction: _Direction, data) -> int:
+        if direction.writer is self.sock:
+            try:
+                return self.sock.send(data)
+            except BlockingIOError:
+                return 0
+        if self.chan.closed:
+            raise ConnectionAbortedError("Channel from %r closed while sending data" % (self.chan.origin_addr,))
+        try:
+            sent = self.chan.send(data)
+        except (socket.timeout, BlockingIOError):
+            return 0
+        if sent == 0:
+            raise ConnectionAbortedError("Channel from %r closed while sending data" % (self.chan.origin_addr,))
+        return sent
+
+    def _shutdown_write(self, direction: _Direction):
+        direction.shutdown = True
+        if direction.writer is self.sock:
+            with contextlib.suppress(OSError):
+                self.sock.shutdown(socket.SHUT_WR)
+        else:
+            self.chan.shutdown_write()
+
+    def _send_all(self, direction: _Direction, data) -> int:
+        """
+        Write ``data`` until the other end stops accepting it. Channels take at most one packet per send, so a short
+        write doesn't mean that the channel is full.
+
+        :return: How much of ``data`` was written
+        """
+        view = memoryview(data)
+        total = 0
+        while total < len(view):
+            sent = self._send(direction, view[total:])
+            if sent == 0:
+                break
+            total += sent
+        return total
+
+    def _flush(self, direction: _Direction):
+        while direction.pending:
+            data = direction.pending[0]
+            sent = self._send_all(direction, data)
+            direction.pending_bytes -= sent
+            if sent < len(data):
+                direction.pending[0] = memoryview(data)[sent:]
+                return
+            direction.pending.popleft()
+        if direction.eof and not direction.shutdown:
+            self._shutdown_write(direction)
+
+    def flush(self):
+        """
+        Write as much queued data as the other ends accept
+        """
+        self._flush(self.to_chan)
+        self._flush(self.to_sock)
+
+    def on_readable(self, source):
+        """
+        Forward the data available in ``source`` to the other end of the relay, queueing what can't be written yet
+        """
+        direction = self.to_chan if source is self.sock else self.to_sock
+        buffer = direction.buffer
+        size = buffer.size
+        if self.shaper:
+            delay = self.shaper.delay(source is self.sock)
+            if delay:
+                if not direction.resume_at:
+                    self.shaper.held_back()
+                direction.resume_at = time.monotonic() + delay
+                return
+            direction.resume_at = 0.0
+            allowance = self.shaper.allowance()
+            if allowance is not None:
+                size = max(1, min(size, allowance))
+        if source is self.sock:
+            try:
+                nbytes = self.sock.recv_into(buffer.view[:size])
+            except BlockingIOError:
+                return
+            data = buffer.view[:nbytes]
+        else:
+            try:
+                data = self.chan.recv(size)
+            except (socket.timeout, BlockingIOError):
+                return
+            nbytes = len(data)
+
+        if nbytes == 0:
+            direction.eof = True
+            self._flush(direction)
+            return
+        if self.shaper:
+            self.shaper.consumed(nbytes)
+        if self.timeouts:
+            self.last_activity = time.monotonic()
+
+        sent = 0 if direction.pending else self._send_all(direction, data)
+        if sent < nbytes:
+            # the buffer is reused by the next read, so what is left has to be copied
+            direction.queue(bytes(data[sent:]) if source is self.sock else memoryview(data)[sent:])
+        buffer.filled(nbytes)
+
+    def wait_chan_writable(self, timeout: float):
+        """
+        Block up to ``timeout`` seconds for the SSH window of the channel to open and write the queued data. Only for
+        engines that own a thread per relay.
+        """
+        self.chan.settimeout(timeout)
+        try:
+            self._flush(self.to_chan)
+        finally:
+            self.chan.settimeout(0.0)
+
+    def on_writable(self, target):
+        self._flush(self.to_sock if target is self.sock else self.to_chan)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.chan.close()
+        self.sock.close()
+        self.logger.debug("Connector closed from %r", self.chan.origin_addr)
+        if self.reap_reason:
+            self.timeouts.reaped(self.reap_reason)
+            self.logger.info("Closed connection from %r, %s timeout expired", self.chan.origin_addr, self.reap_reason)
+        if self.on_close:
+            self.on_close()
+
+
+class ThreadRelayEngine:
+    """
+    Relays every channel from its own thread. Each thread runs a ``select`` loop over the channel and its socket.
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+    def start(self):
+        pass
+
+    def submit(self, fn, *args):
+        thr = threading.Thread(target=fn, args=args, daemon=True)
+        thr.start()
+
+    def relay(self, relay: ChannelRelay):
+        try:
+            while not relay.done:
+                if relay.reap_if_expired():
+                    break
+                readers = [each for each in (relay.sock, relay.chan) if relay.wants_read(each)]
+                writers = [relay.sock] if relay.wants_sock_write else []
+                if relay.wants_chan_write:
+                    # channels can't be polled for writing, so unless the other ends have something to do block on
+                    # the channel. select doesn't accept empty lists on every platform
+                    r, w = [], []
+                    if readers or writers:
+                        r, w, x = select.select(readers, writers, [], 0)
+                    if not r and not w:
+                        relay.wait_chan_writable(CHANNEL_WRITE_WAIT)
+                        continue
+                else:
+                    delay = relay.wait_timeout()
+                    if not readers and not writers:
+                        # everything is held back by the shaper
+                        time.sleep(delay or 0)
+                        continue
+                    r, w, x = select.select(readers, writers, [], delay)
+                for each in r:
+                    relay.on_readable(each)
+                if w:
+                    relay.on_writable(relay.sock)
+        except ConnectionError as e:
+            self.logger.debug(e)
+        except Exception as e:
+            self.logger.exception(e)
+        finally:
+            relay.close()
+
+    def stop(self):
+        pass
+
+
+class _SelectorLoop(threading.Thread):
+    def __init__(self, name: str, logger: logging.Logger):
+        super().__init__(name=name, daemon=True)
+        self.logger = logger
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+        self.incoming: list[ChannelRelay] = []
+        self.relays: set[ChannelRelay] = set()
+        # relays with data waiting for the SSH window of their channel
+        self.chan_writers: set[ChannelRelay] = set()
+        # relays with a direction held back by their shaper
+        self.throttled: set[ChannelRelay] = set()
+        # relays with idle or lifetime timeouts, checked every REAP_INTERVAL seconds
+        self.expiring: set[ChannelRelay] = set()
+        self.next_reap = 0.0
+        self.running = True
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+
+    def add(self, relay: ChannelRelay):
+        with self.lock:
+            running = self.running
+            if running:
+                self.incoming.append(relay)
+        if not running:
+            # the loop already stopped and won't relay it
+            relay.close()
+            return
+        self._wakeup()
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+        self._wakeup()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            # the loop is already going to wake up
+            pass
+
+    def _register_incoming(self):
+        with self.lock:
+            incoming, self.incoming = self.incoming, []
+        for relay in incoming:
+            self.relays.add(relay)
+            if relay.timeouts:
+                self.expiring.add(relay)
+            self._update(relay)
+
+    def _set_events(self, fileobj, events, relay):
+        try:
+            current = self.selector.get_key(fileobj).events
+        except KeyError:
+            current = 0
+        if current == events:
+            return
+        if not events:
+            self.selector.unregister(fileobj)
+        elif not current:
+            self.selector.register(fileobj, events, relay)
+        else:
+            self.selector.modify(fileobj, events, relay)
+
+    def _update(self, relay: ChannelRelay):
+        """
+        Register for the events the relay is able to handle now, stop listening to the ends that are backed up
+        """
+        try:
+            if relay.done:
+                self._discard(relay)
+                return
+            # a direction held back by the shaper is either listened to or throttled, never neither
+            now = time.monotonic()
+            sock_events = selectors.EVENT_READ if relay.wants_read(relay.sock, now) else 0
+            if relay.wants_sock_write:
+                sock_events |= selectors.EVENT_WRITE
+            self._set_events(relay.sock, sock_events, relay)
+            self._set_events(relay.chan, selectors.EVENT_READ if relay.wants_read(relay.chan, now) else 0, relay)
+            if relay.wants_chan_write:
+                self.chan_writers.add(relay)
+            else:
+                self.chan_writers.discard(relay)
+            if relay.throttle_delay(now) is not None:
+                self.throttled.add(relay)
+            else:
+                self.throttled.discard(relay)
+        except Exception as e:
+            self.logger.exception("Failed to register connection in the relay loop: %r", e)
+            self._discard(relay)
+
+    def _discard(self, relay: ChannelRelay):
+        for each in (relay.sock, relay.chan):
+            try:
+                self.selector.unregister(each)
+            except (KeyError, ValueError):
+                pass
+        self.relays.discard(relay)
+        self.chan_writers.discard(relay)
+        self.throttled.discard(relay)
+        self.expiring.discard(relay)
+        relay.close()
+
+    def _handle(self, relay: ChannelRelay, fn, *args):
+        try:
+            fn(*args)
+        except ConnectionError as e:
+            self.logger.debug(e)
+            self._discard(relay)
+            return
+        except Exception as e:
+            self.logger.exception(e)
+            self._discard(relay)
+            return
+        self._update(relay)
+
+    def run(self):
+        try:
+            while self.running:
+                timeout = CHANNEL_WRITE_RETRY if self.chan_writers else None
+                if self.throttled:
+                    delay = min((each.throttle_delay() or 0.0) for each in self.throttled)
+                    timeout = delay if timeout is None else min(timeout, delay)
+                if self.expiring:
+                    timeout = REAP_INTERVAL if timeout is None else min(timeout, REAP_INTERVAL)
+                for key, mask in self.selector.select(timeout):
+                    if key.data is None:
+                        try:
+                            while self._wakeup_r.recv(4096):
+                                pass
+                        except BlockingIOError:
+                            pass
+                        self._register_incoming()
+                        continue
+                    relay = key.data
+                    if relay.closed:
+                        continue
+                    if mask & selectors.EVENT_WRITE:
+                        self._handle(relay, relay.on_writable, key.fileobj)
+                    if mask & selectors.EVENT_READ and not relay.closed:
+                        self._handle(relay, relay.on_readable, key.fileobj)
+                for relay in list(self.chan_writers):
+                    if not relay.closed:
+                        self._handle(relay, relay.on_writable, relay.chan)
+                for relay in list(self.throttled):
+                    if not relay.closed and not relay.throttle_delay():
+                        self._update(relay)
+                if self.expiring and time.monotonic() >= self.next_reap:
+                    self.next_reap = time.monotonic() + REAP_INTERVAL
+                    for relay in list(self.expiring):
+                        if relay.reap_if_expired():
+                            self._discard(relay)
+        finally:
+            for relay in list(self.relays):
+                self._discard(relay)
+            with self.lock:
+                incoming, self.incoming = self.incoming, []
+            for relay in incoming:
+                relay.close()
+            self.selector.close()
+            self._wakeup_r.close()
+            self._wakeup_w.close()
+
+
+class SelectorRelayEngine:
+    """
+    Relays every channel of a tunnel from a small fixed set of ``selectors`` loops instead of a thread per channel.
+    Connecting to the recipient still blocks, so it is done by a bounded pool of workers before handing the
+    connection over to a loop.
+    """
+
+    def __init__(self, logger: logging.Logger, loops: int = DEFAULT_RELAY_LOOPS,
+                 connect_workers: int = DEFAULT_CONNECT_WORKERS):
+        self.logger = logger
+        self.loops_count = max(1, loops)
+        self.connect_workers = max(1, connect_workers)
+        self.loops: list[_SelectorLoop] = []
+        self.pool: ThreadPoolExecutor | None = None
+        self._next_loop = 0
+
+    def start(self):
+        self.pool = ThreadPoolExecutor(self.connect_workers, thread_name_prefix="relay-connect")
+        self.loops = [_SelectorLoop(f"relay-loop-{i}", self.logger) for i in range(self.loops_count)]
+        for each in self.loops:
+            each.start()
+
+    def submit(self, fn, *args):
+        """
+        :raises RelayEngineStopped: if the engine was stopped
+        """
+        pool = self.pool
+        if pool is None:
+            raise RelayEngineStopped("The relay engine is stopped")
+        try:
+            pool.submit(fn, *args)
+        except RuntimeError as e:
+            # stopped while submitting
+            raise RelayEngineStopped("The relay engine is stopped") from e
+
+    def relay(self, relay: ChannelRelay):
+        """
+        Relay the channel from one of the loops, or close it if the engine was stopped
+        """
+        loops = self.loops
+        if not loops:
+            self.logger.debug("Closing connection from %r, the relay engine is stopped", relay.chan.origin_addr)
+            relay.close()
+            return
+        loop = loops[self._next_loop % len(loops)]
+        self._next_loop += 1
+        loop.add(relay)
+
+    def stop(self):
+        for each in self.loops:
+            each.stop()
+        self.loops = []
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+
+def create_relay_engine(engine: str, logger: logging.Logger, loops: int = DEFAULT_RELAY_LOOPS):
+    if engine == RELAY_ENGINE_THREADS:
+        return ThreadRelayEngine(logger)
+    if engine == RELAY_ENGINE_SELECTOR:
+        return SelectorRelayEngine(logger, loops=loops)
+    raise ValueError("Relay engine can only be %s but '%s' was received" % (" or ".join(RELAY_ENGINES), engine))
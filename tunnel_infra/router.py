@@ -0,0 +1,205 @@
+import socket
+import threading
+from concurrent.futures.thread import ThreadPoolExecutor
+from logging import Logger
+
+from tunnel_infra.balancer import RecipientBalancer
+
+DEFAULT_SNIFF_TIMEOUT = 5
+# channels routed at the same time, each one can wait up to sniff_timeout for its client
+DEFAULT_SNIFF_WORKERS = 32
+# a ClientHello or the headers of an HTTP request are expected to fit in it
+SNIFF_MAX_BYTES = 16 * 1024
+
+HTTP_METHODS = (b"GET", b"POST", b"PUT", b"HEAD", b"DELETE", b"OPTIONS", b"PATCH", b"CONNECT", b"TRACE")
+
+TLS_HANDSHAKE = 0x16
+TLS_CLIENT_HELLO = 0x01
+TLS_EXTENSION_SERVER_NAME = 0x0000
+TLS_SERVER_NAME_HOST = 0x00
+
+
+class NeedMoreData(Exception):
+    pass
+
+
+def _tls_server_name(data: bytes) -> str | None:
+    """
+    Server name (SNI) of the TLS ClientHello at the start of ``data``, only the first TLS record is read
+
+    :raises NeedMoreData: if the ClientHello isn't complete
+    :raises IndexError: if it's malformed
+    """
+    if len(data) < 5:
+        raise NeedMoreData()
+    end = 5 + int.from_bytes(data[3:5], "big")
+    if len(data) < end:
+        raise NeedMoreData()
+    if data[5] != TLS_CLIENT_HELLO:
+        return None
+    # handshake type and length, client version and random
+    pos = 5 + 4 + 2 + 32
+    # session id, cipher suites and compression methods
+    pos += 1 + data[pos]
+    pos += 2 + int.from_bytes(data[pos:pos + 2], "big")
+    pos += 1 + data[pos]
+    extensions_end = min(end, pos + 2 + int.from_bytes(data[pos:pos + 2], "big"))
+    pos += 2
+    while pos + 4 <= extensions_end:
+        extension_type = int.from_bytes(data[pos:pos + 2], "big")
+        extension_end = pos + 4 + int.from_bytes(data[pos + 2:pos + 4], "big")
+        if extension_type == TLS_EXTENSION_SERVER_NAME:
+            # server name list length, then entries of type, length and name
+            pos += 6
+            while pos + 3 <= extension_end:
+                name_type = data[pos]
+                name_end = pos + 3 + int.from_bytes(data[pos + 1:pos + 3], "big")
+                if name_type == TLS_SERVER_NAME_HOST:
+                    return data[pos + 3:name_end].decode("ascii")
+                pos = name_end
+            return None
+        pos = extension_end
+    return None
+
+
+def _http_host(data: bytes) -> str | None:
+    """
+    Host header of the HTTP/1 request at the start of ``data``
+
+    :raises NeedMoreData: if the headers aren't complete and the Host header hasn't been found yet
+    """
+    lines = data.split(b"\r\n")
+    # the last element isn't a complete line
+    for line in lines[1:-1]:
+        if not line:
+            return None
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"host":
+            host = value.strip().decode("ascii")
+            if host.startswith("["):
+                return host[1:].partition("]")[0]
+            return host.rpartition(":")[0] if ":" in host else host
+    raise NeedMoreData()
+
+
+def sniff_host(data: bytes) -> str | None:
+    """
+    Host name requested by the first bytes of a connection: the SNI of a TLS ClientHello or the Host header of an
+    HTTP/1 request
+
+    :return: The host name in lower case, or None if the connection doesn't start with any of them
+    :raises NeedMoreData: if more data is needed to decide
+    """
+    if not data:
+        raise NeedMoreData()
+    if data[0] == TLS_HANDSHAKE:
+        try:
+            host = _tls_server_name(data)
+        except (IndexError, UnicodeDecodeError):
+            return None
+    else:
+        method = data.split(b" ", 1)[0]
+        if b" " not in data:
+            if any(each.startswith(method) for each in HTTP_METHODS) and len(data) <= max(map(len, HTTP_METHODS)):
+                raise NeedMoreData()
+            return None
+        if method not in HTTP_METHODS:
+            return None
+        try:
+            host = _http_host(data)
+        except UnicodeDecodeError:
+            return None
+    return host.lower().rstrip(".") if host else None
+
+
+class Router:
+    def __init__(self, routes: dict[str, RecipientBalancer], default: RecipientBalancer, logger: Logger,
+                 sniff_timeout: float = DEFAULT_SNIFF_TIMEOUT, sniff_workers: int = DEFAULT_SNIFF_WORKERS):
+        """
+        Choose the recipients of each channel by the host name it asks for, see ``sniff_host``. Only for protocols
+        where the client speaks first, a channel that sends nothing for ``sniff_timeout`` seconds goes to the default
+        recipients.
+
+        Reading the first bytes waits for the client, so channels are routed by workers of the router, see
+        ``submit``, and clients that send nothing don't hold the workers that connect to the recipients.
+
+        :param routes: Recipients by host name. ``*.example.com`` matches any subdomain of example.com
+        :param default: Recipients of the channels that don't match any route
+        :param sniff_workers: Channels routed at the same time
+        """
+        self.routes = {pattern.lower().rstrip("."): balancer for pattern, balancer in routes.items()}
+        self.default = default
+        self.logger = logger
+        self.sniff_timeout = sniff_timeout
+        self.sniff_workers = max(1, sniff_workers)
+        self.pool: ThreadPoolExecutor | None = None
+        # longest suffixes first, so the most specific wildcard wins
+        self.wildcards = sorted((pattern[1:] for pattern in self.routes if pattern.startswith("*.")),
+                                key=len, reverse=True)
+        self.lock = threading.Lock()
+        self.routed = 0
+        self.unmatched = 0
+
+    def start(self):
+        for each in self.routes.values():
+            each.start()
+
+    def submit(self, fn, *args):
+        """
+        Call ``fn`` from a worker of the router, to route a channel with ``route``
+        """
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(self.sniff_workers, thread_name_prefix="router")
+        self.pool.submit(fn, *args)
+
+    def match(self, host: str | None) -> RecipientBalancer | None:
+        if host is None:
+            return None
+        balancer = self.routes.get(host)
+        if balancer is not None:
+            return balancer
+        for suffix in self.wildcards:
+            if host.endswith(suffix):
+                return self.routes["*" + suffix]
+        return None
+
+    def route(self, chan) -> tuple[bytes, RecipientBalancer]:
+        """
+        Read the first bytes of the channel to choose its recipients
+
+        :return: The data read, that has to be sent to the recipient first, and the recipients of the channel
+        """
+        data = b""
+        host = None
+        chan.settimeout(self.sniff_timeout)
+        try:
+            while True:
+                try:
+                    host = sniff_host(data)
+                    break
+                except NeedMoreData:
+                    if len(data) >= SNIFF_MAX_BYTES:
+                        break
+                received = chan.recv(SNIFF_MAX_BYTES - len(data))
+                if not received:
+                    break
+                data += received
+        except socket.timeout:
+            self.logger.debug("Connection from %r sent nothing to route it by", chan.origin_addr)
+        balancer = self.match(host)
+        with self.lock:
+            if balancer is None:
+                self.unmatched += 1
+            else:
+                self.routed += 1
+        if balancer is None:
+            return data, self.default
+        self.logger.debug("Routing connection from %r for %s", chan.origin_addr, host)
+        return data, balancer
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = {'routed': self.routed, 'unmatched': self.unmatched}
+        stats['routes'] = {pattern: balancer.stats() for pattern, balancer in self.routes.items()}
+        return stats
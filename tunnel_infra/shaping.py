@@ -0,0 +1,120 @@
+import threading
+import time
+
+from lib import TokenBucket
+
+PRIORITY_HIGH = "high"
+PRIORITY_NORMAL = "normal"
+PRIORITY_LOW = "low"
+PRIORITIES = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
+
+# a class is active while one of its channels relayed data in the last PRIORITY_WINDOW seconds
+PRIORITY_WINDOW = 0.2
+# while a higher class is active, channels of lower classes read from their recipients at most once per
+# PRIORITY_DEFER seconds, so they slow down instead of stopping
+PRIORITY_DEFER = 0.02
+# a channel over its bandwidth waits until it can read at least this many bytes, instead of reading tiny chunks
+MIN_SHAPED_READ = 4096
+
+
+class PriorityGate:
+    def __init__(self):
+        """
+        Priority of the channels relayed by the current process, which share its SSH transports
+        """
+        self.last_active = {each: 0.0 for each in PRIORITIES}
+
+    def mark(self, priority: str):
+        self.last_active[priority] = time.monotonic()
+
+    def deferral(self, priority: str) -> float:
+        """
+        Seconds that a channel of ``priority`` has to wait before writing into the transport again
+        """
+        now = time.monotonic()
+        for each in PRIORITIES:
+            if each == priority:
+                return 0.0
+            if now - self.last_active[each] < PRIORITY_WINDOW:
+                return PRIORITY_DEFER
+        return 0.0
+
+
+priority_gate = PriorityGate()
+
+
+class ChannelShaper:
+    def __init__(self, buckets: list[TokenBucket], priority: str, connector: 'BandwidthShaper'):
+        """
+        Bandwidth of one channel, see ``BandwidthShaper``
+        """
+        self.buckets = buckets
+        self.priority = priority
+        self.connector = connector
+
+    def allowance(self) -> int | None:
+        """
+        Bytes that can be relayed now, None if there's no limit
+        """
+        if not self.buckets:
+            return None
+        return max(0, int(min(each.available() for each in self.buckets)))
+
+    def delay(self, to_chan: bool) -> float:
+        """
+        Seconds to wait before reading again
+
+        :param to_chan: The data read is written into the SSH transport, so the priority of the channel applies
+        """
+        delay = max((each.delay(min(MIN_SHAPED_READ, each.capacity)) for each in self.buckets), default=0.0)
+        if to_chan:
+            delay = max(delay, priority_gate.deferral(self.priority))
+        return delay
+
+    def held_back(self):
+        """
+        A read was delayed, counted once however many times the delay is checked until the channel reads again
+        """
+        with self.connector.lock:
+            self.connector.throttled += 1
+
+    def consumed(self, nbytes: int):
+        for each in self.buckets:
+            each.take(nbytes)
+        with self.connector.lock:
+            self.connector.bytes += nbytes
+        priority_gate.mark(self.priority)
+
+
+class BandwidthShaper:
+    def __init__(self, rate: float = 0, channel_rate: float = 0, priority: str = PRIORITY_NORMAL):
+        """
+        Bandwidth of the channels of a connector. Both directions count against the limits, and a channel that is
+        over them stops reading until the buckets refill.
+
+        :param rate: Bytes per second relayed by all the channels of the connector, 0 for no limit
+        :param channel_rate: Bytes per second relayed by each channel, 0 for no limit
+        :param priority: ``high``, ``normal`` or ``low``. Channels slow down writing into the SSH transport while
+            channels of a higher class of the same process are busy
+        """
+        self.rate = rate
+        self.channel_rate = channel_rate
+        self.priority = priority
+        self.bucket = TokenBucket(rate) if rate else None
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.throttled = 0
+
+    def channel(self) -> ChannelShaper:
+        buckets = [self.bucket] if self.bucket else []
+        if self.channel_rate:
+            buckets.append(TokenBucket(self.channel_rate))
+        return ChannelShaper(buckets, self.priority, self)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'priority': self.priority,
+                'bytes': self.bytes,
+                'throttled': self.throttled,
+            }
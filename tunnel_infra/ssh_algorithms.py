@@ -0,0 +1,37 @@
+import paramiko
+
+# ini option -> (security option of the transport, algorithms supported by paramiko)
+ALGORITHM_OPTIONS = {
+    'ciphers': ('ciphers', paramiko.Transport._cipher_info),
+    'macs': ('digests', paramiko.Transport._mac_info),
+    'kex': ('kex', paramiko.Transport._kex_info),
+}
+
+
+def parse_algorithms(option: str, value: str | None) -> tuple[str, ...] | None:
+    """
+    Parse a comma separated list of algorithms from the ``option`` of a connector config, in preference order
+
+    :return: The algorithms or None to use the paramiko defaults
+    """
+    if not value:
+        return None
+    algorithms = tuple(each.strip() for each in value.split(",") if each.strip())
+    supported = ALGORITHM_OPTIONS[option][1]
+    unknown = [each for each in algorithms if each not in supported]
+    if unknown:
+        raise ValueError("%s can only contain %s but '%s' was received" % (option, ", ".join(supported),
+                                                                          ", ".join(unknown)))
+    return algorithms or None
+
+
+def apply_algorithms(transport: paramiko.Transport, **algorithms):
+    """
+    Set the preferred algorithms of a transport before it negotiates them with the server
+
+    :param algorithms: Algorithms by ini option, see ``ALGORITHM_OPTIONS``. Options set to None keep the defaults
+    """
+    security_options = transport.get_security_options()
+    for option, value in algorithms.items():
+        if value:
+            setattr(security_options, ALGORITHM_OPTIONS[option][0], value)
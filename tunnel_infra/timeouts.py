@@ -0,0 +1,71 @@
+import threading
+
+from tunnel_infra.recipient_pool import RECIPIENT_CONNECT_TIMEOUT
+
+REAPED_IDLE = "idle"
+REAPED_LIFETIME = "lifetime"
+# seconds between checks of the relays of a selector loop for expired ones
+REAP_INTERVAL = 1
+
+
+class ChannelTimeouts:
+    def __init__(self, idle_timeout: float = 0, max_lifetime: float = 0,
+                 connect_timeout: float = RECIPIENT_CONNECT_TIMEOUT):
+        """
+        Timeouts of the channels of a connector, enforced by the relay engines, and how many channels they closed
+
+        :param idle_timeout: Seconds without data in either direction after which a channel is closed, 0 for never
+        :param max_lifetime: Seconds after which a channel is closed even if it's busy, 0 for never
+        :param connect_timeout: Seconds to connect to a recipient
+        """
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.connect_timeout = connect_timeout
+        self.lock = threading.Lock()
+        self.reaped_idle = 0
+        self.reaped_lifetime = 0
+        self.connect_timeouts = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.idle_timeout or self.max_lifetime)
+
+    def expired(self, created_at: float, last_activity: float, now: float) -> str | None:
+        """
+        :return: Why a channel with these times has to be closed, None if it doesn't
+        """
+        if self.max_lifetime and now - created_at >= self.max_lifetime:
+            return REAPED_LIFETIME
+        if self.idle_timeout and now - last_activity >= self.idle_timeout:
+            return REAPED_IDLE
+        return None
+
+    def deadline(self, created_at: float, last_activity: float) -> float | None:
+        """
+        Monotonic time when a channel with these times expires if it stays idle, None if it never does
+        """
+        deadlines = []
+        if self.max_lifetime:
+            deadlines.append(created_at + self.max_lifetime)
+        if self.idle_timeout:
+            deadlines.append(last_activity + self.idle_timeout)
+        return min(deadlines) if deadlines else None
+
+    def reaped(self, reason: str):
+        with self.lock:
+            if reason == REAPED_IDLE:
+                self.reaped_idle += 1
+            else:
+                self.reaped_lifetime += 1
+
+    def connect_timed_out(self):
+        with self.lock:
+            self.connect_timeouts += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'reaped_idle': self.reaped_idle,
+                'reaped_lifetime': self.reaped_lifetime,
+                'connect_timeouts': self.connect_timeouts,
+            }
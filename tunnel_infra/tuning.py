@@ -0,0 +1,130 @@
+import socket
+from logging import Logger
+
+import paramiko
+from paramiko.common import (DEFAULT_WINDOW_SIZE, DEFAULT_MAX_PACKET_SIZE, MIN_WINDOW_SIZE, MAX_WINDOW_SIZE,
+                             MIN_PACKET_SIZE)
+
+# 100 Mbit/s, bandwidth assumed by the auto-tuning when the connector doesn't say it
+DEFAULT_LINK_BANDWIDTH = 12_500_000
+RTT_PROBES = 3
+RTT_PROBE_TIMEOUT = 5
+# the window has to cover the data in flight while the window adjustments travel back, so twice the BDP
+WINDOW_BDP_FACTOR = 2
+MAX_TUNED_WINDOW_SIZE = 64 * 1024 * 1024
+MIN_TUNED_SOCKET_BUFFER_SIZE = 64 * 1024
+MAX_TUNED_SOCKET_BUFFER_SIZE = 16 * 1024 * 1024
+
+
+class SocketOptions:
+    def __init__(self, nodelay: bool = False, keepalive: bool = False, buffer_size: int = 0):
+        """
+        Options of the TCP sockets of a connector
+
+        :param nodelay: Disable Nagle's algorithm, so small writes are sent right away
+        :param keepalive: Let the OS detect dead peers of idle connections
+        :param buffer_size: Send and receive buffer size in bytes, 0 for the OS default
+        """
+        self.nodelay = nodelay
+        self.keepalive = keepalive
+        self.buffer_size = buffer_size
+
+    def apply(self, sock: socket.socket):
+        if self.nodelay:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.keepalive:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if self.buffer_size:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.buffer_size)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.buffer_size)
+
+
+def measure_rtt(transport, probes: int = RTT_PROBES) -> float | None:
+    """
+    Round trip time to the server through ``transport``, a ``ProbedTransport``. The fastest of ``probes`` probes, so
+    a probe queued behind data doesn't count.
+
+    :return: Seconds or None if the server didn't answer
+    """
+    times = [rtt for rtt in (transport.round_trip_time(RTT_PROBE_TIMEOUT) for _ in range(probes)) if rtt is not None]
+    return min(times) if times else None
+
+
+def bandwidth_delay_product(bandwidth: float, rtt: float) -> int:
+    """
+    Bytes in flight needed to use ``bandwidth`` bytes per second over a link with ``rtt`` seconds of round trip
+    """
+    return int(bandwidth * rtt)
+
+
+def check_ssh_sizes(window_size: int, max_packet_size: int):
+    """
+    :raises ValueError: If the SSH window or packet size can't be used
+    """
+    if window_size <= 0:
+        raise ValueError("ssh_window_size must be positive but %d was received" % window_size)
+    if max_packet_size <= 0:
+        raise ValueError("ssh_max_packet_size must be positive but %d was received" % max_packet_size)
+    if max_packet_size > window_size:
+        raise ValueError("ssh_max_packet_size can't be larger than ssh_window_size but %d and %d were received"
+                         % (max_packet_size, window_size))
+
+
+class TransportTuning:
+    def __init__(self, logger: Logger, window_size: int = DEFAULT_WINDOW_SIZE,
+                 max_packet_size: int = DEFAULT_MAX_PACKET_SIZE, auto_tune: bool = False,
+                 link_bandwidth: float = DEFAULT_LINK_BANDWIDTH, socket_options: SocketOptions = None):
+        """
+        Window and packet size of the channels that the server opens to the connector.
+
+        The window limits the data that the server sends before waiting for the connector to acknowledge it, so a
+        window below the bandwidth-delay product of the link caps the throughput of each channel. With ``auto_tune``
+        the round trip time is measured after connecting and the window, and the socket buffers when
+        ``socket_options`` don't set them, grow to fit ``link_bandwidth``.
+
+        :param socket_options: Options of the sockets of the connector, their buffer size is tuned as well
+        :raises ValueError: If the window or the packet size isn't positive or the packet doesn't fit in the window
+        """
+        check_ssh_sizes(window_size, max_packet_size)
+        self.logger = logger
+        self.window_size = window_size
+        self.max_packet_size = max_packet_size
+        self.auto_tune = auto_tune
+        self.link_bandwidth = link_bandwidth
+        self.socket_options = socket_options or SocketOptions()
+        self.explicit_buffer_size = bool(self.socket_options.buffer_size)
+        self.rtt: float | None = None
+        self.applied_window_size = window_size
+
+    def apply(self, transport: paramiko.Transport):
+        """
+        Tune a connected transport, before it forwards any port
+        """
+        window_size = self.window_size
+        if self.auto_tune:
+            self.rtt = measure_rtt(transport)
+            if self.rtt is not None:
+                bdp = bandwidth_delay_product(self.link_bandwidth, self.rtt)
+                window_size = max(window_size, min(WINDOW_BDP_FACTOR * bdp, MAX_TUNED_WINDOW_SIZE))
+                if not self.explicit_buffer_size:
+                    self.socket_options.buffer_size = max(MIN_TUNED_SOCKET_BUFFER_SIZE,
+                                                          min(bdp, MAX_TUNED_SOCKET_BUFFER_SIZE))
+                self.logger.info("Round trip time to the server %.1fms, window size %d bytes, socket buffers %d bytes",
+                                 self.rtt * 1000, window_size, self.socket_options.buffer_size)
+            else:
+                self.logger.warning("Failed to measure the round trip time to the server, keeping the window size")
+        # paramiko clamps them to these when it opens a channel, the stats show what is actually used
+        window_size = min(max(window_size, MIN_WINDOW_SIZE), MAX_WINDOW_SIZE)
+        max_packet_size = min(max(self.max_packet_size, MIN_PACKET_SIZE), window_size)
+        self.applied_window_size = window_size
+        transport.default_window_size = window_size
+        transport.default_max_packet_size = max_packet_size
+        if transport.sock is not None and hasattr(transport.sock, "setsockopt"):
+            self.socket_options.apply(transport.sock)
+
+    def stats(self) -> dict:
+        return {
+            'rtt': self.rtt,
+            'window_size': self.applied_window_size,
+            'socket_buffer_size': self.socket_options.buffer_size,
+        }
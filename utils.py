@@ -4,8 +4,6 @@ import sys
 import time
 from logging import Logger
 
-import psutil
-
 
 def is_app_running_as_pyinstaller_bundle():
     return getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS')
@@ -27,6 +25,8 @@ def get_net_if_mac_addresses():
     """
     :return: All the network interfaces MAC addresses
     """
+    # imported here, the connector processes don't need it
+    import psutil
     for interface, snics in psutil.net_if_addrs().items():
         for snic in snics:
             if snic.family == psutil.AF_LINK: